@@ -1,37 +1,63 @@
-from fastapi import APIRouter, Query, BackgroundTasks, Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Query, Header, Depends, HTTPException, Request, status
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 from typing import Any
 from db import (
     get_session,
-    add_aweme,
+    add_awemes,
     get_undownloaded_awemes_by_uid,
-    get_latest_create_time,
+    get_undownloaded_awemes_by_ids,
+    get_sync_watermark,
+    set_sync_watermark,
     add_or_update_user,
-    get_all_users,
+    list_users,
+    list_awemes,
+    search_awemes,
+    get_search_index_status,
+    backfill_search_index,
+    reset_search_index,
     toggle_user_auto_update,
     get_auto_update_users,
-    create_task,
-    update_task_progress,
-    get_all_active_tasks,
     get_config,
     set_config,
     update_account_password,
     update_user_preference,
+    get_user_download_prefs,
     delete_user_data,
+    get_jobs,
+    data_dir,
     User,
 )
-from fetch import fetch_all_awemes, fetch_user_profile, fetch_video_profile
+from fetch import iter_aweme_pages, get_user_profile, cache_author_profile, fetch_video_profile
 from downloader import download_video, DOWNLOAD_API
+from http_client import get_async_client, get_pool_stats
+from rate_limiter import get_limiter, get_limiter_stats, retry_after_seconds
+from resilience import call_with_retry_async, get_breaker_stats, CircuitOpenError
+from cache import get_cache_stats
+from task_registry import task_registry
+from job_queue import job_queue
+from reconcile import reconcile_downloads
+from events import event_broker, HEARTBEAT_INTERVAL
+from logtail import tail_lines, read_from, follow
+from download_engine import (
+    DownloadPipeline,
+    run_downloads,
+    get_download_workers,
+    get_platform_download_workers,
+    DOWNLOAD_PLATFORMS,
+    MAX_DOWNLOAD_WORKERS,
+)
 from auth import create_access_token, verify_password, get_password_hash, get_current_user
-from utils import extract_share_url, get_url_platform, resolve_redirect, extract_sec_user_id, sanitize_filename
+from utils import extract_share_url, get_url_platform, resolve_redirect, extract_sec_user_id, sanitize_filename, author_folder
 import re
-import httpx
+import time
 import uuid
-import io
 import os
+import json
+import httpx
 from loguru import logger
 
 router = APIRouter()
@@ -49,32 +75,28 @@ def process_single_aweme_download(session: Session, aweme: Any) -> bool:
     """
     处理单个 Aweme 的下载逻辑，包括检查偏好设置和执行下载。
     """
-    # 获取用户信息以检查偏好设置
-    from db import User
-    user = session.query(User).filter_by(uid=aweme.uid).first()
+    # 获取用户偏好与全局设定（均走进程内缓存）
+    video_override, note_override = get_user_download_prefs(session, aweme.uid)
     global_download_video = get_config(session, "download_video", "true") == "true"
     global_download_note = get_config(session, "download_note", "true") == "true"
 
     should_download = True
     if aweme.aweme_type == 68: # 图文
         # 优先级：个人覆盖 > 全局设定
-        override = user.download_note_override if user else None
-        should_download = override if override is not None else global_download_note
+        should_download = note_override if note_override is not None else global_download_note
     else: # 视频
-        override = user.download_video_override if user else None
-        should_download = override if override is not None else global_download_video
+        should_download = video_override if video_override is not None else global_download_video
 
     if not should_download:
         logger.info(f"根据设置跳过下载: {aweme.aweme_id} (Type: {aweme.aweme_type})")
         return False
 
     filename = aweme.desc if aweme.desc else aweme.aweme_id
-    type_folder = "notes" if aweme.aweme_type == 68 else "videos"
-    author_folder = os.path.join(f"{aweme.nickname}_{aweme.uid}", type_folder)
+    folder = author_folder(aweme.nickname, aweme.uid, aweme.aweme_type)
     
     try:
         success = download_video(
-            aweme.share_url, author_folder, filename, aweme.aweme_id
+            aweme.share_url, folder, filename, aweme.aweme_id
         )
         if success:
             aweme.downloaded = True
@@ -92,139 +114,208 @@ def process_single_aweme_download(session: Session, aweme: Any) -> bool:
 def sync_user_videos(session, sec_user_id: str, platform: str = "douyin", task_id: str = None):
     """
     同步指定用户的视频：拉取 Profile、增量抓取 Awemes、下载未下载的视频
+    返回本次同步的统计信息 (uid, fetched, pending, downloaded, error)
     """
     if task_id:
-        update_task_progress(session, task_id, 5, message="正在获取用户信息...")
+        task_registry.update(task_id, 5, message="正在获取用户信息...")
         
     # 尝试从数据库获取已存在的 UID，以支持增量同步
     from db import User
     user = session.query(User).filter_by(sec_user_id=sec_user_id).first()
     uid = user.uid if user else None
         
-    # 获取作者最新作品时间
-    last_create_time = get_latest_create_time(session, uid) if uid else 0
+    # 只抓取上次完整同步之后发布的作品
+    last_create_time = get_sync_watermark(session, uid) if uid else 0
     
     if task_id:
-        update_task_progress(session, task_id, 20, message="正在抓取视频列表...")
-
-    # 执行抓取
-    result = fetch_all_awemes(sec_user_id, platform=platform, latest_create_time=last_create_time, count=20)
-    new_data = result.get("awemes", [])
-    author_info = result.get("author", {})
-
-    # 如果抓取到了作者信息（特别是 TikTok），更新/初始化用户信息
-    if author_info:
-        uid = author_info.get("uid") or uid
-        add_or_update_user(session, {
-            "uid": uid,
-            "sec_user_id": sec_user_id,
-            "nickname": author_info.get("nickname"),
-            "avatar_url": author_info.get("avatar_thumb", {}).get("url_list", [None])[0] if isinstance(author_info.get("avatar_thumb"), dict) else author_info.get("avatar_thumb"),
-            "signature": author_info.get("signature"),
-            "platform": platform
-        })
-
-    if not uid:
+        task_registry.update(task_id, 20, message="正在抓取视频列表...")
+
+    def on_progress(done: int, total: int, label: str, success: bool):
+        msg = f"已处理 {done}/{total}: {label}"
+        logger.info(msg)
         if task_id:
-            update_task_progress(session, task_id, 100, status="failed", message="无法获取 UID")
-        logger.error(f"无法获取 UID: {sec_user_id}")
-        return
+            task_registry.update(task_id, 30 + int((done / total) * 60), message=msg)
+
+    fetched = 0
+    newest_create_time = last_create_time
+    author_saved = False
+    with DownloadPipeline(session, process_single_aweme_download, on_progress) as pipeline:
+        # 先把之前遗留的未下载作品交给下载线程，再边翻页边入库、边下载
+        if uid:
+            pipeline.submit(get_undownloaded_awemes_by_uid(session, uid))
+
+        for page in iter_aweme_pages(sec_user_id, platform=platform, latest_create_time=last_create_time, count=20):
+            author_info = page["author"]
+            # 如果抓取到了作者信息（特别是 TikTok），更新/初始化用户信息
+            if author_info and not author_saved:
+                uid = author_info.get("uid") or uid
+                add_or_update_user(session, {
+                    "uid": uid,
+                    "sec_user_id": sec_user_id,
+                    "nickname": author_info.get("nickname"),
+                    "avatar_url": author_info.get("avatar_thumb", {}).get("url_list", [None])[0] if isinstance(author_info.get("avatar_thumb"), dict) else author_info.get("avatar_thumb"),
+                    "signature": author_info.get("signature"),
+                    "platform": platform,
+                    "profile_fetched_at": int(time.time()),
+                })
+                cache_author_profile(sec_user_id, platform, author_info)
+                author_saved = True
+                if task_id and uid:
+                    # 更新 target_id 为 uid 以便前端展示
+                    task_registry.update(task_id, 30, message="正在处理抓取结果...", target_id=uid)
+
+            new_data = page["awemes"]
+            if not new_data:
+                continue
+            fetched += len(new_data)
+            newest_create_time = max(newest_create_time, max(item.get("create_time") or 0 for item in new_data))
+            # 为每条作品打上平台标记并批量保存，新入库的作品立即开始下载
+            for item in new_data:
+                item["platform"] = platform
+            inserted = add_awemes(session, new_data)
+            pipeline.submit(get_undownloaded_awemes_by_ids(session, inserted))
+            logger.info(f"用户 {uid} 抓取到 {len(new_data)} 个作品，新入库 {len(inserted)} 个")
+            if task_id:
+                progress = 30 + int((pipeline.done / pipeline.total) * 60) if pipeline.total else 30
+                task_registry.update(task_id, progress, message=f"已抓取 {fetched} 个作品，下载中 {pipeline.done}/{pipeline.total}...")
+
+        # 翻页中途失败会抛出异常，走到这里说明本次所有新作品都已入库，可以推进水位
+        if uid:
+            set_sync_watermark(session, uid, newest_create_time)
+
+        if not uid:
+            if task_id:
+                task_registry.update(task_id, 100, status="failed", message="无法获取 UID")
+            logger.error(f"无法获取 UID: {sec_user_id}")
+            return {"uid": None, "fetched": fetched, "pending": 0, "downloaded": 0, "error": "无法获取 UID"}
+
+        if pipeline.total == 0:
+            if task_id:
+                task_registry.update(task_id, 100, status="completed", message="已是最新，无需下载")
+            return {"uid": uid, "fetched": fetched, "pending": 0, "downloaded": 0, "error": None}
+
+        logger.info(f"用户 {uid} 抓取完成，共 {pipeline.total} 个待下载作品")
+        downloaded = pipeline.join()
 
     if task_id:
-        # 更新 target_id 为 uid 以便前端展示
-        update_task_progress(session, task_id, 30, message="正在处理抓取结果...", target_id=uid)
+        task_registry.update(task_id, 100, status="completed", message="同步完成")
+    return {"uid": uid, "fetched": fetched, "pending": pipeline.total, "downloaded": downloaded, "error": None}
 
-    # 为每条作品打上平台标记并保存
-    for item in new_data:
-        item["platform"] = platform
-        add_aweme(session, item)
 
-    # 写入数据库 (已在上方循环中处理)
+def sync_user_job(payload: dict, task_id: str = None):
+    """
+    任务队列处理函数：同步单个用户，失败时抛出异常交由队列重试
+    """
+    with next(get_session()) as session:
+        result = sync_user_videos(session, payload["sec_user_id"], platform=payload.get("platform", "douyin"), task_id=task_id)
+    if result.get("error"):
+        raise RuntimeError(result["error"])
 
-    # 获取未下载作品
-    undownloaded_awemes = get_undownloaded_awemes_by_uid(session, uid)
-    total_new = len(undownloaded_awemes)
 
-    if total_new == 0:
-        if task_id:
-            update_task_progress(session, task_id, 100, status="completed", message="已是最新，无需下载")
-        return
+def check_undownloaded_job(payload: dict, task_id: str = None):
+    """
+    任务队列处理函数：检查数据库中未标记为下载的内容并尝试下载
+    """
+    from db import get_undownloaded_awemes
+    with next(get_session()) as session:
+        task_registry.update(task_id, 10, message="正在查询未下载作品...")
+        undownloaded_awemes = get_undownloaded_awemes(session)
+        total = len(undownloaded_awemes)
 
-    logger.info(f"开始同步用户 {uid}，发现 {total_new} 个新作品")
-    
-    for i, aweme in enumerate(undownloaded_awemes):
-        msg = f"正在下载第 {i+1}/{total_new}: {aweme.desc[:20] if aweme.desc else aweme.aweme_id}"
-        logger.info(msg)
-        
-        progress = 30 + int((i / total_new) * 60)
-        if task_id:
-            update_task_progress(session, task_id, progress, message=msg)
-            
-        process_single_aweme_download(session, aweme)
+        if total == 0:
+            task_registry.update(task_id, 100, status="completed", message="没有未下载的作品")
+            return
 
-    if task_id:
-        update_task_progress(session, task_id, 100, status="completed", message="同步完成")
+        logger.info(f"开启全局补漏下载，发现 {total} 个作品")
+
+        def on_progress(done: int, total: int, label: str, success: bool):
+            msg = f"正在补漏下载 {done}/{total}: {label}"
+            task_registry.update(task_id, 10 + int((done / total) * 89), message=msg)
 
+        run_downloads(session, undownloaded_awemes, process_single_aweme_download, on_progress)
 
-def download_user_videos_task(sec_user_id: str, platform: str, task_id: str):
+        task_registry.update(task_id, 100, status="completed", message=f"补漏完成，共处理 {total} 个作品")
+
+
+def reconcile_job(payload: dict, task_id: str = None):
     """
-    后台抓取用户视频任务
+    任务队列处理函数：按磁盘上的实际文件校正作品的下载状态
     """
-    try:
-        with next(get_session()) as session:
-            sync_user_videos(session, sec_user_id, platform=platform, task_id=task_id)
-    except Exception as e:
-        with next(get_session()) as session:
-            update_task_progress(session, task_id, 100, status="failed", message=str(e))
+    def on_progress(progress: int, message: str):
+        task_registry.update(task_id, progress, message=message)
+
+    result = reconcile_downloads(on_progress)
+    task_registry.update(
+        task_id, 100, status="completed",
+        message=f"对账完成：标记已下载 {result['marked_downloaded']} 个，标记缺失 {result['marked_missing']} 个",
+    )
 
 
-def download_undownloaded_task(task_id: str):
+def search_index_job(payload: dict, task_id: str = None):
     """
-    检查数据库中未标记为下载的内容并尝试下载
+    任务队列处理函数：分批补建作品描述的全文索引，中断后从已完成的位置继续
     """
-    try:
-        from db import get_undownloaded_awemes
-        with next(get_session()) as session:
-            update_task_progress(session, task_id, 10, message="正在查询未下载作品...")
-            undownloaded_awemes = get_undownloaded_awemes(session)
-            total = len(undownloaded_awemes)
-            
-            if total == 0:
-                update_task_progress(session, task_id, 100, status="completed", message="没有未下载的作品")
-                return
-
-            logger.info(f"开启全局补漏下载，发现 {total} 个作品")
-            for i, aweme in enumerate(undownloaded_awemes):
-                msg = f"正在补漏下载 {i+1}/{total}: {aweme.desc[:20] if aweme.desc else aweme.aweme_id}"
-                progress = 10 + int((i / total) * 90)
-                update_task_progress(session, task_id, progress, message=msg)
-                
-                process_single_aweme_download(session, aweme)
-            
-            update_task_progress(session, task_id, 100, status="completed", message=f"补漏完成，共处理 {total} 个作品")
-    except Exception as e:
-        logger.error(f"补漏任务失败: {e}")
-        with next(get_session()) as session:
-            update_task_progress(session, task_id, 100, status="failed", message=str(e))
+    with next(get_session()) as session:
+        status = get_search_index_status(session)
+        start = status["indexed_upto"]
+        while status["pending"]:
+            status = backfill_search_index(session)
+            if task_id:
+                done = status["indexed_upto"] - start
+                total = max(status["target"] - start, 1)
+                task_registry.update(task_id, int(done / total * 99), message=f"正在建立搜索索引 {status['indexed_upto']}/{status['target']}")
+    logger.info(f"搜索索引补建完成，共 {status['target']} 行")
+    if task_id:
+        task_registry.update(task_id, 100, status="completed", message="搜索索引已建立")
+
+
+job_queue.register("sync_user", sync_user_job)
+job_queue.register("check_undownloaded", check_undownloaded_job)
+job_queue.register("reconcile", reconcile_job)
+job_queue.register("search_index", search_index_job)
+
+
+def _enqueue_once(kind: str, payload: dict, task_id: str, duplicate_message: str) -> str:
+    """
+    写入任务；已有类型和参数相同的未完成任务时不再重复写入，
+    本次创建的任务直接结束，返回正在进行的任务的 task_id
+    """
+    job_id = job_queue.enqueue(kind, payload, task_id=task_id, unique=True)
+    existing = job_queue.get_task_id(job_id)
+    if existing and existing != task_id:
+        task_registry.update(task_id, 100, "completed", duplicate_message)
+        return existing
+    return task_id
 
 
 @router.post("/tasks/check_undownloaded")
-def check_undownloaded_api(background_tasks: BackgroundTasks):
+def check_undownloaded_api():
     """
     触发后台任务：检查并下载数据库中所有未下载的作品
     """
+    # 同时只允许一个补漏任务，否则多个任务会重复处理同一批作品
     task_id = str(uuid.uuid4())
-    with next(get_session()) as session:
-        create_task(session, task_id, target_id="global_check")
-    
-    background_tasks.add_task(download_undownloaded_task, task_id)
+    task_registry.create(task_id, target_id="global_check")
+
+    task_id = _enqueue_once("check_undownloaded", {}, task_id, "已有补漏任务在进行")
+    return {"started": True, "task_id": task_id}
+
+
+@router.post("/tasks/reconcile")
+def reconcile_api():
+    """
+    触发后台任务：扫描下载目录，校正作品的 downloaded 标记
+    """
+    task_id = str(uuid.uuid4())
+    task_registry.create(task_id, target_id="reconcile")
+
+    job_queue.enqueue("reconcile", task_id=task_id, max_attempts=1)
     return {"started": True, "task_id": task_id}
 
 
 @router.post("/download_user_videos")
 def download_user_videos_api(
     url: str = Query(..., description="抖音用户主页URL"),
-    background_tasks: BackgroundTasks = None,
 ) -> dict[str, Any]:
     """
     触发后台下载用户所有视频（通过 URL）
@@ -239,7 +330,7 @@ def download_user_videos_api(
         sec_user_id = extract_sec_user_id(final_url)
         
         # 尝试抓取基本资料
-        profile = fetch_user_profile(sec_user_id, platform=platform)
+        profile = get_user_profile(sec_user_id, platform=platform)
         author_info = profile.get("user", {})
         
         uid = author_info.get("uid") or sec_user_id
@@ -255,9 +346,9 @@ def download_user_videos_api(
                 "platform": platform
             })
             # 创建任务记录
-            create_task(session, task_id, target_id=uid)
+            task_registry.create(task_id, target_id=uid)
             
-        background_tasks.add_task(download_user_videos_task, sec_user_id, platform, task_id)
+        task_id = _enqueue_once("sync_user", {"sec_user_id": sec_user_id, "platform": platform}, task_id, "该用户已有同步任务在进行")
         return {"started": True, "task_id": task_id}
         
     except Exception as e:
@@ -269,25 +360,20 @@ def download_user_videos_api(
 @router.post("/refresh_user_videos")
 def refresh_user_videos_api(
     sec_user_id: str = Query(..., description="用户的 sec_user_id"),
-    background_tasks: BackgroundTasks = None,
 ) -> dict[str, Any]:
     """
     通过 sec_user_id 触发后台增量同步用户视频
     """
     task_id = str(uuid.uuid4())
-    
-    def task_wrapper(sec_user_id: str, platform: str, task_id: str):
-        with next(get_session()) as session:
-            sync_user_videos(session, sec_user_id, platform=platform, task_id=task_id)
 
     with next(get_session()) as session:
         # 获取 uid (从 db 查，如果查不到就用 sec_user_id 占位)
         user = session.query(User).filter_by(sec_user_id=sec_user_id).first()
         target_id = user.uid if user else sec_user_id
         platform = user.platform if user else "douyin"
-        create_task(session, task_id, target_id=target_id)
+        task_registry.create(task_id, target_id=target_id)
 
-    background_tasks.add_task(task_wrapper, sec_user_id, platform, task_id)
+    task_id = _enqueue_once("sync_user", {"sec_user_id": sec_user_id, "platform": platform}, task_id, "该用户已有同步任务在进行")
     return {"started": True, "task_id": task_id}
 
 
@@ -330,8 +416,55 @@ def get_active_tasks_api():
     """
     获取所有正在运行的任务
     """
+    return task_registry.get_active()
+
+
+class JobInfo(BaseModel):
+    id: int
+    kind: str
+    payload: str | None
+    task_id: str | None
+    status: str
+    attempts: int
+    max_attempts: int
+    run_after: int | None
+    last_error: str | None
+    created_at: int
+    updated_at: int
+
+
+@router.get("/jobs", response_model=list[JobInfo])
+def get_jobs_api(
+    status: str | None = Query(None, description="按状态过滤：queued / leased / done / dead"),
+    limit: int = Query(100, ge=1, le=500, description="返回数量"),
+):
+    """
+    查看任务队列，status=dead 时列出死信任务
+    """
     with next(get_session()) as session:
-        return get_all_active_tasks(session)
+        return get_jobs(session, status=status, limit=limit)
+
+
+@router.post("/jobs/{job_id}/requeue")
+def requeue_job_api(job_id: int):
+    """
+    重新执行一个死信任务
+    """
+    if not job_queue.requeue(job_id):
+        raise HTTPException(status_code=404, detail="任务不存在或不是死信状态")
+    return {"success": True}
+
+
+@router.get("/events")
+async def events_api():
+    """
+    SSE 推送通道：tasks (活跃任务列表) 与 scheduler (调度器状态) 的变化
+    """
+    return StreamingResponse(
+        event_broker.subscribe(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 class UserInfo(BaseModel):
@@ -347,15 +480,133 @@ class UserInfo(BaseModel):
     platform: str = "douyin"
 
 
-@router.get("/users", response_model=list[UserInfo])
-def get_users_api():
+class UserPage(BaseModel):
+    items: list[UserInfo]
+    next_cursor: str | None = None
+
+
+class AwemeInfo(BaseModel):
+    aweme_id: str
+    uid: str | None
+    nickname: str | None
+    desc: str | None
+    share_url: str | None
+    create_time: int | None
+    aweme_type: int | None
+    platform: str | None
+    downloaded: bool
+
+
+class AwemePage(BaseModel):
+    items: list[AwemeInfo]
+    next_cursor: str | None = None
+
+
+def _parse_cursor(cursor: str, parts: int) -> list[int]:
+    """
+    游标是上一页最后一行排序键的数字，用 _ 连接；格式不对时返回 400
+    """
+    try:
+        values = [int(v) for v in cursor.split("_")]
+    except ValueError:
+        values = []
+    if len(values) != parts:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+    return values
+
+
+@router.get("/users", response_model=UserPage)
+def get_users_api(
+    limit: int = Query(100, ge=1, le=500, description="每页数量"),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+    platform: str | None = Query(None, description="按平台过滤"),
+    auto_update: bool | None = Query(None, description="按是否自动更新过滤"),
+):
+    """
+    分页获取已存储的用户列表，按添加顺序排列
+    """
+    after_id = _parse_cursor(cursor, 1)[0] if cursor else None
+    with next(get_session()) as session:
+        rows = list_users(session, limit, after_id=after_id, platform=platform, auto_update=auto_update)
+        next_cursor = str(rows[limit - 1].id) if len(rows) > limit else None
+        return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+@router.get("/awemes", response_model=AwemePage)
+def get_awemes_api(
+    limit: int = Query(50, ge=1, le=200, description="每页数量"),
+    cursor: str | None = Query(None, description="上一页返回的 next_cursor"),
+    uid: str | None = Query(None, description="按作者 uid 过滤"),
+    platform: str | None = Query(None, description="按平台过滤"),
+    downloaded: bool | None = Query(None, description="按是否已下载过滤"),
+    aweme_type: int | None = Query(None, description="按作品类型过滤 (0: 视频, 68: 图文)"),
+    start_time: int | None = Query(None, description="发布时间下限 (含)，秒级时间戳"),
+    end_time: int | None = Query(None, description="发布时间上限 (不含)，秒级时间戳"),
+):
+    """
+    分页浏览作品，按发布时间从新到旧排列
+    """
+    before = tuple(_parse_cursor(cursor, 2)) if cursor else None
+    with next(get_session()) as session:
+        rows = list_awemes(
+            session, limit, before=before, uid=uid, platform=platform, downloaded=downloaded,
+            aweme_type=aweme_type, start_time=start_time, end_time=end_time,
+        )
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last.create_time or 0}_{last.id}"
+        return {"items": rows[:limit], "next_cursor": next_cursor}
+
+
+
+class SearchResult(AwemeInfo):
+    snippet: str | None
+
+
+class SearchPage(BaseModel):
+    items: list[SearchResult]
+    next_offset: int | None = None
+    indexing: bool = False
+    truncated: bool = False
+
+
+@router.get("/search", response_model=SearchPage)
+def search_api(
+    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词，空格分隔的多个词需同时出现"),
+    limit: int = Query(20, ge=1, le=100, description="每页数量"),
+    offset: int = Query(0, ge=0, le=1000, description="跳过的结果数"),
+    uid: str | None = Query(None, description="只搜索该作者的作品"),
+    platform: str | None = Query(None, description="按平台过滤"),
+):
     """
-    获取所有已存储的用户列表
+    按描述全文搜索作品，结果按相关度排序
+    关键词都短于 3 个字符时无法使用全文索引，结果改按发布时间从新到旧排列
+    indexing 为 True 时存量作品的索引仍在补建，结果可能不完整
+    truncated 为 True 时命中数超过上限，只在最近入库的部分命中中按相关度排序，更早的作品可能不在结果中
     """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="搜索关键词不能为空")
     with next(get_session()) as session:
-        return get_all_users(session)
+        rows, truncated = search_awemes(session, q, limit + 1, offset, uid=uid, platform=platform)
+        indexing = get_search_index_status(session)["pending"]
+    next_offset = offset + limit if len(rows) > limit else None
+    return {"items": rows[:limit], "next_offset": next_offset, "indexing": indexing, "truncated": truncated}
 
 
+@router.post("/search/rebuild")
+def rebuild_search_index_api():
+    """
+    触发后台任务：清空并重建全文搜索索引
+    """
+    with next(get_session()) as session:
+        reset_search_index(session)
+    task_id = str(uuid.uuid4())
+    task_registry.create(task_id, target_id="search_index")
+
+    job_queue.enqueue("search_index", task_id=task_id)
+    return {"started": True, "task_id": task_id}
+
 
 class ShareDownloadResult(BaseModel):
     filename: str
@@ -398,45 +649,96 @@ def parse_video_api(share_url: str = Query(..., description="分享链接")):
     )
 
 
+# 透传给上游 / 回传给浏览器的头，保证进度显示与断点续传可用
+PROXY_REQUEST_HEADERS = ("range", "if-range")
+PROXY_RESPONSE_HEADERS = ("content-length", "content-range", "accept-ranges", "content-encoding", "etag", "last-modified")
+
+
 @router.get("/download_proxy")
-async def download_proxy_api(share_url: str = Query(..., description="抖音分享链接"), filename: str = Query("video", description="保存的文件名")):
+async def download_proxy_api(
+    request: Request,
+    share_url: str = Query(..., description="抖音分享链接"),
+    filename: str = Query("video", description="保存的文件名"),
+):
     """
     代理下载：通过服务器请求 DOWNLOAD_API 并直接流式返回给客户端，实现浏览器本地下载
+    上游响应边收边发，不在内存中缓冲整个文件；Range 请求透传，支持浏览器续传
     """
     share_url = extract_share_url(share_url)
-    share_url = resolve_redirect(share_url)
-    
+    # resolve_redirect 是阻塞调用，放到线程池执行
+    share_url = await run_in_threadpool(resolve_redirect, share_url)
+
     params = {
         "url": share_url,
         "prefix": "false",
         "with_watermark": "false"
     }
-    
+    headers = {name: request.headers[name] for name in PROXY_REQUEST_HEADERS if name in request.headers}
+
     from urllib.parse import quote
-    
-    # 鉴于我们需要提前知道 Content-Type 以设置正确的扩展名
-    # 我们先发起请求
-    async with httpx.AsyncClient(timeout=60) as client:
-        # 使用 GET 对应 Downloader 的逻辑
-        resp = await client.get(DOWNLOAD_API, params=params)
-        resp.raise_for_status()
-    
+
+    client = get_async_client()
+    # 与后台下载共用 download 端点的限速器与断路器
+    limiter = get_limiter("download")
+
+    async def attempt() -> httpx.Response:
+        await run_in_threadpool(limiter.acquire)
+        start = time.monotonic()
+        try:
+            upstream = client.build_request("GET", DOWNLOAD_API, params=params, headers=headers, timeout=60)
+            resp = await client.send(upstream, stream=True)
+        except httpx.TransportError:
+            limiter.record(None, time.monotonic() - start)
+            raise
+        limiter.record(resp.status_code, time.monotonic() - start, retry_after_seconds(resp.headers))
+        # 416 是浏览器续传偏移失效，原样返回给客户端
+        if resp.status_code >= 400 and resp.status_code != 416:
+            await resp.aclose()
+            resp.raise_for_status()
+        return resp
+
+    try:
+        resp = await call_with_retry_async("download", attempt)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.HTTPError as e:
+        logger.error(f"代理下载失败: {share_url} | {e}")
+        status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+        raise HTTPException(status_code=502, detail=f"上游下载失败: {status_code or e}")
+
+    if resp.status_code == 416:
+        await resp.aclose()
+        return Response(status_code=416, headers={k: resp.headers[k] for k in ("content-range",) if k in resp.headers})
+
     content_type = resp.headers.get("content-type", "video/mp4")
     disposition = resp.headers.get("content-disposition", "")
-    
+
     # 决定扩展名
     ext = ".mp4"
     if "application/zip" in content_type or ".zip" in disposition.lower():
         ext = ".zip"
-        
+
     # 清理文件名防止 header 报错
     clean_filename = sanitize_filename(filename)
     encoded_filename = quote(clean_filename)
-    
+
+    response_headers = {k: resp.headers[k] for k in PROXY_RESPONSE_HEADERS if k in resp.headers}
+    response_headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{encoded_filename}{ext}"
+
+    async def body():
+        # 客户端中途断开时 Starlette 不会执行 background 任务，必须在生成器退出时关闭上游响应归还连接
+        try:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+        finally:
+            await resp.aclose()
+
+    # 使用原始字节流：保留上游的 content-encoding，Content-Length 与实际发送的字节一致
     return StreamingResponse(
-        io.BytesIO(resp.content),
+        body(),
+        status_code=resp.status_code,
         media_type=content_type,
-        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}{ext}"}
+        headers=response_headers,
     )
 
 
@@ -448,7 +750,8 @@ def download_from_share_url(share_url: str = Query(..., description="抖音分
 
     share_url = extract_share_url(share_url)
     share_url = resolve_redirect(share_url)
-    video_data = fetch_video_profile(share_url)
+    # 与 /parse_video 使用同一份完整数据，解析后紧接着下载时命中缓存
+    video_data = fetch_video_profile(share_url, minimal=False)
 
     aweme_id = video_data.get("aweme_id")
     aweme_type = video_data.get("aweme_type", 0)
@@ -458,24 +761,23 @@ def download_from_share_url(share_url: str = Query(..., description="抖音分
     nickname = video_data.get("author", {}).get("nickname")
     uid = video_data.get("author", {}).get("uid")
 
-    # 抓取完整 Profile 以获取最新的 nickname 用于文件夹名
+    # 获取作者 Profile 以得到最新的 nickname 用于文件夹名（同一作者的多次下载走缓存）
     author_info = video_data.get("author", {})
     sec_user_id = author_info.get("sec_uid")
     if sec_user_id:
         try:
-            profile = fetch_user_profile(sec_user_id)
+            profile = get_user_profile(sec_user_id)
             full_user_info = profile.get("user", {})
             if full_user_info:
-                author_info.update(full_user_info)
+                author_info = {**author_info, **full_user_info}
         except Exception as e:
             logger.error(f"enrichment 失败: {e}")
 
     # 重新获取最新的 nickname 以构建文件夹名（如果 enrichment 更新了它）
     final_nickname = author_info.get("nickname", nickname)
-    type_folder = "notes" if aweme_type == 68 else "videos"
-    author_folder = os.path.join(f"{final_nickname}_{uid}", type_folder)
+    folder = author_folder(final_nickname, uid, aweme_type)
 
-    success = download_video(share_url, author_folder, filename, aweme_id)
+    success = download_video(share_url, folder, filename, aweme_id)
 
     return ShareDownloadResult(filename=filename, downloaded=success)
 
@@ -496,6 +798,9 @@ class GlobalSettings(BaseModel):
     download_video: bool
     download_note: bool
     auto_update_interval: int
+    download_workers: int | None = None
+    # 各平台单独的下载并发数，值为 None 表示跟随全局 download_workers
+    platform_download_workers: dict[str, int | None] | None = None
 
 class UserPreferenceRequest(BaseModel):
     uid: str
@@ -525,7 +830,9 @@ def get_settings_api(session: Session = Depends(get_session), _ = Depends(get_cu
     return GlobalSettings(
         download_video=get_config(session, "download_video", "true") == "true",
         download_note=get_config(session, "download_note", "true") == "true",
-        auto_update_interval=int(get_config(session, "auto_update_interval", "120"))
+        auto_update_interval=int(get_config(session, "auto_update_interval", "120")),
+        download_workers=get_download_workers(session),
+        platform_download_workers=get_platform_download_workers(session),
     )
 
 @router.post("/settings")
@@ -533,6 +840,14 @@ def update_settings_api(req: GlobalSettings, session: Session = Depends(get_sess
     set_config(session, "download_video", "true" if req.download_video else "false")
     set_config(session, "download_note", "true" if req.download_note else "false")
     set_config(session, "auto_update_interval", str(req.auto_update_interval))
+    if req.download_workers is not None:
+        set_config(session, "download_workers", str(max(1, min(req.download_workers, MAX_DOWNLOAD_WORKERS))))
+    for platform, workers in (req.platform_download_workers or {}).items():
+        if platform not in DOWNLOAD_PLATFORMS:
+            raise HTTPException(status_code=400, detail=f"不支持的平台: {platform}")
+        # 空值清除单独设置，回到全局并发数
+        value = "" if workers is None else str(max(1, min(workers, MAX_DOWNLOAD_WORKERS)))
+        set_config(session, f"download_workers_{platform}", value)
     return {"success": True}
 
 @router.post("/change_password")
@@ -558,6 +873,15 @@ def get_scheduler_status():
     return scheduler_manager.get_status()
 
 
+@router.get("/scheduler/runs")
+def get_scheduler_runs():
+    """
+    获取最近的自动更新运行记录
+    """
+    from scheduler import scheduler_manager
+    return scheduler_manager.get_runs()
+
+
 @router.post("/scheduler/run_now")
 def run_scheduler_now():
     """
@@ -568,22 +892,80 @@ def run_scheduler_now():
     return {"success": True}
 
 
+@router.get("/http/stats")
+def get_http_stats_api():
+    """
+    获取共享 HTTP 连接池状态与各上游端点当前的限速、断路器状态
+    """
+    return {**get_pool_stats(), "rate_limits": get_limiter_stats(), "circuit_breakers": get_breaker_stats()}
+
+
+@router.get("/cache/stats")
+def get_cache_stats_api():
+    """
+    获取各进程内缓存的大小与命中率
+    """
+    return get_cache_stats()
+
+
+LOG_PATH = os.path.join(data_dir, "app.log")
+
+
 @router.get("/logs")
-def get_logs_api(lines: int = Query(1000, description="读取日志的行数")):
+def get_logs_api(
+    lines: int = Query(1000, ge=0, le=10000, description="读取日志的行数"),
+    offset: int | None = Query(None, ge=0, description="增量读取：返回该字节偏移之后的新行"),
+    file_id: int | None = Query(None, description="上次返回的 file_id，用于识别日志轮转"),
+):
     """
-    读取后端日志文件内容
+    读取后端日志：默认返回末尾 N 行；指定 offset 时只返回之后新增的行
     """
-    log_path = os.path.join(os.path.dirname(__file__), "data", "app.log")
-    if not os.path.exists(log_path):
-        return {"logs": ["日志文件尚未生成"]}
-    
+    if not os.path.exists(LOG_PATH):
+        return {"logs": ["日志文件尚未生成"], "offset": 0, "file_id": None, "reset": False}
+
     try:
-        with open(log_path, "r", encoding="utf-8") as f:
-            # 简单的读取末尾 N 行逻辑
-            all_lines = f.readlines()
-            return {"logs": all_lines[-lines:] if len(all_lines) > lines else all_lines}
+        if offset is None:
+            return {**tail_lines(LOG_PATH, lines), "reset": False}
+        return read_from(LOG_PATH, offset, file_id)
     except Exception as e:
-        return {"logs": [f"读取日志失败: {str(e)}"]}
+        return {"logs": [f"读取日志失败: {str(e)}"], "offset": offset or 0, "file_id": file_id, "reset": False}
+
+
+@router.get("/logs/stream")
+async def stream_logs_api(
+    offset: int | None = Query(None, ge=0, description="从该字节偏移开始跟踪，默认从文件末尾"),
+    file_id: int | None = Query(None, description="上次返回的 file_id"),
+    last_event_id: str | None = Header(None, alias="Last-Event-ID"),
+):
+    """
+    SSE 跟踪日志：持续推送新增的日志行
+    每条消息的 id 为 "file_id:offset"，EventSource 自动重连时通过 Last-Event-ID 从断开处继续，不会重复推送
+    """
+    if last_event_id:
+        try:
+            last_file_id, last_offset = last_event_id.split(":", 1)
+            file_id, offset = int(last_file_id), int(last_offset)
+        except ValueError:
+            pass
+    if offset is None:
+        if os.path.exists(LOG_PATH):
+            offset = os.path.getsize(LOG_PATH)
+            file_id = os.stat(LOG_PATH).st_ino
+        else:
+            offset = 0
+
+    async def generate():
+        async for chunk in follow(LOG_PATH, offset, file_id, heartbeat=HEARTBEAT_INTERVAL):
+            if chunk is None:
+                yield ": ping\n\n"
+                continue
+            yield f"id: {chunk['file_id']}:{chunk['offset']}\nevent: logs\ndata: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 def throw_auth_error(detail="用户名或密码错误"):
@@ -0,0 +1,121 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from loguru import logger
+from db import get_session, get_cache_entry, save_cache_entry, purge_expired_cache_entries
+
+
+class TTLCache:
+    """
+    线程安全的 LRU + TTL 缓存，超过 max_size 时淘汰最久未使用的条目
+    persist=True 时同时写入 cache_entries 表，内存未命中时回落到数据库（值需可 JSON 序列化）
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float, persist: bool = False):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist = persist
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "db_hits": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return value
+                del self._data[key]
+
+        if self.persist:
+            try:
+                with next(get_session()) as session:
+                    entry = get_cache_entry(session, self.name, key)
+                    row = (entry.expires_at, entry.value) if entry else None
+            except Exception as e:
+                logger.warning(f"[{self.name}] 读取持久化缓存失败: {e}")
+                row = None
+            if row is not None:
+                expires_at, value = row[0], json.loads(row[1])
+                self._store(key, value, expires_at)
+                with self._lock:
+                    self.stats["hits"] += 1
+                    self.stats["db_hits"] += 1
+                return value
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        写入缓存，ttl 为空时使用默认值
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._store(key, value, expires_at)
+        if self.persist:
+            try:
+                with next(get_session()) as session:
+                    save_cache_entry(session, self.name, key, json.dumps(value, ensure_ascii=False), int(expires_at))
+            except Exception as e:
+                logger.warning(f"[{self.name}] 写入持久化缓存失败: {e}")
+
+    def _store(self, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def pop(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "persist": self.persist,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None,
+                **self.stats,
+            }
+
+
+_caches: dict[str, TTLCache] = {}
+
+
+def register_cache(cache: TTLCache) -> TTLCache:
+    _caches[cache.name] = cache
+    return cache
+
+
+def get_cache_stats() -> dict:
+    return {name: cache.snapshot() for name, cache in _caches.items()}
+
+
+def purge_expired():
+    """
+    清理数据库中已过期的持久化条目，在启动时调用
+    """
+    with next(get_session()) as session:
+        deleted = purge_expired_cache_entries(session)
+    if deleted:
+        logger.info(f"已清理 {deleted} 条过期缓存")
@@ -12,6 +12,27 @@ class Config:
         self.SAVE_DIR = "videos"
         self.PORT = 8000
         self.BASE_API_URL = "http://10.1.1.6"
+        # HTTP 连接池
+        self.HTTP_MAX_CONNECTIONS = 100
+        self.HTTP_MAX_KEEPALIVE = 20
+        self.HTTP_KEEPALIVE_EXPIRY = 30.0
+        self.HTTP2 = False
+        # 上游自适应限速（每秒请求数），RATE_LIMITS 可按端点单独指定上限
+        self.RATE_LIMIT_INITIAL = 3.0
+        self.RATE_LIMIT_MIN = 0.5
+        self.RATE_LIMIT_MAX = 10.0
+        self.RATE_LIMIT_LATENCY_TARGET = 10.0
+        self.RATE_LIMITS = {}
+        # 短链跳转缓存
+        self.REDIRECT_CACHE_SIZE = 2048
+        self.REDIRECT_CACHE_TTL = 86400
+        self.REDIRECT_CACHE_PERSIST = True
+        # 作者资料缓存（秒）
+        self.PROFILE_CACHE_SIZE = 1024
+        self.PROFILE_CACHE_TTL = 21600
+        # 作品元数据缓存（秒），实际有效期不超过 play_addr 直链的过期时间
+        self.VIDEO_CACHE_SIZE = 512
+        self.VIDEO_CACHE_TTL = 1800
 
         # 1. 从 YAML 加载
         if CONFIG_PATH.exists():
@@ -22,6 +43,22 @@ class Config:
                         self.SAVE_DIR = yaml_config.get("save_dir", self.SAVE_DIR)
                         self.PORT = int(yaml_config.get("port", self.PORT))
                         self.BASE_API_URL = yaml_config.get("base_api_url", self.BASE_API_URL)
+                        self.HTTP_MAX_CONNECTIONS = int(yaml_config.get("http_max_connections", self.HTTP_MAX_CONNECTIONS))
+                        self.HTTP_MAX_KEEPALIVE = int(yaml_config.get("http_max_keepalive", self.HTTP_MAX_KEEPALIVE))
+                        self.HTTP_KEEPALIVE_EXPIRY = float(yaml_config.get("http_keepalive_expiry", self.HTTP_KEEPALIVE_EXPIRY))
+                        self.HTTP2 = bool(yaml_config.get("http2", self.HTTP2))
+                        self.RATE_LIMIT_INITIAL = float(yaml_config.get("rate_limit_initial", self.RATE_LIMIT_INITIAL))
+                        self.RATE_LIMIT_MIN = float(yaml_config.get("rate_limit_min", self.RATE_LIMIT_MIN))
+                        self.RATE_LIMIT_MAX = float(yaml_config.get("rate_limit_max", self.RATE_LIMIT_MAX))
+                        self.RATE_LIMIT_LATENCY_TARGET = float(yaml_config.get("rate_limit_latency_target", self.RATE_LIMIT_LATENCY_TARGET))
+                        self.RATE_LIMITS = {k: float(v) for k, v in (yaml_config.get("rate_limits") or {}).items()}
+                        self.REDIRECT_CACHE_SIZE = int(yaml_config.get("redirect_cache_size", self.REDIRECT_CACHE_SIZE))
+                        self.REDIRECT_CACHE_TTL = int(yaml_config.get("redirect_cache_ttl", self.REDIRECT_CACHE_TTL))
+                        self.REDIRECT_CACHE_PERSIST = bool(yaml_config.get("redirect_cache_persist", self.REDIRECT_CACHE_PERSIST))
+                        self.PROFILE_CACHE_SIZE = int(yaml_config.get("profile_cache_size", self.PROFILE_CACHE_SIZE))
+                        self.PROFILE_CACHE_TTL = int(yaml_config.get("profile_cache_ttl", self.PROFILE_CACHE_TTL))
+                        self.VIDEO_CACHE_SIZE = int(yaml_config.get("video_cache_size", self.VIDEO_CACHE_SIZE))
+                        self.VIDEO_CACHE_TTL = int(yaml_config.get("video_cache_ttl", self.VIDEO_CACHE_TTL))
             except Exception as e:
                 print(f"警告: 无法加载配置文件 {CONFIG_PATH}: {e}")
 
@@ -29,6 +66,21 @@ class Config:
         self.SAVE_DIR = os.getenv("SAVE_DIR", self.SAVE_DIR)
         self.PORT = int(os.getenv("PORT", self.PORT))
         self.BASE_API_URL = os.getenv("BASE_API_URL", self.BASE_API_URL)
+        self.HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", self.HTTP_MAX_CONNECTIONS))
+        self.HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", self.HTTP_MAX_KEEPALIVE))
+        self.HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", self.HTTP_KEEPALIVE_EXPIRY))
+        self.HTTP2 = os.getenv("HTTP2", str(self.HTTP2)).lower() in ("1", "true", "yes")
+        self.RATE_LIMIT_INITIAL = float(os.getenv("RATE_LIMIT_INITIAL", self.RATE_LIMIT_INITIAL))
+        self.RATE_LIMIT_MIN = float(os.getenv("RATE_LIMIT_MIN", self.RATE_LIMIT_MIN))
+        self.RATE_LIMIT_MAX = float(os.getenv("RATE_LIMIT_MAX", self.RATE_LIMIT_MAX))
+        self.RATE_LIMIT_LATENCY_TARGET = float(os.getenv("RATE_LIMIT_LATENCY_TARGET", self.RATE_LIMIT_LATENCY_TARGET))
+        self.REDIRECT_CACHE_SIZE = int(os.getenv("REDIRECT_CACHE_SIZE", self.REDIRECT_CACHE_SIZE))
+        self.REDIRECT_CACHE_TTL = int(os.getenv("REDIRECT_CACHE_TTL", self.REDIRECT_CACHE_TTL))
+        self.REDIRECT_CACHE_PERSIST = os.getenv("REDIRECT_CACHE_PERSIST", str(self.REDIRECT_CACHE_PERSIST)).lower() in ("1", "true", "yes")
+        self.PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", self.PROFILE_CACHE_SIZE))
+        self.PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", self.PROFILE_CACHE_TTL))
+        self.VIDEO_CACHE_SIZE = int(os.getenv("VIDEO_CACHE_SIZE", self.VIDEO_CACHE_SIZE))
+        self.VIDEO_CACHE_TTL = int(os.getenv("VIDEO_CACHE_TTL", self.VIDEO_CACHE_TTL))
 
         # 3. 派生具体 API 地址
         # 去除末尾斜杠
@@ -1,5 +1,7 @@
+import html
 import os
 import time
+import threading
 import bcrypt
 # Monkeypatch bcrypt for passlib compatibility (passlib is unmaintained)
 try:
@@ -7,10 +9,12 @@ try:
         bcrypt.__about__ = type("about", (object,), {"__version__": bcrypt.__version__})
 except Exception:
     pass
-from typing import Generator
+from typing import Generator, Optional
 from loguru import logger
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey
+from sqlalchemy import create_engine, event, update, text, func, tuple_, Column, Integer, String, Boolean, ForeignKey, Index
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.exc import OperationalError
 
 # ----------------------------
 # 数据库路径配置
@@ -18,8 +22,8 @@ from sqlalchemy.orm import sessionmaker, declarative_base, Session
 # 项目根目录（main.py 所在目录）
 main_dir = os.path.dirname(os.path.abspath(__file__))
 
-# 数据库存放目录
-data_dir = os.path.join(main_dir, "data")
+# 数据库存放目录，可通过 DATA_DIR 环境变量覆盖（测试时指向临时目录）
+data_dir = os.getenv("DATA_DIR", os.path.join(main_dir, "data"))
 os.makedirs(data_dir, exist_ok=True)
 
 # SQLite 数据库路径
@@ -33,6 +37,25 @@ engine = create_engine(
     DATABASE_URL,
     connect_args={"check_same_thread": False},
 )
+
+# SQLite 连接参数：WAL 允许读写并发，busy_timeout 避免后台任务并发写入时直接报 "database is locked"
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 30000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+@event.listens_for(engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for key, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {key}={value}")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -54,6 +77,18 @@ class Aweme(Base):
     platform = Column(String, default="douyin")
     downloaded = Column(Boolean, default=False)
 
+    __table_args__ = (
+        Index("ix_awemes_uid_downloaded", "uid", "downloaded"),
+    )
+
+
+# 列表排序用的发布时间，缺失的 create_time 按 0 处理，保证游标能表示每一行
+# 常量须写成字面量而不是绑定参数，SQLite 才能匹配下面的表达式索引
+AWEME_SORT_TIME = func.coalesce(Aweme.create_time, text("0"))
+Index("ix_awemes_sort_time", AWEME_SORT_TIME)
+Index("ix_awemes_uid_sort_time", Aweme.uid, AWEME_SORT_TIME)
+Index("ix_awemes_platform_sort_time", Aweme.platform, AWEME_SORT_TIME)
+
 
 class User(Base):
     __tablename__ = "users"
@@ -71,6 +106,15 @@ class User(Base):
     created_at = Column(Integer, default=lambda: int(time.time()))
     updated_at = Column(Integer, default=lambda: int(time.time()))
     platform = Column(String, default="douyin")
+    # 最近一次从上游拿到作者资料的时间，资料缓存的 TTL 以此为准（updated_at 也会因修改偏好等操作变化）
+    profile_fetched_at = Column(Integer, nullable=True)
+    # 增量同步的下界：上一次完整翻页结束时见过的最新 create_time
+    # 只在翻页全部成功后推进，中途失败时已入库的新作品不会让下一次同步跳过缺失的旧作品
+    sync_watermark = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        Index("ix_users_platform", "platform"),
+    )
 
 
 class Account(Base):
@@ -102,6 +146,86 @@ class Task(Base):
     created_at = Column(Integer, default=lambda: int(time.time()))
     updated_at = Column(Integer, default=lambda: int(time.time()))
 
+    __table_args__ = (
+        Index("ix_tasks_status", "status"),
+    )
+
+
+class PartialDownload(Base):
+    """未完成的下载（.part 文件），用于断点续传"""
+    __tablename__ = "partial_downloads"
+
+    aweme_id = Column(String, primary_key=True)
+    path = Column(String, nullable=False)
+    offset = Column(Integer, default=0)  # 已写入的字节数
+    total = Column(Integer, nullable=True)  # 完整文件大小，未知时为空
+    validator = Column(String, nullable=True)  # ETag 或 Last-Modified，续传时作为 If-Range
+    updated_at = Column(Integer, default=lambda: int(time.time()))
+
+
+class MediaFile(Base):
+    """已下载文件的内容索引（sha256），用于去重与跳过已有内容的下载"""
+    __tablename__ = "media_files"
+
+    id = Column(Integer, primary_key=True)
+    path = Column(String, unique=True, nullable=False)  # 相对 SAVE_DIR 的路径
+    aweme_id = Column(String, index=True)
+    member = Column(String, nullable=True)  # 图文包内的相对文件名，视频为空
+    sha256 = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    # 校验哈希时的文件签名，size / mtime_ns / inode 均未变化时视为内容未变，不再重新读取文件
+    mtime_ns = Column(Integer, nullable=True)
+    inode = Column(Integer, nullable=True)
+    created_at = Column(Integer, default=lambda: int(time.time()))
+
+    __table_args__ = (
+        Index("ix_media_files_sha256_size", "sha256", "size"),
+    )
+
+
+class ScannedDir(Base):
+    """对账扫描的目录缓存：mtime 未变化的目录直接复用上次的列表，不再 scandir"""
+    __tablename__ = "scanned_dirs"
+
+    path = Column(String, primary_key=True)  # 相对 SAVE_DIR 的路径，根目录为 "."
+    mtime_ns = Column(Integer, nullable=False)
+    subdirs = Column(String, default="[]")  # JSON
+    files = Column(String, default="[]")  # JSON
+
+
+class CacheEntry(Base):
+    """进程内缓存的持久化副本，重启后可继续使用"""
+    __tablename__ = "cache_entries"
+
+    namespace = Column(String, primary_key=True)  # 缓存名，如 redirect
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=False)  # JSON
+    expires_at = Column(Integer, nullable=False)
+
+
+class Job(Base):
+    """持久化任务队列"""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)  # sync_user, check_undownloaded, auto_update
+    payload = Column(String, default="{}")  # JSON
+    task_id = Column(String, nullable=True)  # 关联的 tasks.id，用于进度展示
+    status = Column(String, default="queued")  # queued, leased, done, dead
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(Integer, default=0)  # 重试退避：在此时间之前不会被领取
+    lease_owner = Column(String, nullable=True)
+    lease_until = Column(Integer, nullable=True)
+    heartbeat_at = Column(Integer, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(Integer, default=lambda: int(time.time()))
+    updated_at = Column(Integer, default=lambda: int(time.time()))
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
 
 # ----------------------------
 # 创建表
@@ -109,6 +233,102 @@ class Task(Base):
 Base.metadata.create_all(bind=engine)
 
 
+# ----------------------------
+# 全文索引
+# ----------------------------
+# awemes_fts 是 awemes.desc 的外部内容 FTS5 表（trigram 分词，适合中文任意子串），由触发器同步
+# 旧库的存量作品由后台任务按 id 分批补建：configs 中 search_index_target 为需要补建的最大 id，
+# search_index_rowid 为已补建到的 id；触发器只维护已在索引中的行，避免与补建重复写入
+_FTS_INDEXED = (
+    "({id} > (SELECT CAST(value AS INTEGER) FROM configs WHERE key = 'search_index_target')"
+    " OR {id} <= (SELECT CAST(value AS INTEGER) FROM configs WHERE key = 'search_index_rowid'))"
+)
+_FTS_DELETE = "INSERT INTO awemes_fts (awemes_fts, rowid, \"desc\") VALUES ('delete', old.id, old.\"desc\");"
+_FTS_INSERT = "INSERT INTO awemes_fts (rowid, \"desc\") VALUES (new.id, new.\"desc\");"
+
+
+# ----------------------------
+# 数据库迁移
+# ----------------------------
+# create_all 不会修改已存在的表，对旧库的结构变更放在这里按顺序执行
+# 已执行到的版本记录在 PRAGMA user_version 中，新增迁移只能追加到末尾
+MIGRATIONS = [
+    # 1: 热点查询的复合索引
+    [
+        "CREATE INDEX IF NOT EXISTS ix_awemes_uid_downloaded ON awemes (uid, downloaded)",
+        "CREATE INDEX IF NOT EXISTS ix_awemes_uid_create_time ON awemes (uid, create_time)",
+        "CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks (status)",
+    ],
+    # 2: 列表分页的排序索引（id 即 rowid，已隐含在每个索引末尾）
+    [
+        "CREATE INDEX IF NOT EXISTS ix_awemes_create_time ON awemes (create_time)",
+        "CREATE INDEX IF NOT EXISTS ix_awemes_platform_create_time ON awemes (platform, create_time)",
+        "CREATE INDEX IF NOT EXISTS ix_users_platform ON users (platform)",
+    ],
+    # 3: 作品描述全文索引，存量数据由 search_index 任务补建
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS awemes_fts USING fts5"
+        "(\"desc\", content='awemes', content_rowid='id', tokenize='trigram')",
+        "INSERT OR REPLACE INTO configs (key, value)"
+        " SELECT 'search_index_target', CAST(COALESCE(MAX(id), 0) AS TEXT) FROM awemes",
+        "INSERT OR REPLACE INTO configs (key, value) VALUES ('search_index_rowid', '0')",
+        f"CREATE TRIGGER IF NOT EXISTS awemes_fts_ai AFTER INSERT ON awemes"
+        f" WHEN {_FTS_INDEXED.format(id='new.id')} BEGIN {_FTS_INSERT} END",
+        f"CREATE TRIGGER IF NOT EXISTS awemes_fts_ad AFTER DELETE ON awemes"
+        f" WHEN {_FTS_INDEXED.format(id='old.id')} BEGIN {_FTS_DELETE} END",
+        f"CREATE TRIGGER IF NOT EXISTS awemes_fts_au AFTER UPDATE OF \"desc\" ON awemes"
+        f" WHEN {_FTS_INDEXED.format(id='old.id')} BEGIN {_FTS_DELETE} {_FTS_INSERT} END",
+    ],
+    # 4: 作者资料的抓取时间，旧记录为空，首次访问时重新抓取
+    [
+        "ALTER TABLE users ADD COLUMN profile_fetched_at INTEGER",
+    ],
+    # 5: 增量同步水位，旧库按已有作品的最新时间初始化（与之前的增量逻辑一致）
+    [
+        "ALTER TABLE users ADD COLUMN sync_watermark INTEGER",
+        "UPDATE users SET sync_watermark = (SELECT MAX(create_time) FROM awemes WHERE awemes.uid = users.uid)"
+        " WHERE sync_watermark IS NULL",
+    ],
+    # 6: 分页改按 coalesce(create_time, 0) 排序，create_time 为空的作品也能翻到，排序索引随之换成表达式索引
+    [
+        "DROP INDEX IF EXISTS ix_awemes_uid_create_time",
+        "DROP INDEX IF EXISTS ix_awemes_create_time",
+        "DROP INDEX IF EXISTS ix_awemes_platform_create_time",
+        "CREATE INDEX IF NOT EXISTS ix_awemes_sort_time ON awemes (coalesce(create_time, 0))",
+        "CREATE INDEX IF NOT EXISTS ix_awemes_uid_sort_time ON awemes (uid, coalesce(create_time, 0))",
+        "CREATE INDEX IF NOT EXISTS ix_awemes_platform_sort_time ON awemes (platform, coalesce(create_time, 0))",
+    ],
+    # 7: 媒体文件的 stat 签名，旧记录为空，首次使用时重新校验哈希并补上
+    [
+        "ALTER TABLE media_files ADD COLUMN mtime_ns INTEGER",
+        "ALTER TABLE media_files ADD COLUMN inode INTEGER",
+    ],
+]
+
+
+def run_migrations():
+    """
+    执行尚未应用的迁移
+    """
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for index, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+            for sql in statements:
+                try:
+                    conn.exec_driver_sql(sql)
+                except OperationalError as e:
+                    # 新库由 create_all 直接建出最新结构，ADD COLUMN 会报列已存在
+                    if "duplicate column name" not in str(e):
+                        raise
+            conn.exec_driver_sql(f"PRAGMA user_version = {index}")
+            logger.info(f"数据库迁移完成: v{index}")
+        if version < len(MIGRATIONS):
+            conn.exec_driver_sql("ANALYZE")
+
+
+run_migrations()
+
+
 # ----------------------------
 # Session 管理器
 # ----------------------------
@@ -124,25 +344,40 @@ def get_session() -> Generator[Session, None, None]:
 # ----------------------------
 # 增量插入
 # ----------------------------
-def add_aweme(session: Session, item: dict):
-    """
-    插入一条 aweme 数据，如果 aweme_id 已存在自动跳过
-    """
-    exists = session.query(Aweme).filter_by(aweme_id=item["aweme_id"]).first()
-    if exists:
-        return  # 已存在，跳过
-    aweme = Aweme(
-        aweme_id=item["aweme_id"],
-        desc=item.get("desc", ""),
-        share_url=item.get("share_url", ""),
-        nickname=item.get("nickname", ""),
-        uid=item.get("uid", ""),
-        create_time=item.get("create_time", 0),
-        aweme_type=item.get("aweme_type", 0),
-        platform=item.get("platform", "douyin")
-    )
-    session.add(aweme)
-    session.commit()
+# 批量写入时每批的行数（SQLite 单条语句的绑定参数数量有限）
+INGEST_BATCH_SIZE = 500
+
+
+def add_awemes(session: Session, items: list[dict], batch_size: int = INGEST_BATCH_SIZE) -> list[str]:
+    """
+    批量插入 aweme 数据，使用 INSERT ... ON CONFLICT DO NOTHING 跳过已存在的 aweme_id
+    每批提交一次，返回实际插入的 aweme_id 列表
+    """
+    inserted = []
+    for start in range(0, len(items), batch_size):
+        rows = [
+            {
+                "aweme_id": item["aweme_id"],
+                "desc": item.get("desc", ""),
+                "share_url": item.get("share_url", ""),
+                "nickname": item.get("nickname", ""),
+                "uid": item.get("uid", ""),
+                "create_time": item.get("create_time", 0),
+                "aweme_type": item.get("aweme_type", 0),
+                "platform": item.get("platform", "douyin"),
+                "downloaded": False,
+            }
+            for item in items[start:start + batch_size]
+        ]
+        stmt = (
+            sqlite_insert(Aweme)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=["aweme_id"])
+            .returning(Aweme.aweme_id)
+        )
+        inserted += session.execute(stmt).scalars().all()
+        session.commit()
+    return inserted
 
 
 def add_or_update_user(session: Session, user_data: dict):
@@ -169,16 +404,34 @@ def add_or_update_user(session: Session, user_data: dict):
         user.signature = user_data["signature"]
     if user_data.get("platform"):
         user.platform = user_data["platform"]
+    # 只有资料来自上游（而不是缓存）时调用方才会传入
+    if user_data.get("profile_fetched_at"):
+        user.profile_fetched_at = user_data["profile_fetched_at"]
 
     user.updated_at = int(time.time())
     session.commit()
 
 
-def get_all_users(session: Session):
+def get_user_by_sec_user_id(session: Session, sec_user_id: str, platform: str = None):
+    query = session.query(User).filter_by(sec_user_id=sec_user_id)
+    if platform:
+        query = query.filter_by(platform=platform)
+    return query.first()
+
+
+def list_users(session: Session, limit: int, after_id: int = None, platform: str = None, auto_update: bool = None):
     """
-    获取所有作者信息
+    按 id 升序分页获取作者，after_id 为上一页最后一行的 id
+    多取一行用于判断是否还有下一页
     """
-    return session.query(User).all()
+    query = session.query(User)
+    if platform:
+        query = query.filter(User.platform == platform)
+    if auto_update is not None:
+        query = query.filter(User.auto_update == auto_update)
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    return query.order_by(User.id).limit(limit + 1).all()
 
 
 def toggle_user_auto_update(session: Session, uid: str, enabled: bool):
@@ -209,6 +462,7 @@ def delete_user_data(session: Session, uid: str):
     # 2. 删除用户信息
     session.query(User).filter_by(uid=uid).delete()
     session.commit()
+    _user_pref_cache.pop(uid, None)
     return True
 
 
@@ -222,48 +476,27 @@ def create_task(session: Session, task_id: str, target_id: str):
     return task
 
 
-def update_task_progress(session: Session, task_id: str, progress: int, status: str = "running", message: str = None, target_id: str = None):
-    """
-    更新任务进度
-    """
-    task = session.query(Task).filter_by(id=task_id).first()
-    if task:
-        task.progress = progress
-        task.status = status
-        if message:
-            task.message = message
-        if target_id:
-            task.target_id = target_id
-        task.updated_at = int(time.time())
-        session.commit()
-        return True
-    return False
-
-
-def get_active_tasks_by_targets(session: Session, target_ids: list[str]):
-    """
-    获取指定目标列表的活跃任务（running）
-    """
-    return session.query(Task).filter(
-        Task.target_id.in_(target_ids),
-        Task.status == "running"
-    ).all()
-
-
-def get_all_active_tasks(session: Session):
+def save_task_states(session: Session, states: list[dict]):
     """
-    获取所有活跃任务
+    批量写回任务状态（按主键更新），一次提交
     """
-    return session.query(Task).filter(Task.status == "running").all()
+    if not states:
+        return
+    session.execute(update(Task), states)
+    session.commit()
 
 
-def mark_interrupted_tasks_as_failed(session: Session):
+def mark_interrupted_tasks_as_failed(session: Session, exclude_ids: list[str] = None):
     """
     在启动时调用，将所有处于 running 或 pending 状态的任务标记为失败（中断）
+    exclude_ids 中的任务会由任务队列恢复执行，不做处理
     """
-    stale_tasks = session.query(Task).filter(
+    query = session.query(Task).filter(
         Task.status.in_(["running", "pending"])
-    ).all()
+    )
+    if exclude_ids:
+        query = query.filter(Task.id.notin_(exclude_ids))
+    stale_tasks = query.all()
     
     if stale_tasks:
         logger.info(f"清理遗留任务，共发现 {len(stale_tasks)} 个中断的任务")
@@ -275,13 +508,509 @@ def mark_interrupted_tasks_as_failed(session: Session):
 
 
 # ----------------------------
-# 查询示例：按作者获取作品
+# 持久化任务队列
 # ----------------------------
-def get_awemes_by_author(session: Session, nickname: str):
+def enqueue_job(session: Session, kind: str, payload: str, task_id: str = None, max_attempts: int = 3) -> int:
+    job = Job(kind=kind, payload=payload, task_id=task_id, max_attempts=max_attempts)
+    session.add(job)
+    session.commit()
+    return job.id
+
+
+def find_pending_job(session: Session, kind: str, payload: str = None):
+    """
+    查找指定类型尚未完成（排队或执行中）的任务，给出 payload 时只匹配参数相同的任务
+    """
+    query = session.query(Job).filter(Job.kind == kind, Job.status.in_(["queued", "leased"]))
+    if payload is not None:
+        query = query.filter(Job.payload == payload)
+    return query.first()
+
+
+def lease_job(session: Session, owner: str, lease_seconds: int):
+    """
+    原子地领取一个可执行的任务：排队中且已到重试时间，或租约已过期（持有者已失联）
+    返回 (id, kind, payload, task_id, attempts, max_attempts) 或 None
     """
-    查询指定作者的作品，按 create_time 降序排列
+    now = int(time.time())
+    row = session.execute(
+        text(
+            """
+            UPDATE jobs
+            SET status = 'leased', attempts = attempts + 1, lease_owner = :owner,
+                lease_until = :until, heartbeat_at = :now, updated_at = :now
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE (status = 'queued' AND run_after <= :now)
+                   OR (status = 'leased' AND lease_until < :now)
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, kind, payload, task_id, attempts, max_attempts
+            """
+        ),
+        {"owner": owner, "until": now + lease_seconds, "now": now},
+    ).first()
+    session.commit()
+    return tuple(row) if row else None
+
+
+def heartbeat_jobs(session: Session, job_ids: list[int], owner: str, lease_seconds: int):
+    """
+    为执行中的任务续租
+    """
+    if not job_ids:
+        return
+    now = int(time.time())
+    session.query(Job).filter(Job.id.in_(job_ids), Job.lease_owner == owner, Job.status == "leased").update(
+        {"lease_until": now + lease_seconds, "heartbeat_at": now}, synchronize_session=False
+    )
+    session.commit()
+
+
+def _leased_job(session: Session, job_id: int, owner: str = None):
+    """
+    owner 非空时只匹配仍由 owner 持有租约的任务：租约过期后任务可能已被其它 worker 重新领取，
+    原持有者此时写回的结果会覆盖新执行的状态
+    """
+    query = session.query(Job).filter_by(id=job_id)
+    if owner is not None:
+        query = query.filter_by(lease_owner=owner, status="leased")
+    return query
+
+
+def complete_job(session: Session, job_id: int, owner: str = None) -> bool:
     """
-    return session.query(Aweme).filter_by(nickname=nickname).order_by(Aweme.create_time.desc()).all()
+    标记任务完成，返回是否写入（租约已失效时为 False）
+    """
+    updated = _leased_job(session, job_id, owner).update(
+        {"status": "done", "lease_owner": None, "lease_until": None, "updated_at": int(time.time())},
+        synchronize_session=False,
+    )
+    session.commit()
+    return bool(updated)
+
+
+def fail_job(session: Session, job_id: int, error: str, retry_delay: int = None, owner: str = None) -> Optional[str]:
+    """
+    记录任务失败：retry_delay 为 None 时进入死信 (dead)，否则延迟后重新排队
+    返回新的状态，租约已失效时返回 None
+    """
+    now = int(time.time())
+    status = "dead" if retry_delay is None else "queued"
+    updated = _leased_job(session, job_id, owner).update(
+        {
+            "status": status,
+            "last_error": error,
+            "run_after": now + (retry_delay or 0),
+            "lease_owner": None,
+            "lease_until": None,
+            "updated_at": now,
+        },
+        synchronize_session=False,
+    )
+    session.commit()
+    return status if updated else None
+
+
+def defer_job(session: Session, job_id: int, error: str, delay: int, owner: str = None) -> bool:
+    """
+    延迟重新排队且不计入失败次数（上游断路时任务本身并未执行），退还领取时计入的尝试次数
+    返回是否写入（租约已失效时为 False）
+    """
+    now = int(time.time())
+    updated = _leased_job(session, job_id, owner).update(
+        {
+            "status": "queued",
+            "attempts": func.max(Job.attempts - 1, 0),
+            "last_error": error,
+            "run_after": now + delay,
+            "lease_owner": None,
+            "lease_until": None,
+            "updated_at": now,
+        },
+        synchronize_session=False,
+    )
+    session.commit()
+    return bool(updated)
+
+
+def requeue_leased_jobs(session: Session) -> list:
+    """
+    启动时调用：将上次运行遗留的执行中任务重新排队，返回被恢复的任务
+    被重启打断的执行不算一次失败，退还领取时计入的尝试次数，避免连续重启把正常任务推进死信
+    """
+    jobs = session.query(Job).filter(Job.status.in_(["queued", "leased"])).all()
+    for job in jobs:
+        if job.status == "leased":
+            job.attempts = max((job.attempts or 0) - 1, 0)
+            job.status = "queued"
+            job.lease_owner = None
+            job.lease_until = None
+            job.updated_at = int(time.time())
+    session.commit()
+    return jobs
+
+
+def requeue_dead_job(session: Session, job_id: int) -> Optional[Job]:
+    """
+    将死信任务重新排队并清零尝试次数，任务不存在或不是死信时返回 None
+    """
+    job = session.query(Job).filter_by(id=job_id, status="dead").first()
+    if not job:
+        return None
+    now = int(time.time())
+    job.status = "queued"
+    job.attempts = 0
+    job.run_after = now
+    job.updated_at = now
+    session.commit()
+    return job
+
+
+def get_jobs(session: Session, status: str = None, limit: int = 100):
+    """
+    按 id 倒序列出任务，可按状态过滤（如 dead 查看死信）
+    """
+    query = session.query(Job)
+    if status:
+        query = query.filter_by(status=status)
+    return query.order_by(Job.id.desc()).limit(limit).all()
+
+
+# ----------------------------
+# 断点续传记录
+# ----------------------------
+def get_partial_download(session: Session, aweme_id: str):
+    return session.query(PartialDownload).filter_by(aweme_id=aweme_id).first()
+
+
+def save_partial_download(session: Session, aweme_id: str, path: str, offset: int, total: int = None, validator: str = None):
+    """
+    记录未完成下载的 .part 文件及已写入的字节数
+    """
+    record = get_partial_download(session, aweme_id)
+    if not record:
+        record = PartialDownload(aweme_id=aweme_id)
+        session.add(record)
+    record.path = path
+    record.offset = offset
+    record.total = total
+    record.validator = validator
+    record.updated_at = int(time.time())
+    session.commit()
+
+
+def clear_partial_download(session: Session, aweme_id: str):
+    session.query(PartialDownload).filter_by(aweme_id=aweme_id).delete()
+    session.commit()
+
+
+# ----------------------------
+# 媒体文件内容索引
+# ----------------------------
+def save_media_file(
+    session: Session, aweme_id: str, path: str, sha256: str, size: int, member: str = None,
+    mtime_ns: int = None, inode: int = None,
+):
+    """
+    记录（或覆盖）某个路径上文件的内容哈希及其 stat 签名
+    """
+    stmt = sqlite_insert(MediaFile).values(
+        path=path, aweme_id=aweme_id, member=member, sha256=sha256, size=size,
+        mtime_ns=mtime_ns, inode=inode, created_at=int(time.time()),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["path"],
+        set_={
+            "aweme_id": stmt.excluded.aweme_id,
+            "member": stmt.excluded.member,
+            "sha256": stmt.excluded.sha256,
+            "size": stmt.excluded.size,
+            "mtime_ns": stmt.excluded.mtime_ns,
+            "inode": stmt.excluded.inode,
+        },
+    )
+    session.execute(stmt)
+    session.commit()
+
+
+def update_media_signature(session: Session, path: str, mtime_ns: int, inode: int):
+    """
+    重新校验哈希通过后更新文件的 stat 签名
+    """
+    session.query(MediaFile).filter_by(path=path).update(
+        {"mtime_ns": mtime_ns, "inode": inode}, synchronize_session=False
+    )
+    session.commit()
+
+
+def find_media_by_hash(session: Session, sha256: str, size: int):
+    return session.query(MediaFile).filter_by(sha256=sha256, size=size).all()
+
+
+def get_media_files_by_aweme(session: Session, aweme_id: str):
+    return session.query(MediaFile).filter_by(aweme_id=aweme_id).all()
+
+
+def delete_media_files(session: Session, paths: list[str]):
+    if not paths:
+        return
+    session.query(MediaFile).filter(MediaFile.path.in_(paths)).delete(synchronize_session=False)
+    session.commit()
+
+
+def get_media_file_index(session: Session) -> dict[str, str]:
+    """
+    返回 {相对路径: aweme_id}
+    """
+    return {path: aweme_id for path, aweme_id in session.query(MediaFile.path, MediaFile.aweme_id)}
+
+
+# ----------------------------
+# 文件系统对账
+# ----------------------------
+def get_scanned_dirs(session: Session) -> dict[str, tuple[int, str, str]]:
+    """
+    返回 {相对路径: (mtime_ns, subdirs_json, files_json)}
+    """
+    return {
+        row.path: (row.mtime_ns, row.subdirs, row.files)
+        for row in session.query(ScannedDir)
+    }
+
+
+def save_scanned_dirs(session: Session, changed: list[dict], removed: list[str], batch_size: int = INGEST_BATCH_SIZE):
+    """
+    批量写入有变化的目录缓存并删除已不存在的目录，单次提交
+    """
+    for i in range(0, len(changed), batch_size):
+        stmt = sqlite_insert(ScannedDir).values(changed[i:i + batch_size])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["path"],
+            set_={"mtime_ns": stmt.excluded.mtime_ns, "subdirs": stmt.excluded.subdirs, "files": stmt.excluded.files},
+        )
+        session.execute(stmt)
+    for i in range(0, len(removed), batch_size):
+        session.query(ScannedDir).filter(ScannedDir.path.in_(removed[i:i + batch_size])).delete(synchronize_session=False)
+    session.commit()
+
+
+def get_aweme_file_info(session: Session):
+    """
+    对账所需的作品字段：(aweme_id, uid, nickname, desc, aweme_type, downloaded)
+    """
+    return session.query(
+        Aweme.aweme_id, Aweme.uid, Aweme.nickname, Aweme.desc, Aweme.aweme_type, Aweme.downloaded
+    ).all()
+
+
+def set_downloaded_flags(session: Session, mark_true: list[str], mark_false: list[str], batch_size: int = INGEST_BATCH_SIZE):
+    """
+    在一个事务内批量更新 downloaded 标记
+    """
+    for ids, value in ((mark_true, True), (mark_false, False)):
+        for i in range(0, len(ids), batch_size):
+            session.execute(
+                update(Aweme).where(Aweme.aweme_id.in_(ids[i:i + batch_size])).values(downloaded=value)
+            )
+    session.commit()
+
+
+# ----------------------------
+# 持久化缓存
+# ----------------------------
+def get_cache_entry(session: Session, namespace: str, key: str) -> Optional[CacheEntry]:
+    """
+    读取未过期的缓存条目
+    """
+    return session.query(CacheEntry).filter(
+        CacheEntry.namespace == namespace,
+        CacheEntry.key == key,
+        CacheEntry.expires_at > int(time.time()),
+    ).first()
+
+
+def save_cache_entry(session: Session, namespace: str, key: str, value: str, expires_at: int):
+    stmt = sqlite_insert(CacheEntry).values(namespace=namespace, key=key, value=value, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["namespace", "key"],
+        set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+    )
+    session.execute(stmt)
+    session.commit()
+
+
+def purge_expired_cache_entries(session: Session) -> int:
+    deleted = session.query(CacheEntry).filter(CacheEntry.expires_at <= int(time.time())).delete()
+    session.commit()
+    return deleted
+
+
+# ----------------------------
+# 作品列表：按 (create_time, id) 降序的游标分页
+# ----------------------------
+def list_awemes(
+    session: Session,
+    limit: int,
+    before: tuple[int, int] = None,
+    uid: str = None,
+    platform: str = None,
+    downloaded: bool = None,
+    aweme_type: int = None,
+    start_time: int = None,
+    end_time: int = None,
+):
+    """
+    分页查询作品，按 create_time 降序（为空时按 0）、同一时间按 id 降序
+    before 为上一页最后一行的 (create_time, id)，只返回排在它之后的行，翻页代价与页码无关
+    多取一行用于判断是否还有下一页
+    """
+    query = session.query(Aweme)
+    if uid:
+        query = query.filter(Aweme.uid == uid)
+    if platform:
+        query = query.filter(Aweme.platform == platform)
+    if downloaded is not None:
+        query = query.filter(Aweme.downloaded == downloaded)
+    if aweme_type is not None:
+        query = query.filter(Aweme.aweme_type == aweme_type)
+    if start_time is not None:
+        query = query.filter(AWEME_SORT_TIME >= start_time)
+    if end_time is not None:
+        query = query.filter(AWEME_SORT_TIME < end_time)
+    if before is not None:
+        query = query.filter(tuple_(AWEME_SORT_TIME, Aweme.id) < before)
+    return query.order_by(AWEME_SORT_TIME.desc(), Aweme.id.desc()).limit(limit + 1).all()
+
+
+# ----------------------------
+# 全文搜索
+# ----------------------------
+# 每批补建的行数，每批一个事务，避免长时间占用写锁
+SEARCH_BACKFILL_BATCH_SIZE = 5000
+# trigram 分词下短于 3 个字符的词无法走索引
+SEARCH_MIN_TERM_LENGTH = 3
+# 命中过多时只对最近入库的这些结果计算 bm25，避免常见词对几十万行逐一打分
+SEARCH_MAX_CANDIDATES = 1000
+# 补建与重置需串行执行，否则并发的补建任务可能读到相同的进度而重复写入
+_search_index_lock = threading.Lock()
+
+
+def get_search_index_status(session: Session) -> dict:
+    """
+    返回全文索引的补建进度
+    """
+    indexed = int(get_config(session, "search_index_rowid", "0"))
+    target = int(get_config(session, "search_index_target", "0"))
+    return {"indexed_upto": indexed, "target": target, "pending": indexed < target}
+
+
+def backfill_search_index(session: Session, batch_size: int = SEARCH_BACKFILL_BATCH_SIZE) -> dict:
+    """
+    补建一批存量作品的全文索引，并在同一事务内推进 search_index_rowid
+    返回补建后的进度，pending 为 False 时表示已完成
+    """
+    with _search_index_lock:
+        status = get_search_index_status(session)
+        if not status["pending"]:
+            return status
+        upto = min(status["indexed_upto"] + batch_size, status["target"])
+        session.execute(
+            text(
+                "INSERT INTO awemes_fts (rowid, \"desc\") SELECT id, \"desc\" FROM awemes"
+                " WHERE id > :start AND id <= :upto"
+            ),
+            {"start": status["indexed_upto"], "upto": upto},
+        )
+        set_config(session, "search_index_rowid", str(upto))
+        return get_search_index_status(session)
+
+
+def reset_search_index(session: Session):
+    """
+    清空全文索引并把所有存量作品标记为待补建，用于索引损坏或分词规则变化后重建
+    """
+    with _search_index_lock:
+        session.execute(text("INSERT INTO awemes_fts (awemes_fts) VALUES ('delete-all')"))
+        target = session.execute(text("SELECT COALESCE(MAX(id), 0) FROM awemes")).scalar()
+        session.execute(
+            text("INSERT OR REPLACE INTO configs (key, value) VALUES ('search_index_target', :target), ('search_index_rowid', '0')"),
+            {"target": str(target)},
+        )
+        session.commit()
+        invalidate_config_cache()
+
+
+def _highlight(snippet: Optional[str]) -> Optional[str]:
+    """
+    描述来自上游、不可信：snippet() 先用控制字符标记命中位置，转义后再换成 <mark>
+    """
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace("\x02", "<mark>").replace("\x03", "</mark>")
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_awemes(session: Session, query: str, limit: int, offset: int = 0, uid: str = None, platform: str = None) -> tuple[list[dict], bool]:
+    """
+    按描述搜索作品，空白分隔的多个词取交集
+    长度 >= 3 的词走 FTS5 索引并按 bm25 排序，返回 HTML 转义后、用 <mark> 标出命中词的摘要；
+    命中超过 SEARCH_MAX_CANDIDATES 条时只在最近入库的部分中排序
+    全部是短词时只能 LIKE 扫描，沿发布时间索引从新到旧过滤，凑够一页即停止
+    返回 (结果, 是否因命中过多只排序了最近入库的部分)
+    """
+    terms = query.split()
+    long_terms = [t for t in terms if len(t) >= SEARCH_MIN_TERM_LENGTH]
+    short_terms = [t for t in terms if len(t) < SEARCH_MIN_TERM_LENGTH]
+
+    params = {"limit": limit, "offset": offset}
+    where = []
+    if uid:
+        where.append("a.uid = :uid")
+        params["uid"] = uid
+    if platform:
+        where.append("a.platform = :platform")
+        params["platform"] = platform
+    for i, term in enumerate(short_terms):
+        where.append(f"a.\"desc\" LIKE :like{i} ESCAPE '\\'")
+        params[f"like{i}"] = f"%{_escape_like(term)}%"
+
+    columns = "a.aweme_id, a.uid, a.nickname, a.\"desc\", a.share_url, a.create_time, a.aweme_type, a.platform, a.downloaded"
+    if long_terms:
+        # 每个词作为短语引用，避免用户输入被解析成 FTS5 查询语法
+        params["match"] = " ".join('"' + t.replace('"', '""') + '"' for t in long_terms)
+        matched = (
+            " FROM awemes_fts JOIN awemes a ON a.id = awemes_fts.rowid"
+            " WHERE awemes_fts MATCH :match" + "".join(f" AND {w}" for w in where)
+        )
+        # 按 rowid 倒序找到第 N 个命中，只对其后的结果排序；FTS5 按 rowid 遍历很快
+        cutoff = session.execute(
+            text(f"SELECT awemes_fts.rowid{matched} ORDER BY awemes_fts.rowid DESC LIMIT 1 OFFSET :cap"),
+            {**params, "cap": SEARCH_MAX_CANDIDATES - 1},
+        ).scalar()
+        truncated = cutoff is not None
+        if truncated:
+            matched += " AND awemes_fts.rowid >= :cutoff"
+            params["cutoff"] = cutoff
+        sql = (
+            f"SELECT {columns}, snippet(awemes_fts, 0, char(2), char(3), '…', 16) AS snippet"
+            f"{matched} ORDER BY bm25(awemes_fts) LIMIT :limit OFFSET :offset"
+        )
+    else:
+        sql = (
+            f"SELECT {columns}, a.\"desc\" AS snippet FROM awemes a"
+            + (" WHERE " + " AND ".join(where) if where else "") +
+            " ORDER BY coalesce(a.create_time, 0) DESC, a.id DESC LIMIT :limit OFFSET :offset"
+        )
+        truncated = False
+    rows = [dict(row) for row in session.execute(text(sql), params).mappings()]
+    for row in rows:
+        row["snippet"] = _highlight(row["snippet"])
+    return rows, truncated
+
 
 def mark_downloaded(session, aweme_id: str):
     aweme = session.query(Aweme).filter_by(aweme_id=aweme_id).first()
@@ -295,6 +1024,14 @@ def get_undownloaded_awemes_by_uid(session: Session, uid: str):
     """
     return session.query(Aweme).filter_by(uid=uid, downloaded=False).all()
 
+def get_undownloaded_awemes_by_ids(session: Session, aweme_ids: list[str]):
+    """
+    按 aweme_id 查询未下载作品（用于刚入库的一页作品）
+    """
+    if not aweme_ids:
+        return []
+    return session.query(Aweme).filter(Aweme.aweme_id.in_(aweme_ids), Aweme.downloaded == False).all()
+
 def get_undownloaded_awemes(session: Session):
     """
     查询所有未下载的作品
@@ -302,37 +1039,61 @@ def get_undownloaded_awemes(session: Session):
     return session.query(Aweme).filter_by(downloaded=False).all()
 
 
-def get_latest_create_time(session: Session, uid: str) -> int:
+def get_sync_watermark(session: Session, uid: str) -> int:
     """
-    查询指定作者 uid 的最新 create_time
-    返回 0 如果没有作品
+    查询指定作者 uid 的增量同步水位，从未完整同步过时返回 0
     """
-    aweme = (
-        session.query(Aweme)
-        .filter_by(uid=uid)
-        .order_by(Aweme.create_time.desc())
-        .first()
-    )
-    if aweme:
-        return aweme.create_time
-    return 0
+    user = session.query(User).filter_by(uid=uid).first()
+    return (user.sync_watermark or 0) if user else 0
+
+
+def set_sync_watermark(session: Session, uid: str, create_time: int):
+    """
+    翻页全部成功后推进增量同步水位，只增不减
+    """
+    user = session.query(User).filter_by(uid=uid).first()
+    if user and create_time > (user.sync_watermark or 0):
+        user.sync_watermark = create_time
+        session.commit()
 
 
 # ----------------------------
 # 配置与账户管理
 # ----------------------------
+# 进程内配置缓存：所有写入都经过 set_config，因此缓存与数据库保持一致
+# 不存在的 key 以 None 缓存，避免反复查询
+_config_cache: dict[str, Optional[str]] = {}
+_config_lock = threading.Lock()
+
+
 def get_config(session: Session, key: str, default: str = None) -> str:
-    conf = session.query(Config).filter_by(key=key).first()
-    return conf.value if conf else default
+    if key in _config_cache:
+        value = _config_cache[key]
+    else:
+        with _config_lock:
+            conf = session.query(Config).filter_by(key=key).first()
+            value = conf.value if conf else None
+            _config_cache[key] = value
+    return value if value is not None else default
 
 
 def set_config(session: Session, key: str, value: str):
-    conf = session.query(Config).filter_by(key=key).first()
-    if not conf:
-        conf = Config(key=key)
-        session.add(conf)
-    conf.value = value
-    session.commit()
+    with _config_lock:
+        conf = session.query(Config).filter_by(key=key).first()
+        if not conf:
+            conf = Config(key=key)
+            session.add(conf)
+        conf.value = value
+        session.commit()
+        _config_cache[key] = value
+
+
+def invalidate_config_cache():
+    """
+    清空配置缓存（绕过 set_config 直接修改数据库后调用）
+    """
+    with _config_lock:
+        _config_cache.clear()
 
 
 def get_account(session: Session, username: str):
@@ -355,6 +1116,22 @@ def update_account_password(session: Session, username: str, new_password_hash:
     return False
 
 
+# 用户下载偏好缓存: uid -> (download_video_override, download_note_override)
+_user_pref_cache: dict[str, tuple[Optional[bool], Optional[bool]]] = {}
+
+
+def get_user_download_prefs(session: Session, uid: str) -> tuple[Optional[bool], Optional[bool]]:
+    """
+    获取用户的下载偏好覆盖 (视频, 图文)，None 表示跟随全局设定
+    """
+    prefs = _user_pref_cache.get(uid)
+    if prefs is None:
+        user = session.query(User).filter_by(uid=uid).first()
+        prefs = (user.download_video_override, user.download_note_override) if user else (None, None)
+        _user_pref_cache[uid] = prefs
+    return prefs
+
+
 def update_user_preference(session: Session, uid: str, video_pref: bool = None, note_pref: bool = None):
     user = session.query(User).filter_by(uid=uid).first()
     if user:
@@ -363,6 +1140,7 @@ def update_user_preference(session: Session, uid: str, video_pref: bool = None,
         user.download_note_override = note_pref
         user.updated_at = int(time.time())
         session.commit()
+        _user_pref_cache[uid] = (video_pref, note_pref)
         return True
     return False
 
@@ -375,6 +1153,10 @@ def init_defaults(session: Session):
         set_config(session, "download_note", "true")
     if not get_config(session, "auto_update_interval"):
         set_config(session, "auto_update_interval", "120")
+    if not get_config(session, "download_workers"):
+        set_config(session, "download_workers", "3")
+    if not get_config(session, "job_workers"):
+        set_config(session, "job_workers", "4")
     
     # 初始化默认管理员 (如果不存在任何账户)
     if session.query(Account).count() == 0:
@@ -0,0 +1,210 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from loguru import logger
+from db import (
+    get_session,
+    save_media_file,
+    update_media_signature,
+    find_media_by_hash,
+    get_media_files_by_aweme,
+    delete_media_files,
+)
+
+from config import config
+
+SAVE_DIR = config.SAVE_DIR
+# 计算已有前缀哈希时每次读取的块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _rel(path: str) -> str:
+    return os.path.relpath(path, SAVE_DIR)
+
+
+def _abs(rel: str) -> str:
+    return os.path.join(SAVE_DIR, rel)
+
+
+def hash_prefix(hasher, path: str, length: int):
+    """
+    续传时把 .part 文件中已有的前 length 字节补进哈希，保证最终摘要覆盖完整内容
+    """
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            hasher.update(chunk)
+            remaining -= len(chunk)
+
+
+def _temp_path(dst_path: str) -> str:
+    """
+    与 dst_path 同目录的隐藏临时文件，写完后 os.replace 过去
+    dst_path 可能是与其它目录共享 inode 的硬链接，直接打开写入会连带改写其它副本
+    """
+    head, tail = os.path.split(dst_path)
+    return os.path.join(head, f".{tail}.part")
+
+
+def copy_with_hash(src, dst_path: str, chunk_size: int = HASH_CHUNK_SIZE) -> tuple[str, int]:
+    """
+    从文件对象 src 复制到 dst_path，同时计算 sha256，返回 (摘要, 字节数)
+    先写临时文件再原子替换，不会修改 dst_path 原有的 inode
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    tmp = _temp_path(dst_path)
+    try:
+        with open(tmp, "wb") as dst:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+        os.replace(tmp, dst_path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return hasher.hexdigest(), size
+
+
+def _matches(session, rel: str, sha256: str, size: int, mtime_ns: int = None, inode: int = None) -> bool:
+    """
+    磁盘上的文件是否仍是登记时的内容；文件被改写或截断后不能再作为链接来源
+    stat 签名与登记时一致时直接认为未变化，只有签名变化（或旧记录没有签名）时才重新读取计算哈希
+    """
+    path = _abs(rel)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != size:
+        return False
+    if (st.st_mtime_ns, st.st_ino) == (mtime_ns, inode):
+        return True
+    hasher = hashlib.sha256()
+    hash_prefix(hasher, path, size)
+    if hasher.hexdigest() != sha256:
+        return False
+    update_media_signature(session, rel, st.st_mtime_ns, st.st_ino)
+    return True
+
+
+def _save(session, aweme_id: str, path: str, sha256: str, size: int, member: str = None):
+    """
+    登记 path 的内容哈希，同时记录当前的 stat 签名
+    """
+    st = os.stat(path)
+    save_media_file(session, aweme_id, _rel(path), sha256, size, member, st.st_mtime_ns, st.st_ino)
+
+
+def _same_file(a: str, b: str) -> bool:
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+def _link(src: str, dst: str) -> bool:
+    """
+    用硬链接原子替换 dst，跨文件系统等无法硬链接时返回 False
+    """
+    tmp = f"{dst}.link"
+    try:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        os.link(src, tmp)
+        os.replace(tmp, dst)
+        return True
+    except OSError as e:
+        logger.debug(f"无法创建硬链接 {src} -> {dst}: {e}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+def _link_or_copy(src: str, dst: str):
+    Path(dst).parent.mkdir(parents=True, exist_ok=True)
+    if not _link(src, dst):
+        tmp = _temp_path(dst)
+        shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+
+
+def register_file(aweme_id: str, path: str, sha256: str, size: int, member: str = None):
+    """
+    登记刚写入的文件；若库中已有相同内容的文件，则把 path 替换为指向它的硬链接，只占一份磁盘空间
+    """
+    rel = _rel(path)
+    with next(get_session()) as session:
+        stale = []
+        candidates = [
+            (other.path, other.mtime_ns, other.inode)
+            for other in find_media_by_hash(session, sha256, size) if other.path != rel
+        ]
+        for other_path, mtime_ns, inode in candidates:
+            src = _abs(other_path)
+            if not _matches(session, other_path, sha256, size, mtime_ns, inode):
+                stale.append(other_path)
+                continue
+            if _same_file(src, path) or _link(src, path):
+                logger.info(f"内容重复，已硬链接到现有文件: {rel} -> {other_path}")
+                break
+        delete_media_files(session, stale)
+        _save(session, aweme_id, path, sha256, size, member)
+
+
+def restore_existing(aweme_id: str, parent_path: str, base_filename: str, note_folder: str) -> bool:
+    """
+    该作品的内容已在磁盘上（例如通过分享链接下载过，或作者改名前的旧目录）时，
+    直接硬链接到本次的目标位置，不再请求上游；返回是否已恢复
+    """
+    with next(get_session()) as session:
+        records = [(r.path, r.member, r.sha256, r.size, r.mtime_ns, r.inode) for r in get_media_files_by_aweme(session, aweme_id)]
+        # 文件已删除或内容已变化的记录不能用于恢复
+        missing = [path for path, _, sha256, size, *signature in records if not _matches(session, path, sha256, size, *signature)]
+        if missing:
+            delete_media_files(session, missing)
+    rows = [record[:4] for record in records]
+    all_members = {member for _, member, *_ in rows if member}
+    rows = [row for row in rows if row[0] not in missing]
+    if not rows:
+        return False
+    # 图文任一文件在所有位置都已丢失时，需要重新下载整个压缩包
+    if all_members and {member for _, member, *_ in rows if member} != all_members:
+        return False
+
+    videos = [row for row in rows if row[1] is None]
+    if videos:
+        path, _, sha256, size = videos[0]
+        src = _abs(path)
+        target = os.path.join(parent_path, f"{base_filename}.mp4")
+        if os.path.exists(target) and not _same_file(target, src):
+            target = os.path.join(parent_path, f"{base_filename}_{aweme_id}.mp4")
+        if not _same_file(target, src):
+            _link_or_copy(src, target)
+            logger.info(f"已有相同作品，硬链接到新位置: {path} -> {_rel(target)}")
+        with next(get_session()) as session:
+            _save(session, aweme_id, target, sha256, size)
+        return True
+
+    # 同一图文可能已存在于多个目录，按成员名去重
+    members = {}
+    for path, member, sha256, size in rows:
+        members.setdefault(member, (path, sha256, size))
+    for member, (path, sha256, size) in members.items():
+        src = _abs(path)
+        target = os.path.join(note_folder, member)
+        if not _same_file(target, src):
+            _link_or_copy(src, target)
+        with next(get_session()) as session:
+            _save(session, aweme_id, target, sha256, size, member)
+    logger.info(f"已有相同图文，硬链接 {len(members)} 个文件到: {_rel(note_folder)}")
+    return True
@@ -0,0 +1,200 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Optional
+from loguru import logger
+from sqlalchemy.orm import Session
+from db import get_session, get_config, Aweme
+
+# 全局默认下载并发数，可通过 configs 表的 download_workers 修改
+DEFAULT_DOWNLOAD_WORKERS = 3
+# 并发上限，防止误配置把上游下载接口打满
+MAX_DOWNLOAD_WORKERS = 16
+# 可单独设置下载并发数的平台（configs 中的 download_workers_{platform}）
+DOWNLOAD_PLATFORMS = ("douyin", "tiktok")
+
+
+def get_download_workers(session: Session, platform: str = None) -> int:
+    """
+    读取下载并发数：优先 download_workers_{platform}，其次全局 download_workers
+    """
+    value = get_config(session, f"download_workers_{platform}") if platform else None
+    if not value:
+        value = get_config(session, "download_workers", str(DEFAULT_DOWNLOAD_WORKERS))
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        logger.warning(f"无效的下载并发配置: {value!r}，使用默认值 {DEFAULT_DOWNLOAD_WORKERS}")
+        workers = DEFAULT_DOWNLOAD_WORKERS
+    return max(1, min(workers, MAX_DOWNLOAD_WORKERS))
+
+
+def get_platform_download_workers(session: Session) -> dict[str, Optional[int]]:
+    """
+    各平台单独设置的下载并发数，未设置（跟随全局）为 None
+    """
+    overrides = {}
+    for platform in DOWNLOAD_PLATFORMS:
+        value = get_config(session, f"download_workers_{platform}")
+        overrides[platform] = get_download_workers(session, platform) if value else None
+    return overrides
+
+
+class DownloadSlots:
+    """
+    进程内共享的下载并发位，同一平台的所有下载引擎共用，上限随配置调整
+    """
+
+    def __init__(self, limit: int):
+        self._cond = threading.Condition()
+        self._limit = limit
+        self._active = 0
+
+    def resize(self, limit: int):
+        with self._cond:
+            self._limit = limit
+            self._cond.notify_all()
+
+    @contextmanager
+    def hold(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._active < self._limit)
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify()
+
+
+_slots: dict[str, DownloadSlots] = {}
+_slots_lock = threading.Lock()
+
+
+def get_download_slots(platform: str, workers: int) -> DownloadSlots:
+    """
+    取得平台共享的下载并发位，并按最新配置的并发数调整上限
+    """
+    with _slots_lock:
+        slots = _slots.get(platform)
+        if slots is None:
+            slots = _slots[platform] = DownloadSlots(workers)
+        else:
+            slots.resize(workers)
+        return slots
+
+
+def _run_job(job: Callable[[Session, Any], bool], aweme_id: str, slots: DownloadSlots) -> bool:
+    """
+    在工作线程中执行单个下载任务，每个线程使用独立的数据库会话
+    拿到共享并发位后才开始，多个引擎同时运行时总并发仍不超过配置值
+    """
+    with slots.hold(), next(get_session()) as session:
+        aweme = session.query(Aweme).filter_by(aweme_id=aweme_id).first()
+        if not aweme:
+            return False
+        return job(session, aweme)
+
+
+class DownloadPipeline:
+    """
+    可增量提交的下载引擎：抓取方每拿到一页就 submit，下载与后续翻页并行进行
+    按平台使用独立的线程池，线程池在首次遇到该平台时创建
+    并发上限由同平台的所有引擎共享（见 DownloadSlots），多个用户同时同步时总下载数不超过 download_workers
+    on_progress(done, total, label, success) 只在调用线程（submit/join 内）回调，可安全使用调用方的 session
+    total 为截至当前已提交的数量，会随着提交增长
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        job: Callable[[Session, Any], bool],
+        on_progress: Optional[Callable[[int, int, str, bool], None]] = None,
+    ):
+        self.session = session
+        self.job = job
+        self.on_progress = on_progress
+        self.total = 0
+        self.done = 0
+        self.succeeded = 0
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        self._slots: dict[str, DownloadSlots] = {}
+        self._pending: dict = {}
+
+    def _executor(self, platform: str) -> ThreadPoolExecutor:
+        executor = self._executors.get(platform)
+        if executor is None:
+            workers = get_download_workers(self.session, platform)
+            logger.info(f"[{platform}] 启动下载引擎，并发数 {workers}")
+            executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"dl-{platform}")
+            self._executors[platform] = executor
+            self._slots[platform] = get_download_slots(platform, workers)
+        return executor
+
+    def submit(self, awemes: list) -> int:
+        """
+        提交一批作品，并回报此前已完成的任务，返回本次提交数量
+        """
+        # 在提交前取出需要的字段，避免跨线程访问调用方 session 中的 ORM 对象
+        for aweme in awemes:
+            label = aweme.desc[:20] if aweme.desc else aweme.aweme_id
+            platform = aweme.platform or "douyin"
+            future = self._executor(platform).submit(_run_job, self.job, aweme.aweme_id, self._slots[platform])
+            self._pending[future] = label
+        self.total += len(awemes)
+        self._collect(timeout=0)
+        return len(awemes)
+
+    def join(self) -> int:
+        """
+        等待所有已提交的任务完成，返回成功数量
+        """
+        while self._pending:
+            self._collect(timeout=None)
+        return self.succeeded
+
+    def _collect(self, timeout: Optional[float]):
+        if not self._pending:
+            return
+        finished, _ = wait(self._pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        for future in finished:
+            label = self._pending.pop(future)
+            self.done += 1
+            try:
+                success = future.result()
+            except Exception as e:
+                logger.error(f"下载任务异常: {label} | 错误: {e}")
+                success = False
+            if success:
+                self.succeeded += 1
+            if self.on_progress:
+                self.on_progress(self.done, self.total, label, success)
+
+    def close(self):
+        for executor in self._executors.values():
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_downloads(
+    session: Session,
+    awemes: list,
+    job: Callable[[Session, Any], bool],
+    on_progress: Optional[Callable[[int, int, str, bool], None]] = None,
+) -> int:
+    """
+    按平台分组并发执行下载任务，每个平台使用独立的线程池，并发上限为进程内共享
+    on_progress(done, total, label, success) 在调用线程中回调，可安全使用调用方的 session
+    返回成功数量
+    """
+    if not awemes:
+        return 0
+    with DownloadPipeline(session, job, on_progress) as pipeline:
+        pipeline.submit(awemes)
+        return pipeline.join()
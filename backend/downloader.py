@@ -1,16 +1,32 @@
+import hashlib
 import httpx
 import os
 import re
 import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from loguru import logger
-from utils import sanitize_filename
+from utils import sanitize_filename, sanitize_path_parts
+from http_client import get_client
+from rate_limiter import get_limiter, retry_after_seconds
+from resilience import call_with_retry
+from dedup import hash_prefix, copy_with_hash, register_file, restore_existing
+from db import get_session, get_partial_download, save_partial_download, clear_partial_download
 
 from config import config
 
 SAVE_DIR = config.SAVE_DIR
 DOWNLOAD_API = config.DOWNLOAD_API
 
+# 流式下载时每次写盘的块大小
+CHUNK_SIZE = 1024 * 1024
+# 图文 ZIP 在内存中缓冲的上限，超过后自动落盘到临时文件
+ZIP_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# 图文解压线程数
+EXTRACT_WORKERS = 4
+
 Path(SAVE_DIR).mkdir(parents=True, exist_ok=True)
 
 
@@ -18,17 +34,211 @@ Path(SAVE_DIR).mkdir(parents=True, exist_ok=True)
 
 
 import zipfile
-import io
+
+_extract_pool = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="unzip")
+
+# 每个作品一把锁：同一作品的 .part 文件路径固定，并发下载会互相截断
+# {aweme_id: [锁, 持有或等待的线程数]}，计数归零时移除
+_aweme_locks: dict[str, list] = {}
+_aweme_locks_guard = threading.Lock()
+
+
+class IncompleteDownload(IOError):
+    """响应体短于声明的长度，已写入部分会保留用于续传"""
+
+
+def _preallocate(f, size: int):
+    """
+    根据 Content-Length 预分配磁盘空间，减少碎片，并尽早暴露磁盘空间不足
+    """
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(f.fileno(), 0, size)
+        else:
+            f.truncate(size)
+    except OSError as e:
+        logger.warning(f"预分配磁盘空间失败 ({size} bytes): {e}")
+
+
+def _part_path(parent_path: str, aweme_id: str) -> str:
+    """
+    未完成下载的 .part 文件路径，按 aweme_id 固定，便于下次续传
+    """
+    return os.path.join(parent_path, f".{aweme_id}.mp4.part")
+
+
+def _resume_state(aweme_id: str, part_path: str) -> tuple[int, str | None]:
+    """
+    返回可续传的字节偏移与 If-Range 校验值，没有可用的 .part 文件时返回 (0, None)
+    """
+    with next(get_session()) as session:
+        record = get_partial_download(session, aweme_id)
+        if not record:
+            return 0, None
+        offset, path, validator = record.offset or 0, record.path, record.validator
+    if path != part_path or not os.path.exists(part_path):
+        return 0, None
+    return min(offset, os.path.getsize(part_path)), validator
+
+
+def _save_partial(aweme_id: str, part_path: str, offset: int, total: int | None, validator: str | None):
+    with next(get_session()) as session:
+        save_partial_download(session, aweme_id, part_path, offset, total, validator)
+
+
+def _discard_partial(aweme_id: str, part_path: str):
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    with next(get_session()) as session:
+        clear_partial_download(session, aweme_id)
+
+
+def _content_range(resp: httpx.Response) -> tuple[int | None, int | None]:
+    """
+    解析 206 响应的 Content-Range: bytes start-end/total
+    """
+    match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", resp.headers.get("content-range", ""))
+    if not match:
+        return None, None
+    total = match.group(2)
+    return int(match.group(1)), int(total) if total.isdigit() else None
+
+
+def _validator(resp: httpx.Response) -> str | None:
+    # If-Range 只能使用强 ETag，否则退回 Last-Modified
+    etag = resp.headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return resp.headers.get("last-modified")
+
+
+def _stream_to_file(resp: httpx.Response, part_path: str, file_path: str, aweme_id: str, start: int = 0) -> int:
+    """
+    将响应体按固定大小分块写入 .part 文件（从 start 处续写），校验完整性后原子重命名为 file_path
+    中途失败时保留已写入部分并记录偏移，下次下载通过 Range 续传
+    返回文件总字节数
+    """
+    # 有 content-encoding 时 Content-Length 描述的是压缩后的长度，不能用于预分配和续传
+    encoded = bool(resp.headers.get("content-encoding"))
+    length = resp.headers.get("content-length")
+    length = int(length) if length and length.isdigit() else None
+    if start:
+        total = _content_range(resp)[1]
+    else:
+        total = length if not encoded else None
+    validator = _validator(resp)
+
+    # 边写边计算 sha256，用于内容去重；续传时先补上已有部分
+    hasher = hashlib.sha256()
+    if start:
+        hash_prefix(hasher, part_path, start)
+
+    written = start
+    with open(part_path, "r+b" if start else "wb") as f:
+        f.truncate(start)
+        f.seek(start)
+        if total:
+            _preallocate(f, total)
+        try:
+            for chunk in resp.iter_bytes(CHUNK_SIZE):
+                f.write(chunk)
+                hasher.update(chunk)
+                written += len(chunk)
+        except BaseException:
+            f.truncate(written)
+            if not encoded:
+                _save_partial(aweme_id, part_path, written, total, validator)
+            raise
+        # 预分配时文件可能比实际内容长，按实际写入量截断
+        f.truncate(written)
+
+    # 压缩传输时按网络层收到的字节数校验
+    if encoded:
+        if length is not None and resp.num_bytes_downloaded != length:
+            _discard_partial(aweme_id, part_path)
+            raise IncompleteDownload(f"文件不完整: 期望 {length} bytes，实际收到 {resp.num_bytes_downloaded} bytes")
+    elif total is not None and written != total:
+        if written > total:
+            _discard_partial(aweme_id, part_path)
+        else:
+            _save_partial(aweme_id, part_path, written, total, validator)
+        raise IncompleteDownload(f"文件不完整: 期望 {total} bytes，实际写入 {written} bytes")
+
+    os.replace(part_path, file_path)
+    with next(get_session()) as session:
+        clear_partial_download(session, aweme_id)
+    register_file(aweme_id, file_path, hasher.hexdigest(), written)
+    return written
+
+
+def _member_target(zip_folder: str, name: str) -> str:
+    """
+    计算 ZIP 成员的落盘路径，过滤绝对路径和 .. 以防目录穿越
+    """
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    if not parts:
+        raise ValueError(f"非法的 ZIP 成员名: {name!r}")
+    return os.path.join(zip_folder, *parts)
+
+
+def _extract_member(z: zipfile.ZipFile, member: zipfile.ZipInfo, target: str) -> tuple[str, int]:
+    with z.open(member) as src:
+        return copy_with_hash(src, target, CHUNK_SIZE)
+
+
+def _extract_zip(resp: httpx.Response, zip_folder: str, aweme_id: str) -> int:
+    """
+    将 ZIP 响应流式写入 SpooledTemporaryFile，再逐个成员交给解压线程池写盘
+    解压时同时计算每个文件的 sha256 并登记去重
+    临时归档在退出时自动删除，返回解压出的文件数
+    """
+    with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE, dir=os.path.dirname(zip_folder)) as spool:
+        for chunk in resp.iter_bytes(CHUNK_SIZE):
+            spool.write(chunk)
+        spool.seek(0)
+
+        with zipfile.ZipFile(spool) as z:
+            jobs = []
+            # 目录先串行创建，避免并发解压时 makedirs 竞争
+            for member in z.infolist():
+                target = _member_target(zip_folder, member.filename)
+                if member.is_dir():
+                    Path(target).mkdir(parents=True, exist_ok=True)
+                    continue
+                Path(target).parent.mkdir(parents=True, exist_ok=True)
+                jobs.append((member, target))
+
+            futures = [_extract_pool.submit(_extract_member, z, m, t) for m, t in jobs]
+            results = [future.result() for future in futures]
+
+    for (member, target), (sha256, size) in zip(jobs, results):
+        register_file(aweme_id, target, sha256, size, member=os.path.relpath(target, zip_folder))
+    return len(jobs)
+
 
 def download_video(share_url: str, author_folder: str, filename: str, aweme_id: str) -> bool:
     """
     下载视频并保存到作者文件夹
     如果返回的是 ZIP (图文)，则自动解压到以 filename 命名的文件夹中
     支持多级目录 (如 Author/video)
+    视频以流式分块写入临时文件，完成后原子重命名，内存占用与文件大小无关
+    同一作品的下载串行执行（例如用户同步与全局补漏同时处理到它），后到的一方会直接复用已下载的文件
     """
-    # 将路径按分隔符拆分，分别过滤非法字符后再合并，以保留层级结构
-    path_parts = [sanitize_filename(p) for p in author_folder.replace("\\", "/").split("/") if p]
-    parent_path = os.path.join(SAVE_DIR, *path_parts)
+    with _aweme_locks_guard:
+        entry = _aweme_locks.setdefault(aweme_id, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            return _download_video(share_url, author_folder, filename, aweme_id)
+    finally:
+        with _aweme_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _aweme_locks[aweme_id]
+
+
+def _download_video(share_url: str, author_folder: str, filename: str, aweme_id: str) -> bool:
+    parent_path = os.path.join(SAVE_DIR, *sanitize_path_parts(author_folder))
     Path(parent_path).mkdir(parents=True, exist_ok=True)
 
     params = {
@@ -37,37 +247,80 @@ def download_video(share_url: str, author_folder: str, filename: str, aweme_id:
         "with_watermark": "false"
     }
 
+    # 相同作品已在磁盘上（其它目录或分享链接下载过）时直接硬链接，不再请求上游
+    base_filename = sanitize_filename(filename)
+    if restore_existing(aweme_id, parent_path, base_filename, os.path.join(parent_path, base_filename)):
+        return True
+
+    def fetch(part_path: str, offset: int, validator: str | None) -> bool:
+        """
+        发起一次下载请求，offset 非 0 时带 Range 续传
+        续传偏移已失效（416）时丢弃 .part 文件并返回 False，由调用方从头重新请求
+        """
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if validator:
+                headers["If-Range"] = validator
+
+        # 请求节奏由自适应限速器控制，以响应头到达的耗时衡量上游负载
+        limiter.acquire()
+        start_time = time.monotonic()
+        responded = False
+        try:
+            logger.info(f"发起下载请求: {aweme_id} | URL: {DOWNLOAD_API}" + (f" | 续传自 {offset} bytes" if offset else ""))
+            with get_client().stream("GET", DOWNLOAD_API, params=params, headers=headers, timeout=60) as resp:
+                responded = True
+                limiter.record(resp.status_code, time.monotonic() - start_time, retry_after_seconds(resp.headers))
+                if resp.status_code == 416 and offset:
+                    logger.info(f"续传偏移 {offset} 已失效，重新完整下载: {aweme_id}")
+                    _discard_partial(aweme_id, part_path)
+                    return False
+                resp.raise_for_status()
+                logger.info(f"收到响应: {aweme_id} | Status: {resp.status_code}")
+
+                content_type = resp.headers.get("content-type", "")
+
+                if "application/zip" in content_type or "zip" in resp.headers.get("content-disposition", "").lower():
+                    # 处理 ZIP 压缩包 (图文)
+                    zip_folder = os.path.join(parent_path, sanitize_filename(filename))
+                    Path(zip_folder).mkdir(parents=True, exist_ok=True)
+
+                    count = _extract_zip(resp, zip_folder, aweme_id)
+                    logger.info(f"解压完成: {zip_folder} ({count} 个文件)")
+                else:
+                    # 处理普通视频
+                    base_filename = sanitize_filename(filename)
+                    file_path = os.path.join(parent_path, f"{base_filename}.mp4")
+                    if os.path.exists(file_path):
+                        file_path = os.path.join(parent_path, f"{base_filename}_{aweme_id}.mp4")
+
+                    # 只有 206 且起始位置与本地一致时才续写，否则上游不支持 Range，整体重新下载
+                    start = offset if resp.status_code == 206 and _content_range(resp)[0] == offset else 0
+                    if offset and not start:
+                        logger.info(f"上游未接受续传请求，重新完整下载: {aweme_id}")
+
+                    size = _stream_to_file(resp, part_path, file_path, aweme_id, start)
+                    logger.info(f"下载完成: {file_path} ({size} bytes)" + (f"，其中续传 {size - start} bytes" if start else ""))
+            return True
+        except Exception:
+            if not responded:
+                limiter.record(None, time.monotonic() - start_time)
+            raise
+
+    def attempt():
+        # 存在未完成的 .part 文件时尝试 Range 续传（重试时从上次中断处继续）
+        part_path = _part_path(parent_path, aweme_id)
+        offset, validator = _resume_state(aweme_id, part_path)
+        if not fetch(part_path, offset, validator):
+            # 偏移失效不是上游故障，在本次尝试内直接从头下载，不占用重试次数
+            fetch(part_path, 0, None)
+
+    limiter = get_limiter("download")
     try:
-        with httpx.Client(timeout=60) as client:
-            logger.info(f"发起下载请求: {aweme_id} | URL: {DOWNLOAD_API}")
-            resp = client.get(DOWNLOAD_API, params=params)
-            resp.raise_for_status()
-            logger.info(f"收到响应: {aweme_id} | Status: {resp.status_code}")
-            
-            content_type = resp.headers.get("content-type", "")
-            
-            if "application/zip" in content_type or "zip" in resp.headers.get("content-disposition", "").lower():
-                # 处理 ZIP 压缩包 (图文)
-                zip_folder = os.path.join(parent_path, sanitize_filename(filename))
-                Path(zip_folder).mkdir(parents=True, exist_ok=True)
-                
-                with zipfile.ZipFile(io.BytesIO(resp.content)) as z:
-                    z.extractall(zip_folder)
-                logger.info(f"解压完成: {zip_folder}")
-            else:
-                # 处理普通视频
-                base_filename = sanitize_filename(filename)
-                file_path = os.path.join(parent_path, f"{base_filename}.mp4")
-                if os.path.exists(file_path):
-                    file_path = os.path.join(parent_path, f"{base_filename}_{aweme_id}.mp4")
-                
-                with open(file_path, "wb") as f:
-                    f.write(resp.content)
-                logger.info(f"下载完成: {file_path}")
-                
-        time.sleep(0.3)
+        # 网络错误、429/5xx 和传输中断会退避重试；上游持续故障时断路器直接拒绝，不再占用下载线程
+        call_with_retry("download", attempt, retry_on=(IncompleteDownload,))
         return True
     except Exception as e:
         logger.error(f"处理下载失败: {share_url} | 错误: {e}")
-        time.sleep(0.3)
-        return False
\ No newline at end of file
+        return False
@@ -0,0 +1,84 @@
+import asyncio
+import json
+from typing import Any, AsyncGenerator, Callable, Optional
+from loguru import logger
+
+# SSE 心跳间隔（秒），防止代理断开空闲连接
+HEARTBEAT_INTERVAL = 15
+# 单个订阅者的缓冲事件数，客户端处理不过来时丢弃最旧的事件
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+class EventBroker:
+    """
+    进程内事件广播：后台线程通过 publish 推送状态变化，SSE 连接通过 subscribe 接收
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: set[asyncio.Queue] = set()
+        self._snapshots: dict[str, Callable[[], Any]] = {}
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """
+        绑定应用事件循环，在 startup 时调用
+        """
+        self._loop = loop
+
+    def register_snapshot(self, event: str, provider: Callable[[], Any]):
+        """
+        注册事件的当前状态提供者，新连接建立时先推送一次完整快照
+        """
+        self._snapshots[event] = provider
+
+    def publish(self, event: str, data: Any):
+        """
+        发布事件，可以在任意线程调用；没有订阅者时直接忽略
+        """
+        if self._loop is None or not self._subscribers:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._dispatch, event, data)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    def _dispatch(self, event: str, data: Any):
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait((event, data))
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self) -> AsyncGenerator[str, None]:
+        """
+        生成 SSE 格式的消息流
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        try:
+            for event, provider in self._snapshots.items():
+                try:
+                    yield _format_sse(event, provider())
+                except Exception as e:
+                    logger.error(f"生成 {event} 快照失败: {e}")
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield _format_sse(event, data)
+        finally:
+            self._subscribers.discard(queue)
+
+
+def _format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# 单例
+event_broker = EventBroker()
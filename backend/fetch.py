@@ -1,6 +1,14 @@
+import copy
 import httpx
+import re
 import time
+from urllib.parse import urlparse, parse_qs
 from loguru import logger
+from http_client import get_client
+from rate_limiter import get_limiter, retry_after_seconds
+from resilience import call_with_retry
+from cache import TTLCache, register_cache
+from db import get_session, get_user_by_sec_user_id, add_or_update_user
 
 from config import config
 
@@ -8,6 +16,35 @@ API_URL = config.FETCH_USER_POST_API
 PROFILE_API = config.USER_PROFILE_API
 HYBRID_VIDEO_API = config.VIDEO_DATA_API
 
+# (platform, sec_user_id) -> {"user": {...}}，与 fetch_user_profile 的返回结构一致
+_profile_cache = register_cache(TTLCache("profile", max_size=config.PROFILE_CACHE_SIZE, ttl=config.PROFILE_CACHE_TTL))
+# hybrid video_data 响应，键为 "{full|minimal}:aweme:{aweme_id}" 或 "{full|minimal}:url:{url}"
+_video_cache = register_cache(TTLCache("video", max_size=config.VIDEO_CACHE_SIZE, ttl=config.VIDEO_CACHE_TTL))
+# 直链过期前预留的安全时间（秒），避免拿到即将失效的地址
+PLAY_ADDR_EXPIRY_MARGIN = 60
+
+
+def _upstream_get(endpoint: str, url: str, **kwargs) -> httpx.Response:
+    """
+    请求上游 API：经过端点限速器与断路器，网络错误和 429/5xx 按指数退避重试
+    响应状态与耗时会反馈给限速器，非 2xx 响应抛出 HTTPStatusError
+    """
+    limiter = get_limiter(endpoint)
+
+    def attempt() -> httpx.Response:
+        limiter.acquire()
+        start = time.monotonic()
+        try:
+            resp = get_client().get(url, **kwargs)
+        except httpx.TransportError:
+            limiter.record(None, time.monotonic() - start)
+            raise
+        limiter.record(resp.status_code, time.monotonic() - start, retry_after_seconds(resp.headers))
+        resp.raise_for_status()
+        return resp
+
+    return call_with_retry(endpoint, attempt)
+
 def fetch_user_profile(sec_user_id: str, platform: str = "douyin") -> dict:
     """
     获取用户信息，支持 Douyin 和 TikTok
@@ -23,23 +60,22 @@ def fetch_user_profile(sec_user_id: str, platform: str = "douyin") -> dict:
                 "count": 1,
                 "coverFormat": 2
             }
-            with httpx.Client(timeout=30) as client:
-                resp = client.get(config.TIKTOK_USER_POST_API, params=params, headers=headers)
-                resp.raise_for_status()
-                data = resp.json().get("data", {})
-                item_list = data.get("itemList", [])
-                if item_list:
-                    author = item_list[0].get("author", {})
-                    # 构造与抖音类似的结构供下游使用
-                    return {
-                        "user": {
-                            "uid": author.get("id"), # 使用数字 ID 确保唯一性
-                            "nickname": author.get("nickname"),
-                            "avatar_thumb": {"url_list": [author.get("avatarThumb")]},
-                            "signature": author.get("signature"),
-                            "unique_id": author.get("uniqueId"), # 保存 username 备用
-                        }
+            resp = _upstream_get("tiktok_posts", config.TIKTOK_USER_POST_API, params=params, headers=headers, timeout=30)
+            resp.raise_for_status()
+            data = resp.json().get("data", {})
+            item_list = data.get("itemList", [])
+            if item_list:
+                author = item_list[0].get("author", {})
+                # 构造与抖音类似的结构供下游使用
+                return {
+                    "user": {
+                        "uid": author.get("id"), # 使用数字 ID 确保唯一性
+                        "nickname": author.get("nickname"),
+                        "avatar_thumb": {"url_list": [author.get("avatarThumb")]},
+                        "signature": author.get("signature"),
+                        "unique_id": author.get("uniqueId"), # 保存 username 备用
                     }
+                }
         except httpx.TimeoutException:
             logger.error(f"获取 TikTok 用户信息超时 (sec_user_id: {sec_user_id})")
             raise Exception("获取 TikTok 用户信息超时，请稍后重试")
@@ -49,155 +85,258 @@ def fetch_user_profile(sec_user_id: str, platform: str = "douyin") -> dict:
     
     # 抖音逻辑
     params = {"sec_user_id": sec_user_id}
-    with httpx.Client(timeout=10) as client:
-        resp = client.get(PROFILE_API, params=params, headers=headers)
-        resp.raise_for_status()
-        data = resp.json().get("data", {})
-        return data
+    resp = _upstream_get("user_profile", PROFILE_API, params=params, headers=headers, timeout=10)
+    resp.raise_for_status()
+    data = resp.json().get("data", {})
+    return data
+
+def _profile_key(platform: str, sec_user_id: str) -> str:
+    return f"{platform}:{sec_user_id}"
+
+
+def _author_to_profile(author: dict) -> dict:
+    return {
+        "user": {
+            "uid": author.get("uid"),
+            "nickname": author.get("nickname"),
+            "avatar_thumb": author.get("avatar_thumb"),
+            "signature": author.get("signature"),
+            **({"unique_id": author["unique_id"]} if author.get("unique_id") else {}),
+        }
+    }
+
 
-def fetch_all_awemes(sec_user_id: str, platform: str = "douyin", latest_create_time: int = 0, count: int = 20):
+def cache_author_profile(sec_user_id: str, platform: str, author: dict):
     """
-    抓取用户作品，支持 Douyin 和 TikTok
+    用分页时拿到的作者信息刷新资料缓存（结构同 iter_aweme_pages 产出的 author）
+    """
+    if sec_user_id and author and author.get("uid"):
+        _profile_cache.set(_profile_key(platform, sec_user_id), _author_to_profile(author))
+
+
+def get_user_profile(sec_user_id: str, platform: str = "douyin") -> dict:
+    """
+    获取用户信息，优先使用缓存：
+    1. 进程内缓存（包含分页时见过的作者信息）
+    2. users 表中在 TTL 内从上游抓取过资料的记录（profile_fetched_at）
+    3. 以上都没有或已过期时才调用 fetch_user_profile
+    """
+    key = _profile_key(platform, sec_user_id)
+    # 缓存中的对象是共享的，返回副本，避免调用方修改后影响后续命中
+    profile = _profile_cache.get(key)
+    if profile is not None:
+        return copy.deepcopy(profile)
+
+    with next(get_session()) as session:
+        user = get_user_by_sec_user_id(session, sec_user_id, platform)
+        stored_uid = user.uid if user else None
+        age = time.time() - (user.profile_fetched_at or 0) if user else None
+        if user and user.nickname and age < config.PROFILE_CACHE_TTL:
+            profile = _author_to_profile({
+                "uid": user.uid,
+                "nickname": user.nickname,
+                "avatar_thumb": {"url_list": [user.avatar_url]},
+                "signature": user.signature,
+            })
+            _profile_cache.set(key, profile, ttl=config.PROFILE_CACHE_TTL - age)
+            return copy.deepcopy(profile)
+
+    profile = fetch_user_profile(sec_user_id, platform=platform)
+    author = profile.get("user") if profile else None
+    if author:
+        _profile_cache.set(key, profile)
+        # 已存储的作者顺便刷新资料与抓取时间，重启后仍可在 TTL 内直接使用
+        if stored_uid:
+            avatar = author.get("avatar_thumb")
+            with next(get_session()) as session:
+                add_or_update_user(session, {
+                    "uid": stored_uid,
+                    "nickname": author.get("nickname"),
+                    "avatar_url": avatar.get("url_list", [None])[0] if isinstance(avatar, dict) else avatar,
+                    "signature": author.get("signature"),
+                    "profile_fetched_at": int(time.time()),
+                })
+    return copy.deepcopy(profile)
+
+
+def iter_aweme_pages(sec_user_id: str, platform: str = "douyin", latest_create_time: int = 0, count: int = 20):
+    """
+    按页抓取用户作品，每页产出 {"awemes": [...], "author": {...}}
+    调用方处理当前页时不会发起下一页请求，可在处理期间把下载任务交给后台线程
     """
     if platform == "tiktok":
-        return fetch_tiktok_all_awemes(sec_user_id, latest_create_time, count)
-    
-    # 以下为 Douyin 逻辑 (原逻辑)
+        yield from iter_tiktok_aweme_pages(sec_user_id, latest_create_time, count)
+        return
+
+    # 以下为 Douyin 逻辑
     max_cursor = 0
-    all_awemes = []
-    author_profile = {}
     headers = {"accept": "application/json"}
 
-    with httpx.Client(timeout=10) as client:
-        while True:
-            params = {
-                "sec_user_id": sec_user_id,
-                "max_cursor": max_cursor,
-                "count": count,
-            }
-            resp = client.get(API_URL, params=params, headers=headers)
-            resp.raise_for_status()
-            data = resp.json().get("data", {})
-            aweme_list = data.get("aweme_list", [])
-            if not aweme_list:
-                break
-            
-            page_new_awemes = [item for item in aweme_list if item.get("create_time", 0) > latest_create_time]
-            for item in page_new_awemes:
-                aweme_id = item.get("aweme_id")
-                author = item.get("author", {})
-                all_awemes.append({
-                    "aweme_id": aweme_id,
-                    "desc": item.get("desc", ""),
-                    "share_url": f"https://www.iesdouyin.com/share/video/{aweme_id}",
-                    "nickname": author.get("nickname", ""),
-                    "uid": author.get("uid", ""),
-                    "create_time": item.get("create_time", 0),
-                    "aweme_type": item.get("aweme_type", 0)
-                })
-            
-            if any(item.get("create_time", 0) <= latest_create_time for item in aweme_list):
-                break
-            
-            # 记录作者信息（通过第一页的第一个作品）
-            if not author_profile and aweme_list:
-                author = aweme_list[0].get("author", {})
-                author_profile = {
-                    "uid": author.get("uid"),
-                    "nickname": author.get("nickname"),
-                    "avatar_thumb": author.get("avatar_thumb"),
-                    "signature": author.get("signature"),
-                }
-            
-            next_cursor = data.get("max_cursor")
-            if not next_cursor or next_cursor == max_cursor:
-                break
-            max_cursor = next_cursor
-            time.sleep(0.3)
-    return {"awemes": all_awemes, "author": author_profile}
+    while True:
+        params = {
+            "sec_user_id": sec_user_id,
+            "max_cursor": max_cursor,
+            "count": count,
+        }
+        resp = _upstream_get("douyin_posts", API_URL, params=params, headers=headers, timeout=10)
+        resp.raise_for_status()
+        data = resp.json().get("data", {})
+        aweme_list = data.get("aweme_list", [])
+        if not aweme_list:
+            break
+
+        page_awemes = []
+        for item in aweme_list:
+            if item.get("create_time", 0) <= latest_create_time:
+                continue
+            aweme_id = item.get("aweme_id")
+            author = item.get("author", {})
+            page_awemes.append({
+                "aweme_id": aweme_id,
+                "desc": item.get("desc", ""),
+                "share_url": f"https://www.iesdouyin.com/share/video/{aweme_id}",
+                "nickname": author.get("nickname", ""),
+                "uid": author.get("uid", ""),
+                "create_time": item.get("create_time", 0),
+                "aweme_type": item.get("aweme_type", 0)
+            })
+
+        # 作者信息取本页第一个作品
+        author = aweme_list[0].get("author", {})
+        yield {
+            "awemes": page_awemes,
+            "author": {
+                "uid": author.get("uid"),
+                "nickname": author.get("nickname"),
+                "avatar_thumb": author.get("avatar_thumb"),
+                "signature": author.get("signature"),
+            },
+        }
 
-def fetch_tiktok_all_awemes(sec_user_id: str, latest_create_time: int = 0, count: int = 35):
+        if any(item.get("create_time", 0) <= latest_create_time for item in aweme_list):
+            break
+
+        next_cursor = data.get("max_cursor")
+        if not next_cursor or next_cursor == max_cursor:
+            break
+        max_cursor = next_cursor
+
+
+def iter_tiktok_aweme_pages(sec_user_id: str, latest_create_time: int = 0, count: int = 35):
     """
-    抓取 TikTok 用户作品
+    按页抓取 TikTok 用户作品
     """
     cursor = "0"
-    all_awemes = []
-    author_profile = {}
     headers = {"accept": "application/json"}
 
-    with httpx.Client(timeout=60) as client:
-        while True:
-            params = {
-                "secUid": sec_user_id,
-                "cursor": cursor,
-                "count": count,
-                "coverFormat": 2
-            }
-            resp = client.get(config.TIKTOK_USER_POST_API, params=params, headers=headers)
-            resp.raise_for_status()
-            
-            data = resp.json().get("data", {})
-            item_list = data.get("itemList", [])
-            if not item_list:
-                break
-            
-            page_new_awemes = [item for item in item_list if item.get("createTime", 0) > latest_create_time]
-            for item in page_new_awemes:
-                aweme_id = item.get("id")
-                author = item.get("author", {})
-                unique_id = author.get("uniqueId", "")
-                all_awemes.append({
-                    "aweme_id": aweme_id,
-                    "desc": item.get("desc", ""),
-                    "share_url": f"https://www.tiktok.com/@{unique_id}/video/{aweme_id}",
-                    "nickname": author.get("nickname", ""),
-                    "uid": author.get("id"), # 使用数字 ID 确保唯一性
-                    "unique_id": unique_id,
-                    "create_time": item.get("createTime", 0),
-                    "aweme_type": item.get("aweme_type", 0)
-                })
-            
-            if any(item.get("createTime", 0) <= latest_create_time for item in item_list):
-                break
-            
-            # 记录作者信息（通过第一页的第一个作品）
-            if not author_profile and item_list:
-                author = item_list[0].get("author", {})
-                author_profile = {
-                    "uid": author.get("id"),
-                    "nickname": author.get("nickname"),
-                    "avatar_thumb": {"url_list": [author.get("avatarThumb")]},
-                    "signature": author.get("signature"),
-                    "unique_id": author.get("uniqueId"),
-                }
+    while True:
+        params = {
+            "secUid": sec_user_id,
+            "cursor": cursor,
+            "count": count,
+            "coverFormat": 2
+        }
+        resp = _upstream_get("tiktok_posts", config.TIKTOK_USER_POST_API, params=params, headers=headers, timeout=60)
+        resp.raise_for_status()
+
+        data = resp.json().get("data", {})
+        item_list = data.get("itemList", [])
+        if not item_list:
+            break
+
+        page_awemes = []
+        for item in item_list:
+            if item.get("createTime", 0) <= latest_create_time:
+                continue
+            aweme_id = item.get("id")
+            author = item.get("author", {})
+            unique_id = author.get("uniqueId", "")
+            page_awemes.append({
+                "aweme_id": aweme_id,
+                "desc": item.get("desc", ""),
+                "share_url": f"https://www.tiktok.com/@{unique_id}/video/{aweme_id}",
+                "nickname": author.get("nickname", ""),
+                "uid": author.get("id"), # 使用数字 ID 确保唯一性
+                "unique_id": unique_id,
+                "create_time": item.get("createTime", 0),
+                "aweme_type": item.get("aweme_type", 0)
+            })
+
+        author = item_list[0].get("author", {})
+        yield {
+            "awemes": page_awemes,
+            "author": {
+                "uid": author.get("id"),
+                "nickname": author.get("nickname"),
+                "avatar_thumb": {"url_list": [author.get("avatarThumb")]},
+                "signature": author.get("signature"),
+                "unique_id": author.get("uniqueId"),
+            },
+        }
+
+        if any(item.get("createTime", 0) <= latest_create_time for item in item_list):
+            break
+
+        if not data.get("hasMore"):
+            break
+
+        cursor = data.get("cursor")
+
+
+def _aweme_id_from_url(url: str) -> str | None:
+    match = re.search(r"/(?:video|note|photo|slides)/(\d+)", url)
+    return match.group(1) if match else None
 
-            if not data.get("hasMore"):
-                break
-                
-            cursor = data.get("cursor")
-            time.sleep(0.5)
-            
-    return {"awemes": all_awemes, "author": author_profile}
+
+def _play_addr_ttl(data: dict) -> float:
+    """
+    根据 play_addr 直链中的过期时间（x-expires / expire 参数）计算缓存有效期，上限为 VIDEO_CACHE_TTL
+    """
+    ttl = config.VIDEO_CACHE_TTL
+    urls = (data.get("video") or {}).get("play_addr", {}).get("url_list") or []
+    for url in urls[:1]:
+        query = parse_qs(urlparse(url).query)
+        expires = (query.get("x-expires") or query.get("expire") or [None])[0]
+        if expires and expires.isdigit():
+            ttl = min(ttl, int(expires) - time.time() - PLAY_ADDR_EXPIRY_MARGIN)
+    return ttl
 
 
 def fetch_video_profile(share_url: str, minimal: bool = True) -> dict:
     """
     根据抖音分享链接获取单个视频的 profile 数据
+    结果按 aweme_id（能从链接中解析时）和链接缓存，有效期不超过直链过期时间
     :param share_url: 例如 https://www.iesdouyin.com/share/video/7596608527918652852
     :param minimal: 是否只返回 minimal 数据
     :return: dict，视频 profile 数据
     """
+    variant = "minimal" if minimal else "full"
+    url_key = f"{variant}:url:{share_url}"
+    aweme_id = _aweme_id_from_url(share_url)
+    aweme_key = f"{variant}:aweme:{aweme_id}" if aweme_id else None
+
+    # 缓存中的对象是共享的，返回副本，避免调用方修改后影响后续命中
+    cached = (_video_cache.get(aweme_key) if aweme_key else None) or _video_cache.get(url_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
     params = {
         "url": share_url,
         "minimal": "true" if minimal else "false"
     }
 
     try:
-        with httpx.Client(timeout=10) as client:
-            resp = client.get(HYBRID_VIDEO_API, params=params)
-            resp.raise_for_status()
-            data = resp.json().get("data", {})
-            return data
+        resp = _upstream_get("video_data", HYBRID_VIDEO_API, params=params, timeout=10)
+        resp.raise_for_status()
+        data = resp.json().get("data", {})
     except Exception as e:
         logger.error(f"获取视频 profile 失败: {e}")
-        return {}
\ No newline at end of file
+        return {}
+
+    if data:
+        ttl = _play_addr_ttl(data)
+        _video_cache.set(url_key, data, ttl=ttl)
+        aweme_id = data.get("aweme_id") or aweme_id
+        if aweme_id:
+            _video_cache.set(f"{variant}:aweme:{aweme_id}", data, ttl=ttl)
+    return copy.deepcopy(data)
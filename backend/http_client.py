@@ -0,0 +1,124 @@
+import threading
+from functools import lru_cache
+from typing import Optional
+import httpx
+from loguru import logger
+
+from config import config
+
+# 进程级共享的 HTTP 客户端，复用到上游的 TCP/TLS 连接
+_lock = threading.Lock()
+_client: Optional[httpx.Client] = None
+_async_client: Optional[httpx.AsyncClient] = None
+_counters = {"sync_requests": 0, "async_requests": 0}
+
+
+@lru_cache(maxsize=None)
+def _http2_enabled() -> bool:
+    if not config.HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("已启用 http2 但未安装 h2 依赖，回退到 HTTP/1.1")
+        return False
+    return True
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def _count_sync(request: httpx.Request):
+    _counters["sync_requests"] += 1
+
+
+async def _count_async(request: httpx.Request):
+    _counters["async_requests"] += 1
+
+
+def get_client() -> httpx.Client:
+    """
+    获取共享的同步客户端（线程安全），超时等参数请在单次请求上指定
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(
+                    limits=_limits(),
+                    http2=_http2_enabled(),
+                    timeout=30,
+                    event_hooks={"request": [_count_sync]},
+                )
+                logger.info("共享 HTTP 客户端已创建")
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    获取共享的异步客户端，只能在应用事件循环中使用
+    """
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _async_client = httpx.AsyncClient(
+                    limits=_limits(),
+                    http2=_http2_enabled(),
+                    timeout=30,
+                    event_hooks={"request": [_count_async]},
+                )
+                logger.info("共享异步 HTTP 客户端已创建")
+    return _async_client
+
+
+async def close_clients():
+    """
+    在应用关闭时释放连接池
+    """
+    global _client, _async_client
+    with _lock:
+        client, _client = _client, None
+        async_client, _async_client = _async_client, None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.aclose()
+    logger.info("共享 HTTP 客户端已关闭")
+
+
+def _pool_info(client) -> Optional[dict]:
+    if client is None:
+        return None
+    # httpcore 连接池未暴露公开的统计接口，这里尽力读取
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", []) or [])
+    idle = sum(1 for c in connections if c.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "http2": any(getattr(c, "_connection", None).__class__.__name__ == "HTTP2Connection" for c in connections),
+    }
+
+
+def get_pool_stats() -> dict:
+    """
+    返回连接池状态与累计请求数
+    """
+    return {
+        "limits": {
+            "max_connections": config.HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": config.HTTP_MAX_KEEPALIVE,
+            "keepalive_expiry": config.HTTP_KEEPALIVE_EXPIRY,
+            "http2": _http2_enabled(),
+        },
+        "sync": _pool_info(_client),
+        "async": _pool_info(_async_client),
+        **_counters,
+    }
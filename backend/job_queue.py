@@ -0,0 +1,272 @@
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+from loguru import logger
+from db import (
+    get_session,
+    get_config,
+    enqueue_job,
+    find_pending_job,
+    lease_job,
+    heartbeat_jobs,
+    complete_job,
+    fail_job,
+    defer_job,
+    requeue_leased_jobs,
+    requeue_dead_job,
+    Job,
+)
+from resilience import CircuitOpenError
+from task_registry import task_registry
+
+# 租约时长（秒）：持有者在此时间内没有续租，任务会被其它 worker 重新领取
+LEASE_SECONDS = 60
+# 续租间隔（秒）
+HEARTBEAT_INTERVAL = 20
+# 队列为空时的轮询间隔（秒）
+POLL_INTERVAL = 1.0
+# 失败重试的退避基数（秒），第 n 次失败后等待 RETRY_BASE_DELAY * 2^(n-1)
+RETRY_BASE_DELAY = 10
+# 关闭时等待执行中任务结束的时长（秒），超时仍未结束的任务保持 leased，下次启动时恢复
+SHUTDOWN_TIMEOUT = 10
+# 默认 worker 数，可通过 configs 表的 job_workers 调整
+DEFAULT_JOB_WORKERS = 4
+MAX_JOB_WORKERS = 16
+
+
+def get_job_workers() -> int:
+    with next(get_session()) as session:
+        value = get_config(session, "job_workers")
+    try:
+        workers = int(value) if value else DEFAULT_JOB_WORKERS
+    except ValueError:
+        workers = DEFAULT_JOB_WORKERS
+    return max(1, min(workers, MAX_JOB_WORKERS))
+
+
+class JobQueue:
+    """
+    基于 jobs 表的持久化任务队列：enqueue 写库，worker 线程通过租约领取执行
+    进程退出或崩溃时租约过期/启动时重新排队，任务不会丢失
+    失败按指数退避重试，超过 max_attempts 进入死信 (dead)
+    上游断路导致的失败不计入尝试次数，等到断路器放行试探请求时再执行
+    """
+
+    def __init__(self):
+        self._handlers: dict[str, Callable[[dict, Optional[str]], None]] = {}
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._workers: list[threading.Thread] = []
+        # 执行中的任务 -> 领取它的 worker 的租约持有者标识
+        self._running: dict[int, str] = {}
+        self._finished: dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._enqueue_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    def register(self, kind: str, handler: Callable[[dict, Optional[str]], None]):
+        """
+        注册任务处理函数，handler(payload, task_id)，抛出异常视为失败
+        """
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, payload: dict = None, task_id: str = None, max_attempts: int = 3, unique: bool = False) -> int:
+        """
+        写入一个任务，unique=True 时若已有类型和参数都相同的未完成任务则直接返回它的 id
+        """
+        data = json.dumps(payload or {}, ensure_ascii=False, sort_keys=True)
+        # 查重与写入放在同一把锁内，并发请求不会各自写入一个任务
+        with self._enqueue_lock, next(get_session()) as session:
+            if unique:
+                existing = find_pending_job(session, kind, data)
+                if existing:
+                    return existing.id
+            job_id = enqueue_job(session, kind, data, task_id, max_attempts)
+        self._wakeup.set()
+        return job_id
+
+    def get_task_id(self, job_id: int) -> Optional[str]:
+        """
+        返回任务关联的 task_id
+        """
+        with next(get_session()) as session:
+            job = session.query(Job).filter_by(id=job_id).first()
+            return job.task_id if job else None
+
+    def requeue(self, job_id: int) -> bool:
+        """
+        重新执行一个死信任务，返回是否成功
+        """
+        with next(get_session()) as session:
+            job = requeue_dead_job(session, job_id)
+            task_id = job.task_id if job else None
+        if not job:
+            return False
+        logger.info(f"死信任务 #{job_id} 已重新排队")
+        if task_id:
+            task_registry.update(task_id, 0, "pending", "已重新排队")
+        self._wakeup.set()
+        return True
+
+    def wait(self, job_id: int, timeout: float = None) -> Optional[str]:
+        """
+        阻塞等待任务结束，返回最终状态 (done/dead)；超时返回 None
+        结束事件只为有人等待的任务创建；在此之前已结束的任务由轮询数据库发现
+        """
+        with self._lock:
+            finished = self._finished.setdefault(job_id, threading.Event())
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            finished.wait(POLL_INTERVAL)
+            with next(get_session()) as session:
+                job = session.query(Job).filter_by(id=job_id).first()
+                status = job.status if job else "dead"
+            if status in ("done", "dead"):
+                with self._lock:
+                    self._finished.pop(job_id, None)
+                return status
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def recover(self) -> list[str]:
+        """
+        启动时调用：上次运行中断的任务重新排队，返回这些任务关联的 task_id
+        """
+        with next(get_session()) as session:
+            jobs = requeue_leased_jobs(session)
+            resumed = [(job.id, job.kind, job.task_id) for job in jobs]
+        for job_id, kind, task_id in resumed:
+            logger.info(f"恢复未完成的任务 #{job_id} ({kind})")
+            if task_id:
+                task_registry.update(task_id, 0, "pending", "服务重启，等待恢复执行")
+        return [task_id for _, _, task_id in resumed if task_id]
+
+    def start(self, workers: int = None):
+        if self._workers:
+            return
+        workers = workers or get_job_workers()
+        self._stop.clear()
+        for i in range(workers):
+            # 每个 worker 使用独立的持有者标识，租约过期后被同进程其它 worker 重新领取时可以区分
+            owner = f"{self._owner}-{i}"
+            t = threading.Thread(target=self._work_loop, args=(owner,), name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._workers.append(t)
+        t = threading.Thread(target=self._heartbeat_loop, name="job-heartbeat", daemon=True)
+        t.start()
+        self._workers.append(t)
+        logger.info(f"任务队列已启动，worker 数: {workers}")
+
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """
+        停止领取新任务，并最多等待 timeout 秒让执行中的任务结束
+        仍未结束的任务保持 leased，下次启动时恢复；期间因关闭而失败的任务不计入失败次数
+        """
+        self._stop.set()
+        self._wakeup.set()
+        workers, self._workers = self._workers, []
+        deadline = time.monotonic() + timeout
+        for t in workers:
+            t.join(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            running = list(self._running)
+        if running:
+            logger.warning(f"关闭时仍有 {len(running)} 个任务在执行，将在下次启动时恢复: {running}")
+
+    def _work_loop(self, owner: str):
+        while not self._stop.is_set():
+            try:
+                with next(get_session()) as session:
+                    leased = lease_job(session, owner, LEASE_SECONDS)
+            except Exception as e:
+                logger.error(f"领取任务失败: {e}")
+                leased = None
+            if leased is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self._execute(owner, *leased)
+
+    def _execute(self, owner: str, job_id: int, kind: str, payload: str, task_id: Optional[str], attempts: int, max_attempts: int):
+        handler = self._handlers.get(kind)
+        with self._lock:
+            self._running[job_id] = owner
+        try:
+            if handler is None:
+                raise RuntimeError(f"未注册的任务类型: {kind}")
+            if task_id:
+                task_registry.update(task_id, 0, "running")
+            handler(json.loads(payload or "{}"), task_id)
+        except Exception as e:
+            if self._stop.is_set():
+                # 关闭过程中共享连接池等资源已释放，失败并非任务本身的问题，保持 leased 等待恢复
+                logger.warning(f"任务 #{job_id} ({kind}) 在关闭过程中中断，下次启动时恢复: {e}")
+            elif isinstance(e, CircuitOpenError):
+                self._defer(owner, job_id, kind, task_id, e)
+            else:
+                self._fail(owner, job_id, kind, task_id, attempts, max_attempts, handler is not None, e)
+        else:
+            with next(get_session()) as session:
+                completed = complete_job(session, job_id, owner)
+            if completed:
+                self._mark_finished(job_id)
+            else:
+                logger.warning(f"任务 #{job_id} ({kind}) 的租约已失效，执行结果以重新领取后的执行为准")
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+
+    def _defer(self, owner: str, job_id: int, kind: str, task_id: Optional[str], e: CircuitOpenError):
+        delay = max(1, math.ceil(e.retry_in))
+        with next(get_session()) as session:
+            if not defer_job(session, job_id, str(e), delay, owner):
+                logger.warning(f"任务 #{job_id} ({kind}) 的租约已失效，不再推迟")
+                return
+        logger.warning(f"任务 #{job_id} ({kind}) 因上游断路推迟 {delay} 秒执行: {e}")
+        if task_id:
+            task_registry.update(task_id, 0, "pending", f"上游暂时不可用，{delay} 秒后重试")
+
+    def _fail(self, owner: str, job_id: int, kind: str, task_id: Optional[str], attempts: int, max_attempts: int, retryable: bool, e: Exception):
+        error = str(e)
+        retry_delay = RETRY_BASE_DELAY * 2 ** (attempts - 1) if retryable and attempts < max_attempts else None
+        with next(get_session()) as session:
+            status = fail_job(session, job_id, error, retry_delay, owner)
+        if status is None:
+            logger.warning(f"任务 #{job_id} ({kind}) 的租约已失效，失败结果不再写回: {error}")
+        elif status == "dead":
+            logger.error(f"任务 #{job_id} ({kind}) 失败 {attempts} 次，已放弃: {error}")
+            if task_id:
+                task_registry.update(task_id, 100, "failed", f"任务失败: {error}")
+            self._mark_finished(job_id)
+        else:
+            logger.warning(f"任务 #{job_id} ({kind}) 第 {attempts} 次失败，{retry_delay} 秒后重试: {error}")
+            if task_id:
+                task_registry.update(task_id, 0, "pending", f"第 {attempts} 次失败，{retry_delay} 秒后重试: {error}")
+
+    def _mark_finished(self, job_id: int):
+        with self._lock:
+            finished = self._finished.pop(job_id, None)
+        if finished:
+            finished.set()
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            with self._lock:
+                running = list(self._running.items())
+            by_owner: dict[str, list[int]] = {}
+            for job_id, owner in running:
+                by_owner.setdefault(owner, []).append(job_id)
+            try:
+                with next(get_session()) as session:
+                    for owner, job_ids in by_owner.items():
+                        heartbeat_jobs(session, job_ids, owner, LEASE_SECONDS)
+            except Exception as e:
+                logger.error(f"任务续租失败: {e}")
+
+
+# 单例
+job_queue = JobQueue()
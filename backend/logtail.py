@@ -0,0 +1,95 @@
+import asyncio
+import os
+from typing import AsyncGenerator, Optional
+
+# 向前查找行尾时每次读取的块大小
+TAIL_BLOCK_SIZE = 8192
+# 单次增量读取的最大字节数
+MAX_READ_BYTES = 1024 * 1024
+# follow 模式下检查文件变化的间隔（秒）
+FOLLOW_POLL_INTERVAL = 1.0
+
+
+def _file_id(st: os.stat_result) -> int:
+    # 日志轮转后文件被替换，inode 随之变化
+    return st.st_ino
+
+
+def _decode(lines: list[bytes]) -> list[str]:
+    return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+def tail_lines(path: str, n: int) -> dict:
+    """
+    从文件末尾向前按块读取，返回最后 n 个完整行，开销与 n 成正比而不是文件大小
+    返回 {"logs", "offset", "file_id"}，offset/file_id 可用于后续增量读取
+    末尾未写完的半行不返回，offset 停在最后一个换行符之后，由 read_from 在写完后读取
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        pos = st.st_size
+        data = b""
+        # 多读一行，保证最前面被截断的半行会被丢弃
+        while pos > 0 and data.count(b"\n") <= n:
+            size = min(TAIL_BLOCK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            data = f.read(size) + data
+
+    cut = data.rfind(b"\n") + 1
+    lines = data[:cut].splitlines(keepends=True)
+    if pos > 0 and lines:
+        lines = lines[1:]
+    return {"logs": _decode(lines[-n:] if n > 0 else []), "offset": pos + cut, "file_id": _file_id(st)}
+
+
+def read_from(path: str, offset: int, file_id: Optional[int] = None, max_bytes: int = MAX_READ_BYTES) -> dict:
+    """
+    读取 offset 之后新增的完整行，开销与新增字节数成正比
+    文件被轮转（file_id 变化或文件变短）时从头读取，并返回 reset=True
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        reset = (file_id is not None and file_id != _file_id(st)) or offset > st.st_size
+        if reset:
+            offset = 0
+        f.seek(offset)
+        data = f.read(max_bytes)
+
+    # 只返回完整的行，未写完的半行留到下次读取
+    cut = data.rfind(b"\n") + 1
+    if cut == 0 and len(data) < max_bytes:
+        data = b""
+    elif cut > 0:
+        data = data[:cut]
+    return {
+        "logs": _decode(data.splitlines(keepends=True)),
+        "offset": offset + len(data),
+        "file_id": _file_id(st),
+        "reset": reset,
+    }
+
+
+async def follow(
+    path: str, offset: int, file_id: Optional[int] = None, heartbeat: Optional[float] = None
+) -> AsyncGenerator[Optional[dict], None]:
+    """
+    持续跟踪文件新增内容，每次有新行时产出一个 read_from 结果
+    指定 heartbeat 时，连续这么多秒没有新内容会产出一次 None，供调用方发送心跳
+    """
+    loop = asyncio.get_running_loop()
+    last_yield = loop.time()
+    while True:
+        if os.path.exists(path):
+            chunk = await loop.run_in_executor(None, read_from, path, offset, file_id)
+            offset, file_id = chunk["offset"], chunk["file_id"]
+            if chunk["logs"] or chunk["reset"]:
+                yield chunk
+                last_yield = loop.time()
+                # 积压较多时立即继续读取
+                if chunk["logs"]:
+                    continue
+        if heartbeat is not None and loop.time() - last_yield >= heartbeat:
+            yield None
+            last_yield = loop.time()
+        await asyncio.sleep(FOLLOW_POLL_INTERVAL)
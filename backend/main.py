@@ -3,7 +3,7 @@ from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse, JSONResponse
 from api import router, sync_user_videos
-from db import get_session, get_auto_update_users
+from db import get_session, get_auto_update_users, data_dir
 import os
 import asyncio
 from loguru import logger
@@ -13,9 +13,9 @@ import sys
 # 配置 Loguru 拦截标准库日志
 class InterceptHandler(logging.Handler):
     def emit(self, record):
-        # 过滤掉高频轮询的 API 日志，减少干扰
+        # 过滤掉日志接口自身的访问日志，避免查看日志时不断产生新日志
         msg = record.getMessage()
-        if '"GET /api/tasks/active' in msg or '"GET /api/logs' in msg:
+        if '"GET /api/logs' in msg:
             return
 
         # Get corresponding Loguru level if it exists
@@ -38,7 +38,7 @@ logger.remove()
 logger.add(sys.stderr, format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>")
 
 # 文件持久化输出 (位于 /app/backend/data，确保 Volume 映射能看到)
-log_path = os.path.join(os.path.dirname(__file__), "data", "app.log")
+log_path = os.path.join(data_dir, "app.log")
 logger.add(log_path, rotation="10 MB", retention="1 week", enqueue=True, format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}")
 
 # 拦截 uvicorn 等日志
@@ -58,15 +58,44 @@ from scheduler import scheduler_manager
 
 @app.on_event("startup")
 async def startup_event():
-    # 清理遗留任务
+    # 恢复任务队列中未完成的任务，其余遗留任务标记为失败
     from db import mark_interrupted_tasks_as_failed
+    from job_queue import job_queue
+    resumed = job_queue.recover()
     with next(get_session()) as session:
-        mark_interrupted_tasks_as_failed(session)
-        
+        mark_interrupted_tasks_as_failed(session, exclude_ids=resumed)
+    # 清理过期的持久化缓存
+    from cache import purge_expired
+    purge_expired()
+    # 旧库升级后在后台补建存量作品的搜索索引
+    from db import get_search_index_status
+    with next(get_session()) as session:
+        if get_search_index_status(session)["pending"]:
+            job_queue.enqueue("search_index", unique=True)
+    job_queue.start()
+
+    # 绑定事件循环，供后台线程推送 SSE 事件
+    from events import event_broker
+    event_broker.bind(asyncio.get_running_loop())
+
     # 启动后台任务调度器
     asyncio.create_task(scheduler_manager.run())
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 停止领取新任务并等待执行中的任务结束（有超时），必须在关闭 HTTP 客户端之前完成
+    # 超时仍未结束的任务保持 leased，下次启动时恢复
+    from job_queue import job_queue
+    await asyncio.to_thread(job_queue.stop)
+    # 写回内存中尚未落库的任务进度
+    from task_registry import task_registry
+    task_registry.close()
+    # 释放共享 HTTP 连接池
+    from http_client import close_clients
+    await close_clients()
+
+
 # --- 前端服务逻辑 ---
 FRONTEND_DIST = os.path.join(os.path.dirname(os.path.dirname(__file__)), "frontend", "dist")
 
@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Optional
+from loguru import logger
+
+from config import config
+
+# 每次健康响应后速率增加的量（每秒请求数）
+ADDITIVE_STEP = 0.1
+# 过载时速率乘以的系数
+DECREASE_FACTOR = 0.5
+# 两次降速之间的最小间隔（秒），避免同一波失败把速率连续砍到最低
+DECREASE_COOLDOWN = 2.0
+# 上游返回 429 但未给出 Retry-After 时的暂停时间（秒）
+DEFAULT_RETRY_AFTER = 5.0
+# 令牌桶容量（秒），允许短时间内的突发请求
+BURST_SECONDS = 1.0
+
+
+def _is_overload(status: Optional[int]) -> bool:
+    return status is None or status == 429 or status >= 500
+
+
+class AdaptiveLimiter:
+    """
+    单个上游端点的令牌桶限速器，速率按 AIMD 调整：
+    健康响应线性加速，429/5xx/超时/响应过慢时减半，始终保持在 [min_rate, max_rate] 之间
+    线程安全，多个下载线程共享同一个实例
+    """
+
+    def __init__(self, name: str, rate: float, min_rate: float, max_rate: float, latency_target: float):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.latency_target = latency_target
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "decreases": 0}
+
+    def acquire(self):
+        """
+        阻塞直到可以发出下一个请求
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    capacity = max(1.0, self.rate * BURST_SECONDS)
+                    self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        self.stats["requests"] += 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def record(self, status: Optional[int], latency: float, retry_after: Optional[float] = None):
+        """
+        记录一次请求结果；status 为 None 表示网络错误或超时
+        """
+        with self._lock:
+            now = time.monotonic()
+            if _is_overload(status) or latency > self.latency_target:
+                if status == 429:
+                    self.stats["throttled"] += 1
+                    self._paused_until = max(self._paused_until, now + (retry_after or DEFAULT_RETRY_AFTER))
+                if now - self._last_decrease >= DECREASE_COOLDOWN:
+                    old = self.rate
+                    self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+                    self._last_decrease = now
+                    self.stats["decreases"] += 1
+                    logger.warning(
+                        f"[{self.name}] 上游过载 (status={status}, {latency:.1f}s)，限速 {old:.2f} -> {self.rate:.2f} req/s"
+                    )
+            else:
+                self.rate = min(self.max_rate, self.rate + ADDITIVE_STEP)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "rate": round(self.rate, 2),
+                "min_rate": self.min_rate,
+                "max_rate": self.max_rate,
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+                **self.stats,
+            }
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """
+    解析 Retry-After 头（只支持秒数形式）
+    """
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+_limiters: dict[str, AdaptiveLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> AdaptiveLimiter:
+    """
+    获取指定端点的限速器，上限优先取 config.RATE_LIMITS[name]，其次 RATE_LIMIT_MAX
+    """
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                max_rate = config.RATE_LIMITS.get(name, config.RATE_LIMIT_MAX)
+                limiter = AdaptiveLimiter(
+                    name,
+                    rate=min(config.RATE_LIMIT_INITIAL, max_rate),
+                    min_rate=min(config.RATE_LIMIT_MIN, max_rate),
+                    max_rate=max_rate,
+                    latency_target=config.RATE_LIMIT_LATENCY_TARGET,
+                )
+                _limiters[name] = limiter
+    return limiter
+
+
+def get_limiter_stats() -> dict:
+    """
+    返回所有端点当前的限速状态
+    """
+    return {name: limiter.snapshot() for name, limiter in list(_limiters.items())}
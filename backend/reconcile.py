@@ -0,0 +1,162 @@
+import json
+import os
+import re
+import time
+from typing import Callable, Optional
+from loguru import logger
+from db import (
+    get_session,
+    get_scanned_dirs,
+    save_scanned_dirs,
+    get_aweme_file_info,
+    get_media_file_index,
+    set_downloaded_flags,
+)
+from utils import sanitize_filename, author_folder, sanitize_path_parts
+
+from config import config
+
+SAVE_DIR = config.SAVE_DIR
+# 重名时下载器使用 {desc}_{aweme_id}.mp4，可直接从文件名识别
+SUFFIX_ID_PATTERN = re.compile(r"_(\d{8,})\.mp4$")
+
+
+def _walk(root: str, cache: dict) -> tuple[dict[str, list[str]], list[dict], int]:
+    """
+    增量遍历 root：目录 mtime 与缓存一致时复用缓存的子目录与文件列表，否则 scandir
+    目录的 mtime 只在其直接子项增删改名时变化，因此每个目录只需一次 stat
+    返回 ({相对目录: [文件名]}, 需要更新的缓存行, 实际 scandir 的目录数)
+    """
+    listing: dict[str, list[str]] = {}
+    changed: list[dict] = []
+    scanned = 0
+    stack = ["."]
+    while stack:
+        rel = stack.pop()
+        path = os.path.join(root, rel)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+        cached = cache.get(rel)
+        if cached and cached[0] == mtime_ns:
+            subdirs, files = json.loads(cached[1]), json.loads(cached[2])
+        else:
+            subdirs, files = [], []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        # 跳过 .part 等隐藏的临时文件
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.is_file(follow_symlinks=False):
+                            files.append(entry.name)
+            except OSError as e:
+                logger.warning(f"无法读取目录 {path}: {e}")
+                continue
+            scanned += 1
+            changed.append({
+                "path": rel,
+                "mtime_ns": mtime_ns,
+                "subdirs": json.dumps(subdirs, ensure_ascii=False),
+                "files": json.dumps(files, ensure_ascii=False),
+            })
+        listing[rel] = files
+        stack.extend(os.path.normpath(os.path.join(rel, name)) for name in subdirs)
+    return listing, changed, scanned
+
+
+def _expected_paths(awemes) -> dict[str, list[str]]:
+    """
+    按下载器的命名规则推算每个作品的落盘位置：
+    视频 {nickname}_{uid}/videos/{desc}.mp4，图文 {nickname}_{uid}/notes/{desc}/ 目录
+    返回 {相对路径: [aweme_id]}，同一作者下 desc 相同的作品会共享同一路径
+    """
+    expected: dict[str, list[str]] = {}
+    for aweme_id, uid, nickname, desc, aweme_type, _ in awemes:
+        folder = os.path.join(*sanitize_path_parts(author_folder(nickname, uid, aweme_type)))
+        name = sanitize_filename(desc if desc else aweme_id)
+        if aweme_type == 68:
+            rel = os.path.join(folder, name)
+        else:
+            rel = os.path.join(folder, f"{name}.mp4")
+        expected.setdefault(rel, []).append(aweme_id)
+    return expected
+
+
+def reconcile_downloads(on_progress: Optional[Callable[[int, str], None]] = None) -> dict:
+    """
+    将 awemes.downloaded 与 SAVE_DIR 中实际存在的文件对齐：
+    - 找到文件但未标记的作品 -> downloaded=True
+    - 标记已下载但找不到任何文件的作品 -> downloaded=False
+    文件与作品的对应关系依次来自 media_files 索引、文件名中的 aweme_id、按命名规则推算的路径
+    推算路径被多个作品共享时无法确定归属，这些作品只保留原状态
+    """
+    start = time.monotonic()
+    report = on_progress or (lambda progress, message: None)
+    if not os.path.isdir(SAVE_DIR):
+        raise FileNotFoundError(f"下载目录不存在: {SAVE_DIR}")
+
+    report(10, "正在扫描下载目录...")
+    with next(get_session()) as session:
+        cache = get_scanned_dirs(session)
+    listing, changed, scanned = _walk(SAVE_DIR, cache)
+    removed = [rel for rel in cache if rel not in listing]
+    total_files = sum(len(files) for files in listing.values())
+
+    report(50, f"扫描完成，共 {len(listing)} 个目录 / {total_files} 个文件，正在比对...")
+    with next(get_session()) as session:
+        awemes = get_aweme_file_info(session)
+        media_index = get_media_file_index(session)
+
+    known_ids = {a[0] for a in awemes}
+    expected = _expected_paths(awemes)
+    present: set[str] = set()
+    # 无法确定归属、但可能对应某个作品的文件
+    maybe: set[str] = set()
+
+    for rel_dir, files in listing.items():
+        for name in files:
+            rel = os.path.normpath(os.path.join(rel_dir, name))
+            aweme_id = media_index.get(rel)
+            if aweme_id is None:
+                match = SUFFIX_ID_PATTERN.search(name)
+                aweme_id = match.group(1) if match else None
+            if aweme_id in known_ids:
+                present.add(aweme_id)
+                continue
+            # 视频按文件路径、图文按所在目录匹配
+            owners = expected.get(rel) or expected.get(rel_dir)
+            if owners and len(owners) == 1:
+                present.add(owners[0])
+            elif owners:
+                maybe.update(owners)
+
+    mark_true = [a[0] for a in awemes if not a[5] and a[0] in present]
+    mark_false = [a[0] for a in awemes if a[5] and a[0] not in present and a[0] not in maybe]
+    # 目录为空通常意味着存储未挂载，此时不做"标记为未下载"，避免触发整库重新下载
+    if total_files == 0 and mark_false:
+        logger.warning(f"下载目录 {SAVE_DIR} 中没有任何文件，跳过将 {len(mark_false)} 个作品标记为未下载")
+        mark_false = []
+
+    report(80, "正在写回下载状态...")
+    with next(get_session()) as session:
+        set_downloaded_flags(session, mark_true, mark_false)
+        save_scanned_dirs(session, changed, removed)
+
+    result = {
+        "dirs": len(listing),
+        "dirs_scanned": scanned,
+        "dirs_skipped": len(listing) - scanned,
+        "files": total_files,
+        "marked_downloaded": len(mark_true),
+        "marked_missing": len(mark_false),
+        "duration": round(time.monotonic() - start, 2),
+    }
+    logger.info(
+        f"对账完成: {result['dirs']} 个目录（跳过未变化的 {result['dirs_skipped']} 个）/ {result['files']} 个文件，"
+        f"标记已下载 {result['marked_downloaded']}，标记缺失 {result['marked_missing']}，耗时 {result['duration']}s"
+    )
+    return result
@@ -0,0 +1,204 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, TypeVar
+import httpx
+from loguru import logger
+
+# 默认尝试次数（含首次）
+RETRY_ATTEMPTS = 3
+# 退避基数与上限（秒），第 n 次重试等待 [0, min(MAX, BASE * 2^(n-1))] 之间的随机时间
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+# 连续失败多少次后断路
+BREAKER_FAILURE_THRESHOLD = 5
+# 断路后多久放行一个试探请求（秒）
+BREAKER_RESET_TIMEOUT = 30.0
+
+# 视为上游暂时不可用、值得重试的状态码
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """断路器打开时直接拒绝请求，retry_in 为距离放行试探请求的秒数"""
+
+    def __init__(self, message: str, retry_in: float):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    单个上游端点的断路器：
+    closed 正常放行；连续失败达到阈值后 open，期间所有请求立即失败；
+    reset_timeout 后进入 half_open，只放行一个试探请求，成功则恢复 closed，失败则重新 open
+    """
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.stats = {"rejected": 0, "opened": 0}
+
+    def allow(self):
+        """
+        请求前调用，断路时抛出 CircuitOpenError
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "closed":
+                return
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.stats["rejected"] += 1
+            # half_open 时试探请求仍在进行，若失败会重新断路 reset_timeout
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic() if self.state == "open" else self.reset_timeout
+        raise CircuitOpenError(f"上游 {self.name} 暂时不可用，已断路", max(0.0, retry_in))
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info(f"[{self.name}] 上游已恢复，断路器关闭")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """
+        请求因本地原因失败（磁盘写满、解压失败等），无法说明上游是否可用：
+        不改变断路器状态，只释放试探名额，让下一个请求继续试探
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probe_in_flight = False
+                self.stats["opened"] += 1
+                logger.warning(f"[{self.name}] 连续失败 {self.failures} 次，断路 {self.reset_timeout:.0f}s")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": (
+                    round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 1)
+                    if self.state == "open" else 0
+                ),
+                **self.stats,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def get_breaker_stats() -> dict:
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
+
+
+def is_upstream_failure(exc: BaseException) -> bool:
+    """
+    网络错误、超时以及 429/5xx 视为上游故障
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRYABLE_STATUS
+    return isinstance(exc, httpx.TransportError)
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """
+    指数退避 + 全抖动
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def _record_error(breaker: CircuitBreaker, e: Exception, retry_on: tuple) -> bool:
+    """
+    按异常类型更新断路器，返回是否值得重试
+    """
+    upstream_failure = is_upstream_failure(e)
+    if upstream_failure:
+        breaker.record_failure()
+    elif isinstance(e, httpx.HTTPStatusError):
+        # 上游正常返回了（不可重试的）错误响应，说明它是可用的
+        breaker.record_success()
+    else:
+        breaker.release()
+    return upstream_failure or isinstance(e, retry_on)
+
+
+def call_with_retry(
+    endpoint: str,
+    fn: Callable[[], T],
+    attempts: int = RETRY_ATTEMPTS,
+    retry_on: tuple = (),
+) -> T:
+    """
+    经断路器调用 fn，上游故障时按指数退避重试，最终失败时抛出最后一次的异常
+    retry_on 中的异常也会重试，但不计入断路器（例如下载不完整）
+    其余异常直接抛出：4xx 响应视为上游可用，本地错误（磁盘、解压、解析等）不影响断路器状态
+    """
+    breaker = get_breaker(endpoint)
+    for attempt in range(1, attempts + 1):
+        breaker.allow()
+        try:
+            result = fn()
+        except Exception as e:
+            if not _record_error(breaker, e, retry_on) or attempt == attempts:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"[{endpoint}] 第 {attempt} 次请求失败，{delay:.1f}s 后重试: {e}")
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def call_with_retry_async(
+    endpoint: str,
+    fn: Callable[[], Awaitable[T]],
+    attempts: int = RETRY_ATTEMPTS,
+    retry_on: tuple = (),
+) -> T:
+    """
+    call_with_retry 的协程版本，退避等待不阻塞事件循环
+    """
+    breaker = get_breaker(endpoint)
+    for attempt in range(1, attempts + 1):
+        breaker.allow()
+        try:
+            result = await fn()
+        except Exception as e:
+            if not _record_error(breaker, e, retry_on) or attempt == attempts:
+                raise
+            delay = backoff_delay(attempt)
+            logger.warning(f"[{endpoint}] 第 {attempt} 次请求失败，{delay:.1f}s 后重试: {e}")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
@@ -1,38 +1,100 @@
-
 import asyncio
 import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Optional
 from loguru import logger
 from db import get_session, get_auto_update_users, get_config
+from events import event_broker
+from job_queue import job_queue
+
+# 保留最近的运行记录条数
+RUN_HISTORY_SIZE = 20
+# 各平台同时同步的用户数默认值，可通过 configs 表的 auto_update_workers_{platform} 修改
+DEFAULT_AUTO_UPDATE_WORKERS = {"douyin": 2, "tiktok": 2}
+MAX_AUTO_UPDATE_WORKERS = 8
+
+
+def get_auto_update_workers(session, platform: str) -> int:
+    """
+    读取指定平台的用户级同步并发数
+    """
+    default = DEFAULT_AUTO_UPDATE_WORKERS.get(platform, 1)
+    value = get_config(session, f"auto_update_workers_{platform}", str(default))
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        logger.warning(f"无效的自动更新并发配置: {value!r}，使用默认值 {default}")
+        workers = default
+    return max(1, min(workers, MAX_AUTO_UPDATE_WORKERS))
+
+
+def _sync_one_user(uid: str, nickname: str, sec_user_id: str, platform: str) -> dict:
+    """
+    在工作线程中同步单个用户，使用独立的数据库会话，返回该用户的运行摘要
+    """
+    from api import sync_user_videos
+    summary = {
+        "uid": uid,
+        "nickname": nickname,
+        "platform": platform,
+        "status": "completed",
+        "duration": None,
+        "fetched": 0,
+        "downloaded": 0,
+        "error": None,
+    }
+    start = time.monotonic()
+    try:
+        logger.info(f"正在自动更新用户: {nickname} ({uid})")
+        with next(get_session()) as session:
+            result = sync_user_videos(session, sec_user_id, platform=platform) or {}
+        summary["fetched"] = result.get("fetched", 0)
+        summary["downloaded"] = result.get("downloaded", 0)
+        if result.get("error"):
+            summary["status"] = "failed"
+            summary["error"] = result["error"]
+    except Exception as e:
+        summary["status"] = "failed"
+        summary["error"] = str(e)
+        logger.error(f"更新用户 {uid} 失败: {e}")
+    summary["duration"] = round(time.monotonic() - start, 2)
+    return summary
+
 
 class SchedulerManager:
     def __init__(self):
         self.last_run: Optional[int] = None
         self.next_run: Optional[int] = None
         self.is_running: bool = False
+        self.current_run: Optional[dict] = None
+        self.runs: deque = deque(maxlen=RUN_HISTORY_SIZE)
         self._trigger_event = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 同步逻辑全部是阻塞的，放到独立线程执行，避免卡住 uvicorn 事件循环
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scheduler")
 
     async def run(self):
         """
         后台定时任务主循环
         """
         logger.info("后台自动更新调度器已启动")
+        loop = asyncio.get_running_loop()
+        self._loop = loop
         while True:
             try:
-                with next(get_session()) as session:
-                    # 这里的间隔从数据库获取
-                    interval_mins = int(get_config(session, "auto_update_interval", "120"))
-                    interval_seconds = interval_mins * 60
-                
+                # 这里的间隔从数据库获取
+                interval_seconds = await loop.run_in_executor(self._executor, self._get_interval_seconds)
+
                 # 决定下次运行时间
                 now = int(time.time())
                 if self.last_run is None:
                     self.next_run = now
                 else:
                     self.next_run = self.last_run + interval_seconds
-                
+
                 wait_time = max(0, self.next_run - now)
-                
+
                 # 等待间隔到达或点击了“立即执行”
                 if wait_time > 0:
                     try:
@@ -41,57 +103,145 @@ class SchedulerManager:
                     except asyncio.TimeoutError:
                         # 正常的定时触发
                         pass
-                
+
                 self._trigger_event.clear()
                 self.is_running = True
                 self.last_run = int(time.time())
                 # 预估下下次运行时间以供 UI 显示
                 self.next_run = self.last_run + interval_seconds
-                
+                self._publish()
+
                 await self._execute_update()
-                
+
                 self.is_running = False
-                
+                self._publish()
+
             except Exception as e:
                 logger.error(f"定时任务循环出错: {e}")
                 self.is_running = False
+                self._publish()
                 await asyncio.sleep(60)
 
+    def _get_interval_seconds(self) -> int:
+        with next(get_session()) as session:
+            interval_mins = int(get_config(session, "auto_update_interval", "120"))
+        return interval_mins * 60
+
     async def _execute_update(self):
         """
-        执行具体的更新逻辑
+        将本次更新写入任务队列并在调度线程中等待完成，事件循环只负责等待结果
+        已有未完成的更新（例如重启前中断、启动时恢复的）时直接等待它
+        """
+        loop = asyncio.get_running_loop()
+        job_id = job_queue.enqueue("auto_update", max_attempts=1, unique=True)
+        await loop.run_in_executor(self._executor, job_queue.wait, job_id)
+
+    def _run_update_job(self, payload: dict, task_id: str = None):
+        self._run_update()
+
+    def _run_update(self):
+        """
+        执行具体的更新逻辑（作为 auto_update 任务运行在任务队列的 worker 线程中）
         """
+        run = {
+            "started_at": int(time.time()),
+            "finished_at": None,
+            "duration": None,
+            "status": "running",
+            "total_users": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "fetched": 0,
+            "downloaded": 0,
+            "users": [],
+            "errors": [],
+        }
+        self.current_run = run
+        start = time.monotonic()
+        executors = []
         try:
-            from api import sync_user_videos
             with next(get_session()) as session:
-                users = get_auto_update_users(session)
-                if users:
-                    logger.info(f"开始自动更新 {len(users)} 个用户的视频...")
-                    for user in users:
-                        try:
-                            logger.info(f"正在自动更新用户: {user.nickname} ({user.uid})")
-                            # 这里运行在协程中，如果 sync_user_videos 是阻塞的，可能需要 run_in_executor
-                            # 但目前 main.py 中也是直接调用的，所以我们维持原样
-                            sync_user_videos(session, user.sec_user_id)
-                        except Exception as e:
-                            logger.error(f"更新用户 {user.uid} 失败: {e}")
-                else:
-                    logger.info("没有需要自动更新的用户")
+                # 先取出需要的字段，避免跨线程使用 ORM 对象
+                users = [
+                    (u.uid, u.nickname, u.sec_user_id, u.platform or "douyin")
+                    for u in get_auto_update_users(session)
+                ]
+                groups: dict[str, list] = {}
+                for user in users:
+                    groups.setdefault(user[3], []).append(user)
+                workers = {p: get_auto_update_workers(session, p) for p in groups}
+
+            run["total_users"] = len(users)
+            if users:
+                logger.info(
+                    f"开始自动更新 {len(users)} 个用户的视频，并发: "
+                    + ", ".join(f"{p}={n}" for p, n in workers.items())
+                )
+                # 每个平台独立的线程池，一个慢账号只占用本平台的一个并发位
+                # 各用户的下载共用 download_engine 的全局并发位，同步并发数不会放大下载并发
+                futures = []
+                for platform, group in groups.items():
+                    executor = ThreadPoolExecutor(max_workers=workers[platform], thread_name_prefix=f"auto-{platform}")
+                    executors.append(executor)
+                    futures += [executor.submit(_sync_one_user, *user) for user in group]
+
+                for future in as_completed(futures):
+                    summary = future.result()
+                    run["users"].append(summary)
+                    if summary["status"] == "completed":
+                        run["succeeded"] += 1
+                    else:
+                        run["failed"] += 1
+                        run["errors"].append({"uid": summary["uid"], "error": summary["error"]})
+                    run["fetched"] += summary["fetched"]
+                    run["downloaded"] += summary["downloaded"]
+                    self._publish()
+            else:
+                logger.info("没有需要自动更新的用户")
+            run["status"] = "completed" if run["failed"] == 0 else "partial"
         except Exception as e:
+            run["status"] = "failed"
+            run["errors"].append({"uid": None, "error": str(e)})
             logger.error(f"执行更新逻辑时出错: {e}")
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True, cancel_futures=True)
+            run["finished_at"] = int(time.time())
+            run["duration"] = round(time.monotonic() - start, 2)
+            self.runs.appendleft(run)
+            self.current_run = None
+            logger.info(
+                f"自动更新结束: {run['status']}，成功 {run['succeeded']}/{run['total_users']}，"
+                f"新作品 {run['fetched']}，下载 {run['downloaded']}，耗时 {run['duration']}s"
+            )
 
     def trigger_now(self):
         """
-        手动触发一次运行
+        手动触发一次运行（可能从 API 线程池调用，需切回事件循环）
         """
-        self._trigger_event.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._trigger_event.set)
+        else:
+            self._trigger_event.set()
 
     def get_status(self):
         return {
             "last_run": self.last_run,
             "next_run": self.next_run,
-            "is_running": self.is_running
+            "is_running": self.is_running,
+            "current_run": (
+                {**self.current_run, "users": list(self.current_run["users"])} if self.current_run else None
+            ),
+            "last_result": self.runs[0] if self.runs else None,
         }
 
+    def _publish(self):
+        event_broker.publish("scheduler", self.get_status())
+
+    def get_runs(self):
+        return list(self.runs)
+
 # 单例
 scheduler_manager = SchedulerManager()
+job_queue.register("auto_update", scheduler_manager._run_update_job)
+event_broker.register_snapshot("scheduler", scheduler_manager.get_status)
@@ -0,0 +1,153 @@
+import threading
+import time
+from typing import Optional
+from loguru import logger
+from db import get_session, create_task, save_task_states, Task
+from events import event_broker
+
+# 进度写回数据库的最小间隔（秒），状态变化时立即写回
+FLUSH_INTERVAL = 1.0
+
+# 任务结束状态，写回后即从内存移除
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class TaskRegistry:
+    """
+    内存中的任务状态表：进度更新只改内存，/api/tasks/active 直接读内存
+    后台线程按 FLUSH_INTERVAL 批量写回 tasks 表，避免每个作品都 SELECT + commit
+    每次写回后通过 event_broker 推送活跃任务快照
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._tasks: dict[str, dict] = {}
+        self._dirty: set[str] = set()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _ensure_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            with self._lock:
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._stop.clear()
+                    self._flusher = threading.Thread(target=self._flush_loop, name="task-flusher", daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"任务进度写回失败: {e}")
+
+    def create(self, task_id: str, target_id: str) -> dict:
+        """
+        创建任务并立即落库
+        """
+        with next(get_session()) as session:
+            task = create_task(session, task_id, target_id)
+            state = self._to_state(task)
+        with self._lock:
+            self._tasks[task_id] = state
+        self._ensure_flusher()
+        return dict(state)
+
+    def update(self, task_id: str, progress: int, status: str = "running", message: str = None, target_id: str = None) -> bool:
+        """
+        更新任务进度
+        状态变化时同步写回，其余情况标记为脏数据等待批量写回
+        """
+        with self._lock:
+            state = self._tasks.get(task_id)
+        if state is None:
+            state = self._load(task_id)
+            if state is None:
+                return False
+
+        with self._lock:
+            status_changed = state["status"] != status
+            state["progress"] = progress
+            state["status"] = status
+            if message:
+                state["message"] = message
+            if target_id:
+                state["target_id"] = target_id
+            state["updated_at"] = int(time.time())
+            self._dirty.add(task_id)
+
+        if status_changed:
+            self.flush()
+        else:
+            self._ensure_flusher()
+        return True
+
+    def get(self, task_id: str) -> Optional[dict]:
+        with self._lock:
+            state = self._tasks.get(task_id)
+            return dict(state) if state else None
+
+    def get_active(self) -> list[dict]:
+        """
+        获取所有正在运行的任务
+        """
+        with self._lock:
+            return [dict(t) for t in self._tasks.values() if t["status"] == "running"]
+
+    def flush(self):
+        """
+        将脏任务批量写回数据库，已结束的任务写回后从内存移除
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                states = [dict(self._tasks[task_id]) for task_id in self._dirty if task_id in self._tasks]
+                self._dirty.clear()
+            with next(get_session()) as session:
+                save_task_states(session, states)
+            with self._lock:
+                for state in states:
+                    task_id = state["id"]
+                    if (
+                        state["status"] in FINISHED_STATUSES
+                        and task_id in self._tasks
+                        and self._tasks[task_id]["status"] in FINISHED_STATUSES
+                        and task_id not in self._dirty
+                    ):
+                        del self._tasks[task_id]
+            event_broker.publish("tasks", self.get_active())
+
+    def close(self):
+        """
+        停止后台写回线程并写回剩余进度
+        """
+        self._stop.set()
+        self.flush()
+
+    def _load(self, task_id: str) -> Optional[dict]:
+        with next(get_session()) as session:
+            task = session.query(Task).filter_by(id=task_id).first()
+            if not task:
+                return None
+            state = self._to_state(task)
+        with self._lock:
+            return self._tasks.setdefault(task_id, state)
+
+    @staticmethod
+    def _to_state(task: Task) -> dict:
+        return {
+            "id": task.id,
+            "target_id": task.target_id,
+            "status": task.status,
+            "progress": task.progress,
+            "message": task.message,
+            "updated_at": task.updated_at,
+        }
+
+
+# 单例
+task_registry = TaskRegistry()
+event_broker.register_snapshot("tasks", task_registry.get_active)
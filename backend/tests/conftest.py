@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+# 数据库与下载目录指向临时目录，须在导入任何后端模块之前设置
+_tmp = tempfile.mkdtemp(prefix="douyin-test-")
+os.environ["DATA_DIR"] = os.path.join(_tmp, "data")
+os.environ["SAVE_DIR"] = os.path.join(_tmp, "videos")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import http_client  # noqa: E402
+import rate_limiter  # noqa: E402
+import resilience  # noqa: E402
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch):
+    """
+    返回 install(handler)：上游请求交给 handler 处理，并去掉限速、退避等待与熔断状态
+    """
+    def install(handler):
+        monkeypatch.setattr(http_client, "_client", httpx.Client(transport=httpx.MockTransport(handler)))
+        monkeypatch.setattr(http_client, "_async_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    monkeypatch.setattr(rate_limiter.AdaptiveLimiter, "acquire", lambda self: None)
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+    resilience._breakers.clear()
+    yield install
+    resilience._breakers.clear()
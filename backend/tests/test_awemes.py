@@ -0,0 +1,29 @@
+from db import engine, get_session, list_awemes, Aweme
+
+
+def _collect(session, **filters) -> list[str]:
+    seen, before = [], None
+    while True:
+        rows = list_awemes(session, 2, before=before, **filters)
+        seen += [row.aweme_id for row in rows[:2]]
+        if len(rows) <= 2:
+            return seen
+        before = (rows[1].create_time or 0, rows[1].id)
+
+
+def test_pagination_includes_rows_without_create_time():
+    with next(get_session()) as session:
+        times = {"p1": 1700000003, "p2": None, "p3": 1700000001, "p4": None, "p5": 1700000002}
+        session.add_all(Aweme(aweme_id=k, uid="paging", create_time=v) for k, v in times.items())
+        session.commit()
+        assert _collect(session, uid="paging") == ["p1", "p5", "p3", "p4", "p2"]
+
+
+def test_pagination_uses_sort_index():
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM awemes WHERE uid = 'x'"
+            " ORDER BY coalesce(create_time, 0) DESC, id DESC LIMIT 10"
+        ).all()
+    detail = " ".join(row[-1] for row in plan)
+    assert "ix_awemes_uid_sort_time" in detail and "TEMP B-TREE" not in detail
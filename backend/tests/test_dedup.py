@@ -0,0 +1,103 @@
+import os
+
+import httpx
+import pytest
+
+import dedup
+import downloader
+from db import get_session, get_media_files_by_aweme
+
+
+@pytest.fixture
+def serve(mock_upstream):
+    """上游对任何下载请求都返回 serve.body，serve.calls 记录请求次数"""
+    class Upstream:
+        body = b""
+        calls = 0
+
+        def __call__(self, request: httpx.Request) -> httpx.Response:
+            self.calls += 1
+            return httpx.Response(200, content=self.body, headers={"content-type": "video/mp4"})
+
+    upstream = Upstream()
+    mock_upstream(upstream)
+    return upstream
+
+
+def _download(folder: str, aweme_id: str) -> str:
+    assert downloader.download_video("https://v.douyin.com/x/", folder, "video", aweme_id)
+    return os.path.join(downloader.SAVE_DIR, folder, "video.mp4")
+
+
+def _paths(aweme_id: str) -> set[str]:
+    with next(get_session()) as session:
+        return {row.path for row in get_media_files_by_aweme(session, aweme_id)}
+
+
+def test_identical_downloads_share_an_inode(serve):
+    serve.body = b"same content" * 512
+    first = _download("dedup_a", "7400000000000000001")
+    second = _download("dedup_b", "7400000000000000002")
+    assert serve.calls == 2
+    assert os.path.samefile(first, second)
+    with open(second, "rb") as f:
+        assert f.read() == serve.body
+
+
+def test_restore_recreates_deleted_target_from_twin(serve):
+    serve.body = b"restore me" * 512
+    aweme_id = "7400000000000000003"
+    original = _download("restore_a", aweme_id)
+    twin = _download("restore_b", aweme_id)
+    # 第二个目录直接从已有文件硬链接，不请求上游
+    assert serve.calls == 1
+    assert os.path.samefile(original, twin)
+
+    os.remove(twin)
+    assert _download("restore_b", aweme_id) == twin
+    assert serve.calls == 1
+    assert os.path.samefile(original, twin)
+
+
+def test_modified_source_falls_through_to_download(serve):
+    serve.body = b"original" * 512
+    aweme_id = "7400000000000000004"
+    source = _download("mismatch_a", aweme_id)
+    # 大小不变但内容被改写，登记的哈希已失效
+    mtime_ns = os.stat(source).st_mtime_ns
+    with open(source, "wb") as f:
+        f.write(b"tampered" * 512)
+    # 时间戳精度较粗的文件系统上，紧接着的改写可能得到相同的 mtime
+    os.utime(source, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+
+    target = _download("mismatch_b", aweme_id)
+    assert serve.calls == 2
+    assert not os.path.samefile(source, target)
+    with open(target, "rb") as f:
+        assert f.read() == serve.body
+    with open(source, "rb") as f:
+        assert f.read() == b"tampered" * 512
+    assert _paths(aweme_id) == {os.path.join("mismatch_b", "video.mp4")}
+
+
+def test_missing_source_falls_through_to_download(serve):
+    serve.body = b"vanished" * 512
+    aweme_id = "7400000000000000005"
+    os.remove(_download("missing_a", aweme_id))
+
+    target = _download("missing_b", aweme_id)
+    assert serve.calls == 2
+    with open(target, "rb") as f:
+        assert f.read() == serve.body
+    assert _paths(aweme_id) == {os.path.join("missing_b", "video.mp4")}
+
+
+def test_unchanged_files_are_not_rehashed(serve, monkeypatch):
+    serve.body = b"hash once" * 512
+    aweme_id = "7400000000000000006"
+    original = _download("rehash_a", aweme_id)
+    # stat 签名未变化时不应重新读取已有文件
+    monkeypatch.setattr(dedup, "hash_prefix", lambda *args: pytest.fail("重新计算了未变化文件的哈希"))
+    twin = _download("rehash_b", aweme_id)
+    assert serve.calls == 1
+    assert os.path.samefile(original, twin)
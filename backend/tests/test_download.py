@@ -0,0 +1,70 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+import downloader
+import resilience
+from db import get_session, get_partial_download, save_partial_download
+
+AWEME_ID = "7300000000000000416"
+BODY = b"x" * 4096
+
+
+@pytest.fixture
+def requests(mock_upstream, monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("range"))
+        if request.headers.get("range"):
+            return httpx.Response(416)
+        return httpx.Response(200, content=BODY, headers={"content-type": "video/mp4"})
+
+    mock_upstream(handler)
+    # 416 不应触发退避，一旦进入退避即视为失败
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: pytest.fail("416 消耗了一次重试"))
+    return seen
+
+
+def test_stale_resume_offset_restarts_without_retry(requests):
+    parent = os.path.join(downloader.SAVE_DIR, "tester")
+    os.makedirs(parent, exist_ok=True)
+    part_path = downloader._part_path(parent, AWEME_ID)
+    with open(part_path, "wb") as f:
+        f.write(b"stale" * 100)
+    with next(get_session()) as session:
+        save_partial_download(session, AWEME_ID, part_path, 500, 8192, '"etag"')
+
+    assert downloader.download_video("https://v.douyin.com/x/", "tester", "video", AWEME_ID)
+    assert requests == ["bytes=500-", None]
+    with open(os.path.join(parent, "video.mp4"), "rb") as f:
+        assert f.read() == BODY
+    assert not os.path.exists(part_path)
+    with next(get_session()) as session:
+        assert get_partial_download(session, AWEME_ID) is None
+
+
+def test_concurrent_downloads_of_one_aweme_are_serialized(mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(threading.current_thread().name)
+        # 慢速上游，保证两个下载在时间上重叠
+        time.sleep(0.2)
+        return httpx.Response(200, content=BODY, headers={"content-type": "video/mp4"})
+
+    mock_upstream(handler)
+    aweme_id = "7300000000000000417"
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(downloader.download_video, "u", "concurrent/videos", "v", aweme_id) for _ in range(2)]
+        results = [future.result() for future in futures]
+
+    assert results == [True, True]
+    # 后到的一方复用已下载的文件，不再请求上游
+    assert len(calls) == 1
+    with open(os.path.join(downloader.SAVE_DIR, "concurrent", "videos", "v.mp4"), "rb") as f:
+        assert f.read() == BODY
@@ -0,0 +1,66 @@
+import threading
+import time
+
+from db import get_session, set_config, Aweme
+from download_engine import DownloadPipeline, get_download_workers
+
+
+def test_download_workers_is_a_process_wide_limit():
+    with next(get_session()) as session:
+        set_config(session, "download_workers_limit-test", "2")
+        session.add_all(Aweme(aweme_id=f"limit-{i}", uid="limit", platform="limit-test") for i in range(12))
+        session.commit()
+
+    lock = threading.Lock()
+    state = {"active": 0, "peak": 0}
+    succeeded = []
+
+    def job(session, aweme):
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        time.sleep(0.02)
+        with lock:
+            state["active"] -= 1
+        return True
+
+    def sync_user(offset):
+        # 模拟自动更新时多个用户各自创建下载引擎
+        with next(get_session()) as session:
+            awemes = session.query(Aweme).filter(Aweme.aweme_id.in_([f"limit-{i}" for i in range(offset, offset + 4)])).all()
+            with DownloadPipeline(session, job) as pipeline:
+                pipeline.submit(awemes)
+                succeeded.append(pipeline.join())
+
+    threads = [threading.Thread(target=sync_user, args=(offset,)) for offset in (0, 4, 8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert succeeded == [4, 4, 4]
+    assert state["peak"] == 2
+
+
+def test_platform_download_workers_round_trip_through_settings():
+    from fastapi.testclient import TestClient
+    from main import app
+    from auth import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: "root"
+    try:
+        client = TestClient(app)
+        settings = client.get("/api/settings").json()
+        body = {**settings, "download_workers": 4, "platform_download_workers": {"douyin": 99, "tiktok": None}}
+        assert client.post("/api/settings", json=body).status_code == 200
+        assert client.get("/api/settings").json()["platform_download_workers"] == {"douyin": 16, "tiktok": None}
+
+        # 清除单独设置后跟随全局并发数
+        body["platform_download_workers"] = {"douyin": None}
+        client.post("/api/settings", json=body)
+        with next(get_session()) as session:
+            assert get_download_workers(session, "douyin") == 4
+
+        body["platform_download_workers"] = {"weibo": 2}
+        assert client.post("/api/settings", json=body).status_code == 400
+    finally:
+        app.dependency_overrides.clear()
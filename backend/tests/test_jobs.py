@@ -0,0 +1,133 @@
+import time
+
+from db import get_session, enqueue_job, lease_job, requeue_leased_jobs, Job
+from job_queue import JobQueue
+from resilience import CircuitOpenError
+
+
+def test_restart_does_not_consume_attempts():
+    with next(get_session()) as session:
+        job_id = enqueue_job(session, "test_restart", "{}", max_attempts=2)
+        # 连续三次在执行中被重启打断
+        for _ in range(3):
+            leased = lease_job(session, "worker-a", 60)
+            assert leased[0] == job_id and leased[4] == 1
+            requeue_leased_jobs(session)
+        job = session.query(Job).filter_by(id=job_id).one()
+        assert job.status == "queued"
+        assert job.attempts == 0
+
+
+def _lease(session, job_id: int, owner: str):
+    # 与 lease_job 相同：领取时计入一次尝试
+    session.query(Job).filter_by(id=job_id).update(
+        {"status": "leased", "lease_owner": owner, "attempts": Job.attempts + 1}
+    )
+    session.commit()
+
+
+def test_open_circuit_defers_without_consuming_attempts():
+    queue = JobQueue()
+
+    def handler(payload, task_id):
+        raise CircuitOpenError("上游 test 暂时不可用，已断路", retry_in=42.5)
+
+    queue.register("test_circuit", handler)
+    with next(get_session()) as session:
+        job_id = enqueue_job(session, "test_circuit", "{}", max_attempts=1)
+        # 只有一次尝试机会，断路若计入失败会直接进入死信
+        for _ in range(3):
+            _lease(session, job_id, "worker-a")
+            queue._execute("worker-a", job_id, "test_circuit", "{}", None, 1, 1)
+            session.expire_all()
+            job = session.query(Job).filter_by(id=job_id).one()
+            assert (job.status, job.attempts) == ("queued", 0)
+            assert job.run_after >= int(time.time()) + 42
+
+
+def test_dead_jobs_can_be_listed_and_requeued():
+    from fastapi.testclient import TestClient
+    from main import app
+    from auth import get_current_user
+    from db import fail_job
+
+    with next(get_session()) as session:
+        job_id = enqueue_job(session, "test_dead", "{}", max_attempts=1)
+        fail_job(session, job_id, "boom")
+
+    app.dependency_overrides[get_current_user] = lambda: "root"
+    try:
+        client = TestClient(app)
+        dead = client.get("/api/jobs", params={"status": "dead"}).json()
+        assert [job["last_error"] for job in dead if job["id"] == job_id] == ["boom"]
+        assert client.post(f"/api/jobs/{job_id}/requeue").status_code == 200
+        assert client.post(f"/api/jobs/{job_id}/requeue").status_code == 404
+    finally:
+        app.dependency_overrides.clear()
+
+    with next(get_session()) as session:
+        job = session.query(Job).filter_by(id=job_id).one()
+        assert (job.status, job.attempts) == ("queued", 0)
+
+
+def test_unique_enqueue_matches_payload():
+    queue = JobQueue()
+    first = queue.enqueue("test_unique", {"sec_user_id": "a", "platform": "douyin"}, task_id="t-a", unique=True)
+    assert queue.enqueue("test_unique", {"platform": "douyin", "sec_user_id": "a"}, task_id="t-b", unique=True) == first
+    assert queue.get_task_id(first) == "t-a"
+    assert queue.enqueue("test_unique", {"sec_user_id": "b", "platform": "douyin"}, unique=True) != first
+
+
+def test_stale_lease_holder_does_not_overwrite_result():
+    queue = JobQueue()
+    queue.register("test_stale", lambda payload, task_id: None)
+    with next(get_session()) as session:
+        job_id = enqueue_job(session, "test_stale", "{}")
+        _lease(session, job_id, "worker-a")
+        # worker-a 续租失败、租约过期后，任务被 worker-b 重新领取
+        _lease(session, job_id, "worker-b")
+        queue._execute("worker-a", job_id, "test_stale", "{}", None, 1, 3)
+        session.expire_all()
+        job = session.query(Job).filter_by(id=job_id).one()
+        assert (job.status, job.lease_owner, job.attempts) == ("leased", "worker-b", 2)
+
+
+def test_failure_during_shutdown_keeps_job_leased():
+    queue = JobQueue()
+
+    def handler(payload, task_id):
+        raise RuntimeError("client has been closed")
+
+    queue.register("test_shutdown", handler)
+    queue.stop()
+    with next(get_session()) as session:
+        job_id = enqueue_job(session, "test_shutdown", "{}", max_attempts=1)
+        _lease(session, job_id, "worker-a")
+        queue._execute("worker-a", job_id, "test_shutdown", "{}", None, 1, 1)
+        session.expire_all()
+        job = session.query(Job).filter_by(id=job_id).one()
+        assert (job.status, job.attempts) == ("leased", 1)
+        # 下次启动时恢复，且不计入失败次数
+        requeue_leased_jobs(session)
+        session.expire_all()
+        assert session.query(Job).filter_by(id=job_id).one().attempts == 0
+
+
+def test_concurrent_check_undownloaded_requests_share_one_job():
+    from concurrent.futures import ThreadPoolExecutor
+    from fastapi.testclient import TestClient
+    from main import app
+    from auth import get_current_user
+
+    app.dependency_overrides[get_current_user] = lambda: "root"
+    try:
+        client = TestClient(app)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(lambda _: client.post("/api/tasks/check_undownloaded").json(), range(4)))
+    finally:
+        app.dependency_overrides.clear()
+
+    assert len({r["task_id"] for r in responses}) == 1
+    with next(get_session()) as session:
+        pending = session.query(Job).filter(Job.kind == "check_undownloaded", Job.status.in_(["queued", "leased"]))
+        assert pending.count() == 1
@@ -0,0 +1,26 @@
+from logtail import tail_lines, read_from
+
+
+def test_tail_holds_back_unterminated_line(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_bytes(b"one\ntwo\nthr")
+
+    tail = tail_lines(str(path), 5)
+    assert tail["logs"] == ["one\n", "two\n"]
+    assert tail["offset"] == len(b"one\ntwo\n")
+
+    with open(path, "ab") as f:
+        f.write(b"ee\nfour\n")
+    chunk = read_from(str(path), tail["offset"], tail["file_id"])
+    assert chunk["logs"] == ["three\n", "four\n"]
+
+
+def test_tail_reads_back_across_blocks(tmp_path, monkeypatch):
+    import logtail
+    monkeypatch.setattr(logtail, "TAIL_BLOCK_SIZE", 4)
+    path = tmp_path / "app.log"
+    path.write_bytes(b"".join(f"line {i}\n".encode() for i in range(10)) + b"partial")
+
+    tail = tail_lines(str(path), 3)
+    assert tail["logs"] == ["line 7\n", "line 8\n", "line 9\n"]
+    assert tail["offset"] == path.stat().st_size - len(b"partial")
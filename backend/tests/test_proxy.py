@@ -0,0 +1,63 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from auth import get_current_user
+from config import config
+from main import app
+from resilience import get_breaker
+
+BODY = b"proxied" * 1024
+
+
+@pytest.fixture
+def client():
+    app.dependency_overrides[get_current_user] = lambda: "root"
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def _proxy(client):
+    return client.get("/api/download_proxy", params={"share_url": "https://www.douyin.com/video/1", "filename": "v"})
+
+
+async def _chunks():
+    # bytes 内容会被 httpx 预先读完，无法 aiter_raw，用异步迭代器模拟真实的流式响应
+    for i in range(0, len(BODY), 1024):
+        yield BODY[i:i + 1024]
+
+
+def test_proxy_streams_upstream_body(client, mock_upstream):
+    def handler(request: httpx.Request) -> httpx.Response:
+        if str(request.url).startswith(config.DOWNLOAD_API):
+            return httpx.Response(200, content=_chunks(), headers={"content-type": "video/mp4"})
+        return httpx.Response(200)
+
+    mock_upstream(handler)
+    resp = _proxy(client)
+    assert resp.status_code == 200
+    assert resp.content == BODY
+
+
+def test_proxy_goes_through_download_breaker(client, mock_upstream):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if str(request.url).startswith(config.DOWNLOAD_API):
+            calls.append(request.url)
+            return httpx.Response(503)
+        return httpx.Response(200)
+
+    mock_upstream(handler)
+    breaker = get_breaker("download")
+    # 5xx 按退避重试，并计入 download 断路器
+    assert _proxy(client).status_code == 502
+    assert len(calls) == breaker.failures == 3
+
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert _proxy(client).status_code == 503
+    assert len(calls) == 3
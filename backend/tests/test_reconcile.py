@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import reconcile
+from db import get_session, Aweme
+
+UID = "20002"
+NICKNAME = "reconciler"
+
+
+@pytest.fixture
+def save_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(reconcile, "SAVE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _add(aweme_id: str, desc: str, downloaded: bool):
+    with next(get_session()) as session:
+        session.add(Aweme(aweme_id=aweme_id, uid=UID, nickname=NICKNAME, desc=desc, aweme_type=0, downloaded=downloaded))
+        session.commit()
+
+
+def _flags(*aweme_ids: str) -> dict[str, bool]:
+    with next(get_session()) as session:
+        rows = session.query(Aweme.aweme_id, Aweme.downloaded).filter(Aweme.aweme_id.in_(aweme_ids))
+        return dict(rows.all())
+
+
+def _touch(save_dir, name: str):
+    videos = save_dir / f"{NICKNAME}_{UID}" / "videos"
+    videos.mkdir(parents=True, exist_ok=True)
+    (videos / name).write_bytes(b"video")
+
+
+def test_flags_follow_files_and_unchanged_dirs_are_skipped(save_dir):
+    _add("rc_found", "找到的作品", downloaded=False)
+    _add("rc_lost", "丢失的作品", downloaded=True)
+    # 两个作品 desc 相同，推算出的路径相同，无法判断文件属于哪一个
+    _add("rc_shared_a", "同名作品", downloaded=True)
+    _add("rc_shared_b", "同名作品", downloaded=False)
+    _touch(save_dir, "找到的作品.mp4")
+    _touch(save_dir, "同名作品.mp4")
+
+    first = reconcile.reconcile_downloads()
+    assert _flags("rc_found", "rc_lost", "rc_shared_a", "rc_shared_b") == {
+        "rc_found": True,
+        "rc_lost": False,
+        "rc_shared_a": True,
+        "rc_shared_b": False,
+    }
+    assert first["dirs_scanned"] == first["dirs"] == 3
+
+    second = reconcile.reconcile_downloads()
+    assert second["dirs_skipped"] == second["dirs"] == 3
+    assert second["marked_downloaded"] == second["marked_missing"] == 0
+
+    # 文件删除后目录 mtime 变化，只重新扫描该目录
+    os.remove(save_dir / f"{NICKNAME}_{UID}" / "videos" / "找到的作品.mp4")
+    third = reconcile.reconcile_downloads()
+    assert third["dirs_scanned"] == 1
+    assert _flags("rc_found") == {"rc_found": False}
+
+
+def test_empty_save_dir_does_not_mark_missing(save_dir):
+    _add("rc_unmounted", "存储未挂载", downloaded=True)
+
+    result = reconcile.reconcile_downloads()
+    assert result["files"] == 0
+    assert result["marked_missing"] == 0
+    assert _flags("rc_unmounted") == {"rc_unmounted": True}
+
+
+def test_nickname_with_separator_matches_downloader_layout(save_dir):
+    with next(get_session()) as session:
+        session.add(Aweme(aweme_id="rc_slash", uid=UID, nickname="左/右", desc="斜杠作者", aweme_type=0, downloaded=True))
+        session.commit()
+    # 下载器把昵称中的 / 当作目录分隔符
+    videos = save_dir / "左" / f"右_{UID}" / "videos"
+    videos.mkdir(parents=True)
+    (videos / "斜杠作者.mp4").write_bytes(b"video")
+
+    reconcile.reconcile_downloads()
+    assert _flags("rc_slash") == {"rc_slash": True}
@@ -0,0 +1,45 @@
+import httpx
+import pytest
+
+from resilience import CircuitBreaker, call_with_retry, get_breaker
+
+
+def _raise(exc):
+    def fn():
+        raise exc
+    return fn
+
+
+def _status_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://example.com/")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.fixture
+def breaker(mock_upstream) -> CircuitBreaker:
+    return get_breaker("test")
+
+
+def test_local_errors_leave_breaker_state_alone(breaker):
+    for _ in range(3):
+        breaker.record_failure()
+    with pytest.raises(OSError):
+        call_with_retry("test", _raise(OSError("No space left on device")))
+    assert (breaker.state, breaker.failures) == ("closed", 3)
+
+
+def test_local_error_in_half_open_probe_does_not_close_breaker(breaker):
+    breaker.state = "half_open"
+    with pytest.raises(ValueError):
+        call_with_retry("test", _raise(ValueError("bad json")))
+    assert breaker.state == "half_open"
+    # 试探名额已释放，下一个请求可以继续试探
+    assert call_with_retry("test", lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_client_error_response_counts_as_upstream_available(breaker):
+    breaker.state = "half_open"
+    with pytest.raises(httpx.HTTPStatusError):
+        call_with_retry("test", _raise(_status_error(404)))
+    assert (breaker.state, breaker.failures) == ("closed", 0)
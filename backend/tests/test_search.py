@@ -0,0 +1,109 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+import db
+from db import (
+    get_session,
+    search_awemes,
+    backfill_search_index,
+    get_search_index_status,
+    invalidate_config_cache,
+    run_migrations,
+    Aweme,
+    Base,
+    engine,
+)
+
+
+def _found(session, query: str, **filters) -> list[str]:
+    return [row["aweme_id"] for row in search_awemes(session, query, 20, **filters)[0]]
+
+
+def test_triggers_follow_insert_update_delete():
+    with next(get_session()) as session:
+        aweme = Aweme(aweme_id="fts1", uid="fts", desc="夏日海边的日落")
+        session.add(aweme)
+        session.commit()
+        assert _found(session, "海边的", uid="fts") == ["fts1"]
+
+        aweme.desc = "冬天雪山的日出"
+        session.commit()
+        assert _found(session, "海边的", uid="fts") == []
+        assert _found(session, "雪山的", uid="fts") == ["fts1"]
+
+        session.delete(aweme)
+        session.commit()
+        assert _found(session, "雪山的", uid="fts") == []
+
+
+def test_snippet_escapes_html():
+    with next(get_session()) as session:
+        session.add(Aweme(aweme_id="fts2", uid="fts_html", desc="1<b>2 &"))
+        session.commit()
+        [row], _ = search_awemes(session, "<b>", 20, uid="fts_html")
+        assert row["snippet"] == "1<mark>&lt;b&gt;</mark>2 &amp;"
+
+
+def test_backfill_indexes_rows_from_before_migration(tmp_path, monkeypatch):
+    # 模拟升级前的旧库：表已存在、有存量作品，但尚未执行全文索引迁移（v3）
+    old_engine = create_engine(f"sqlite:///{os.path.join(tmp_path, 'old.db')}")
+    Base.metadata.create_all(bind=old_engine)
+    with Session(old_engine) as session:
+        session.add_all(Aweme(aweme_id=f"old{i}", uid="legacy", desc=f"旧作品 第{i}集 回忆录") for i in range(5))
+        session.commit()
+    with old_engine.begin() as conn:
+        conn.exec_driver_sql("PRAGMA user_version = 2")
+
+    monkeypatch.setattr(db, "engine", old_engine)
+    invalidate_config_cache()
+    try:
+        run_migrations()
+        with Session(old_engine) as session:
+            assert get_search_index_status(session)["pending"]
+            assert _found(session, "回忆录") == []
+
+            # 迁移后新写入的作品由触发器直接索引
+            session.add(Aweme(aweme_id="new", uid="legacy", desc="新作品 回忆录"))
+            session.commit()
+            assert _found(session, "回忆录") == ["new"]
+
+            while backfill_search_index(session, batch_size=2)["pending"]:
+                pass
+            assert sorted(_found(session, "回忆录")) == ["new"] + [f"old{i}" for i in range(5)]
+    finally:
+        invalidate_config_cache()
+        old_engine.dispose()
+
+
+def test_short_term_fallback_walks_time_index():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        with next(get_session()) as session:
+            search_awemes(session, "日落", 20, uid="fts")
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    statement, parameters = statements[-1]
+    with engine.connect() as conn:
+        plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    detail = " ".join(row[-1] for row in plan)
+    assert "ix_awemes_uid_sort_time" in detail and "TEMP B-TREE" not in detail
+
+
+def test_search_reports_truncated_candidates(monkeypatch):
+    monkeypatch.setattr(db, "SEARCH_MAX_CANDIDATES", 2)
+    with next(get_session()) as session:
+        session.add_all(Aweme(aweme_id=f"many{i}", uid="fts_many", desc=f"热门话题 {i}") for i in range(3))
+        session.commit()
+        rows, truncated = search_awemes(session, "热门话题", 20, uid="fts_many")
+        assert truncated
+        # 只在最近入库的 2 条命中中排序
+        assert sorted(row["aweme_id"] for row in rows) == ["many1", "many2"]
+        assert not search_awemes(session, "热门话题", 20, uid="fts_html")[1]
@@ -0,0 +1,79 @@
+import httpx
+import pytest
+
+from api import sync_user_videos
+from config import config
+from db import get_session, get_config, set_config, invalidate_config_cache, Aweme, Config, User
+
+SEC_USER_ID = "MS4wLjABAAAA_test"
+UID = "10001"
+# 上游按发布时间倒序分页：第一页 20 个较新的作品，第二页 10 个较旧的作品
+NEWER = [1700000100 - i for i in range(20)]
+OLDER = [1700000000 - i for i in range(10)]
+
+
+def _aweme(create_time: int) -> dict:
+    return {
+        "aweme_id": str(create_time),
+        "desc": f"作品 {create_time}",
+        "create_time": create_time,
+        "aweme_type": 0,
+        "author": {"uid": UID, "nickname": "tester", "signature": ""},
+    }
+
+
+class FakeUpstream:
+    def __init__(self):
+        self.fail_second_page = True
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        if not str(request.url).startswith(config.FETCH_USER_POST_API):
+            return httpx.Response(404)
+        cursor = int(request.url.params.get("max_cursor", "0"))
+        if cursor == 0:
+            return httpx.Response(200, json={"data": {"aweme_list": [_aweme(t) for t in NEWER], "max_cursor": 1}})
+        if self.fail_second_page:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"data": {"aweme_list": [_aweme(t) for t in OLDER], "max_cursor": 0}})
+
+
+@pytest.fixture
+def upstream(mock_upstream):
+    fake = FakeUpstream()
+    mock_upstream(fake)
+    with next(get_session()) as session:
+        previous = get_config(session, "download_video")
+        # 只测试抓取与入库，不触发下载
+        set_config(session, "download_video", "false")
+    yield fake
+    with next(get_session()) as session:
+        if previous is None:
+            session.query(Config).filter_by(key="download_video").delete()
+            session.commit()
+            invalidate_config_cache()
+        else:
+            set_config(session, "download_video", previous)
+
+
+def _stored(session) -> int:
+    return session.query(Aweme).filter_by(uid=UID).count()
+
+
+def test_partial_pagination_failure_is_refetched(upstream):
+    with next(get_session()) as session:
+        with pytest.raises(httpx.HTTPStatusError):
+            sync_user_videos(session, SEC_USER_ID)
+        # 第一页已入库，但水位不能推进，否则第二页的旧作品再也不会被抓取
+        assert _stored(session) == len(NEWER)
+        assert not session.query(User).filter_by(uid=UID).one().sync_watermark
+
+    upstream.fail_second_page = False
+    with next(get_session()) as session:
+        result = sync_user_videos(session, SEC_USER_ID)
+        assert result["error"] is None
+        assert _stored(session) == len(NEWER) + len(OLDER)
+        assert session.query(User).filter_by(uid=UID).one().sync_watermark == max(NEWER)
+
+    # 完整同步后再次同步只看水位之后的作品
+    with next(get_session()) as session:
+        assert sync_user_videos(session, SEC_USER_ID)["fetched"] == 0
@@ -1,7 +1,17 @@
+import os
 import re
-import httpx
 from loguru import logger
 from config import config
+from http_client import get_client
+from cache import TTLCache, register_cache
+
+# 短链 -> 最终 URL，解析页面后紧接着下载时不必再走一遍跳转链
+_redirect_cache = register_cache(TTLCache(
+    "redirect",
+    max_size=config.REDIRECT_CACHE_SIZE,
+    ttl=config.REDIRECT_CACHE_TTL,
+    persist=config.REDIRECT_CACHE_PERSIST,
+))
 
 def extract_share_url(text: str) -> str:
     """
@@ -26,33 +36,36 @@ def get_url_platform(url: str) -> str:
 def resolve_redirect(url: str, max_redirects=5, timeout=10) -> str:
     """
     处理 302/301 跳转，获取最终 URL
+    成功解析的结果会被缓存，失败时回退到原 URL 且不缓存
     """
+    cached = _redirect_cache.get(url)
+    if cached is not None:
+        return cached
+
     headers = {
         "User-Agent": "Mozilla/5.0"
     }
 
     try:
-        with httpx.Client(
-            follow_redirects=False,
-            timeout=timeout,
-            headers=headers
-        ) as client:
-            current_url = url
-
-            for _ in range(max_redirects):
-                resp = client.get(current_url)
-
-                if resp.status_code in (301, 302, 303, 307, 308):
-                    location = resp.headers.get("Location")
-                    if not location:
-                        break # 虽然是跳转但没 Location，就返回当前 URL
-
-                    # 处理相对跳转
-                    current_url = str(resp.url.join(location))
-                    continue
-
-                # 已经不是跳转
-                return str(resp.url)
+        client = get_client()
+        current_url = url
+
+        for _ in range(max_redirects):
+            resp = client.get(current_url, headers=headers, follow_redirects=False, timeout=timeout)
+
+            if resp.status_code in (301, 302, 303, 307, 308):
+                location = resp.headers.get("Location")
+                if not location:
+                    break # 虽然是跳转但没 Location，就返回当前 URL
+
+                # 处理相对跳转
+                current_url = str(resp.url.join(location))
+                continue
+
+            # 已经不是跳转
+            final_url = str(resp.url)
+            _redirect_cache.set(url, final_url)
+            return final_url
     except Exception:
         # 即使报错也回退到使用原 URL
         return url
@@ -69,12 +82,11 @@ def extract_sec_user_id(url: str) -> str:
     if platform == "tiktok":
         # 对于 TikTok，调用专用 API 获取 sec_user_id
         try:
-            with httpx.Client(timeout=10) as client:
-                resp = client.get(config.TIKTOK_SEC_USER_ID_API, params={"url": url})
-                resp.raise_for_status()
-                data = resp.json()
-                if data.get("code") == 200:
-                    return data.get("data")
+            resp = get_client().get(config.TIKTOK_SEC_USER_ID_API, params={"url": url}, timeout=10)
+            resp.raise_for_status()
+            data = resp.json()
+            if data.get("code") == 200:
+                return data.get("data")
         except Exception as e:
             logger.error(f"获取 TikTok sec_user_id 失败: {e}")
         raise ValueError("无法获取 TikTok sec_user_id")
@@ -94,3 +106,16 @@ def sanitize_filename(name: str) -> str:
     if len(name) > 50:
         name = name[:50]
     return name or "downloaded_video"
+
+
+def author_folder(nickname: str, uid: str, aweme_type: int) -> str:
+    """作品所在的作者子目录：{nickname}_{uid}/videos 或 {nickname}_{uid}/notes（图文）"""
+    return os.path.join(f"{nickname}_{uid}", "notes" if aweme_type == 68 else "videos")
+
+
+def sanitize_path_parts(folder: str) -> list[str]:
+    """
+    将多级目录按分隔符拆分，分别过滤非法字符，保留层级结构
+    昵称中的 / 或 \\ 也会被当作分隔符，下载与对账必须用同一规则推算路径
+    """
+    return [sanitize_filename(p) for p in folder.replace("\\", "/").split("/") if p]
@@ -1,7 +1,7 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Plus, Search, RefreshCw, LogOut, Settings as SettingsIcon, Loader2, Activity, Terminal } from 'lucide-react';
-import type { User, ToastType, Task } from './types';
+import type { User, ToastType, Task, SchedulerStatus } from './types';
 import * as api from './api';
 import { UserCard } from './components/UserCard';
 import { Toast } from './components/Toast';
@@ -18,6 +18,8 @@ function App() {
   const [view, setView] = useState<'dashboard' | 'settings' | 'tasks' | 'logs'>('dashboard');
   const [users, setUsers] = useState<User[]>([]);
   const [activeTasks, setActiveTasks] = useState<Task[]>([]);
+  const [schedulerStatus, setSchedulerStatus] = useState<SchedulerStatus | null>(null);
+  const activeTaskCount = useRef(0);
   const [loading, setLoading] = useState(true);
   const [newUserUrl, setNewUserUrl] = useState('');
   const [search, setSearch] = useState('');
@@ -48,19 +50,14 @@ function App() {
     }
   }, []);
 
-  const pollTasks = useCallback(async () => {
-    try {
-      const tasks = await api.getActiveTasks();
-      setActiveTasks(tasks);
-
-      // 如果有任务完成，刷新列表
-      if (activeTasks.length > 0 && tasks.length < activeTasks.length) {
-        loadUsers();
-      }
-    } catch (err) {
-      console.error('Polling failed', err);
+  const handleTasksEvent = useCallback((tasks: Task[]) => {
+    // 如果有任务完成，刷新列表
+    if (activeTaskCount.current > 0 && tasks.length < activeTaskCount.current) {
+      loadUsers();
     }
-  }, [activeTasks, loadUsers]);
+    activeTaskCount.current = tasks.length;
+    setActiveTasks(tasks);
+  }, [loadUsers]);
 
   const checkAuth = useCallback(async () => {
     try {
@@ -81,10 +78,10 @@ function App() {
 
   useEffect(() => {
     if (isLoggedIn) {
-      const timer = setInterval(pollTasks, 2000);
-      return () => clearInterval(timer);
+      // 由后端推送任务与调度器状态，取代定时轮询
+      return api.subscribeEvents({ tasks: handleTasksEvent, scheduler: setSchedulerStatus });
     }
-  }, [isLoggedIn, pollTasks]);
+  }, [isLoggedIn, handleTasksEvent]);
 
   const handleAddUser = async (e: React.FormEvent) => {
     e.preventDefault();
@@ -143,6 +140,7 @@ function App() {
       setIsLoggedIn(false);
       setUsers([]);
       setActiveTasks([]);
+      activeTaskCount.current = 0;
       showToast('已登出', 'success');
     } catch (error) {
       showToast('登出失败', 'error');
@@ -213,7 +211,7 @@ function App() {
         <Settings onBack={() => setView('dashboard')} onNotify={showToast} />
       ) : view === 'tasks' ? (
         <main className="max-w-7xl mx-auto px-6 pt-12">
-          <Tasks onNotify={showToast} activeTasks={activeTasks} />
+          <Tasks onNotify={showToast} activeTasks={activeTasks} schedulerStatus={schedulerStatus} />
         </main>
       ) : view === 'logs' ? (
         <main className="max-w-7xl mx-auto px-6 pt-12">
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import type { User, ApiResponse, ShareDownloadResult, Task, GlobalSettings, AuthResponse, VideoParseInfo, SchedulerStatus } from '../types';
+import type { User, Page, ApiResponse, ShareDownloadResult, Task, GlobalSettings, AuthResponse, VideoParseInfo, SchedulerStatus, LogChunk } from '../types';
 
 const api = axios.create({
   baseURL: '/api/', // Standard API prefix with trailing slash
@@ -55,9 +55,18 @@ export const updateUserPreference = async (uid: string, video_pref: boolean | nu
   return data;
 };
 
+// 用户列表按游标分页，这里逐页取完
 export const getUsers = async (): Promise<User[]> => {
-  const { data } = await api.get<User[]>('users');
-  return data;
+  const users: User[] = [];
+  let cursor: string | null = null;
+  do {
+    const params: Record<string, string | number> = { limit: 500 };
+    if (cursor) params.cursor = cursor;
+    const { data } = await api.get<Page<User>>('users', { params });
+    users.push(...data.items);
+    cursor = data.next_cursor;
+  } while (cursor);
+  return users;
 };
 
 export const downloadUserVideos = async (url: string): Promise<ApiResponse> => {
@@ -105,12 +114,43 @@ export const checkUndownloaded = async (): Promise<ApiResponse> => {
   return data;
 };
 
+export const reconcileDownloads = async (): Promise<ApiResponse> => {
+  const { data } = await api.post<ApiResponse>('tasks/reconcile');
+  return data;
+};
+
 export const parseVideo = async (shareUrl: string): Promise<VideoParseInfo> => {
   const { data } = await api.post<VideoParseInfo>(`parse_video?share_url=${encodeURIComponent(shareUrl)}`);
   return data;
 };
 
-export const getLogs = async (): Promise<{ logs: string[] }> => {
-  const { data } = await api.get<{ logs: string[] }>('logs');
+export const getLogs = async (): Promise<LogChunk> => {
+  const { data } = await api.get<LogChunk>('logs');
   return data;
 };
+
+// 从指定偏移跟踪新增日志，返回取消订阅函数
+export const followLogs = (cursor: { offset: number; file_id: number | null }, onChunk: (chunk: LogChunk) => void): (() => void) => {
+  const params = new URLSearchParams({ offset: String(cursor.offset) });
+  if (cursor.file_id !== null) params.set('file_id', String(cursor.file_id));
+  const source = new EventSource(`/api/logs/stream?${params}`);
+  source.addEventListener('logs', (e) => onChunk(JSON.parse((e as MessageEvent).data)));
+  return () => source.close();
+};
+
+// Server-Sent Events: 推送任务与调度器状态变化，返回取消订阅函数
+export const subscribeEvents = (handlers: {
+  tasks?: (tasks: Task[]) => void;
+  scheduler?: (status: SchedulerStatus) => void;
+}): (() => void) => {
+  const source = new EventSource('/api/events');
+  if (handlers.tasks) {
+    const onTasks = handlers.tasks;
+    source.addEventListener('tasks', (e) => onTasks(JSON.parse((e as MessageEvent).data)));
+  }
+  if (handlers.scheduler) {
+    const onScheduler = handlers.scheduler;
+    source.addEventListener('scheduler', (e) => onScheduler(JSON.parse((e as MessageEvent).data)));
+  }
+  return () => source.close();
+};
@@ -2,6 +2,9 @@ import { useState, useEffect, useRef } from 'react';
 import * as api from '../api';
 import { RefreshCw, Terminal, Search, ArrowDown, Filter } from 'lucide-react';
 
+// 前端保留的最大日志行数
+const MAX_LINES = 1000;
+
 export const Logs = () => {
     const [logs, setLogs] = useState<string[]>([]);
     const [loading, setLoading] = useState(false);
@@ -9,12 +12,18 @@ export const Logs = () => {
     const [logLevel, setLogLevel] = useState('ALL');
     const [autoScroll, setAutoScroll] = useState(true);
     const scrollRef = useRef<HTMLDivElement>(null);
+    const unfollowRef = useRef<(() => void) | null>(null);
 
     const fetchLogs = async () => {
         setLoading(true);
+        unfollowRef.current?.();
         try {
+            // 先读取末尾若干行，再从该位置持续跟踪新增内容
             const data = await api.getLogs();
             setLogs(data.logs);
+            unfollowRef.current = api.followLogs(data, (chunk) => {
+                setLogs(prev => (chunk.reset ? chunk.logs : [...prev, ...chunk.logs]).slice(-MAX_LINES));
+            });
         } catch (err) {
             console.error('Failed to fetch logs:', err);
         } finally {
@@ -24,8 +33,7 @@ export const Logs = () => {
 
     useEffect(() => {
         fetchLogs();
-        const interval = setInterval(fetchLogs, 5000);
-        return () => clearInterval(interval);
+        return () => unfollowRef.current?.();
     }, []);
 
     useEffect(() => {
@@ -4,6 +4,11 @@ import { Settings as SettingsIcon, Save, Lock, ArrowLeft, Loader2, AlertCircle }
 import * as api from '../api';
 import type { GlobalSettings } from '../types';
 
+const PLATFORM_LABELS = [
+    { platform: 'douyin', label: '抖音' },
+    { platform: 'tiktok', label: 'TikTok' },
+];
+
 interface SettingsProps {
     onBack: () => void;
     onNotify: (msg: string, type: 'success' | 'error') => void;
@@ -14,6 +19,8 @@ export const Settings = ({ onBack, onNotify }: SettingsProps) => {
         download_video: true,
         download_note: true,
         auto_update_interval: 120,
+        download_workers: 3,
+        platform_download_workers: { douyin: null, tiktok: null },
     });
     const [loading, setLoading] = useState(true);
     const [saving, setSaving] = useState(false);
@@ -152,6 +159,52 @@ export const Settings = ({ onBack, onNotify }: SettingsProps) => {
                             </div>
                         </div>
 
+                        <div className="flex items-center justify-between">
+                            <div>
+                                <p className="text-white font-medium">下载并发数</p>
+                                <p className="text-white/40 text-sm">同时下载的作品数量，受上游下载接口能力限制</p>
+                            </div>
+                            <div className="flex items-center gap-2">
+                                <input
+                                    type="number"
+                                    min="1"
+                                    max="16"
+                                    value={settings.download_workers}
+                                    onChange={(e) => setSettings(s => ({ ...s, download_workers: parseInt(e.target.value) || 1 }))}
+                                    className="w-24 bg-white/5 border border-white/10 rounded-xl py-2 px-3 outline-none focus:border-primary/50 transition-all text-white text-center text-sm"
+                                />
+                            </div>
+                        </div>
+
+                        {PLATFORM_LABELS.map(({ platform, label }) => (
+                            <div key={platform} className="flex items-center justify-between">
+                                <div>
+                                    <p className="text-white font-medium">{label} 下载并发数</p>
+                                    <p className="text-white/40 text-sm">留空则跟随上方的全局并发数</p>
+                                </div>
+                                <div className="flex items-center gap-2">
+                                    <input
+                                        type="number"
+                                        min="1"
+                                        max="16"
+                                        placeholder="跟随全局"
+                                        value={settings.platform_download_workers?.[platform] ?? ''}
+                                        onChange={(e) => {
+                                            const value = parseInt(e.target.value);
+                                            setSettings(s => ({
+                                                ...s,
+                                                platform_download_workers: {
+                                                    ...s.platform_download_workers,
+                                                    [platform]: Number.isNaN(value) ? null : Math.max(1, value),
+                                                },
+                                            }));
+                                        }}
+                                        className="w-24 bg-white/5 border border-white/10 rounded-xl py-2 px-3 outline-none focus:border-primary/50 transition-all text-white text-center text-sm placeholder:text-white/20"
+                                    />
+                                </div>
+                            </div>
+                        ))}
+
                         <button
                             onClick={handleSaveSettings}
                             disabled={saving}
@@ -1,5 +1,4 @@
 
-import { useState, useEffect, useCallback } from 'react';
 import { motion } from 'framer-motion';
 import { RefreshCw, Play, Clock, Activity, CheckCircle, Loader2 } from 'lucide-react';
 import type { Task, SchedulerStatus, ToastType } from '../types';
@@ -8,33 +7,14 @@ import * as api from '../api';
 interface TasksProps {
     onNotify: (message: string, type?: ToastType) => void;
     activeTasks: Task[];
+    schedulerStatus: SchedulerStatus | null;
 }
 
-export function Tasks({ onNotify, activeTasks }: TasksProps) {
-    const [schedulerStatus, setSchedulerStatus] = useState<SchedulerStatus | null>(null);
-
-    const loadSchedulerStatus = useCallback(async () => {
-        try {
-            const status = await api.getSchedulerStatus();
-            setSchedulerStatus(status);
-        } catch (err) {
-            console.error('Failed to load scheduler status', err);
-        } finally {
-            // Done loading
-        }
-    }, []);
-
-    useEffect(() => {
-        loadSchedulerStatus();
-        const timer = setInterval(loadSchedulerStatus, 5000);
-        return () => clearInterval(timer);
-    }, [loadSchedulerStatus]);
-
+export function Tasks({ onNotify, activeTasks, schedulerStatus }: TasksProps) {
     const handleRunScheduler = async () => {
         try {
             await api.runSchedulerNow();
             onNotify('定时更新任务已手动触发');
-            loadSchedulerStatus();
         } catch (err) {
             onNotify('触发失败', 'error');
         }
@@ -49,6 +29,15 @@ export function Tasks({ onNotify, activeTasks }: TasksProps) {
         }
     };
 
+    const handleReconcile = async () => {
+        try {
+            await api.reconcileDownloads();
+            onNotify('文件对账已启动');
+        } catch (err) {
+            onNotify('对账启动失败', 'error');
+        }
+    };
+
     const formatTime = (ts: number | null) => {
         if (!ts) return '从未执行';
         return new Date(ts * 1000).toLocaleString();
@@ -90,6 +79,15 @@ export function Tasks({ onNotify, activeTasks }: TasksProps) {
                             <span className="text-white/40">下次运行时间</span>
                             <span className="font-medium">{formatTime(schedulerStatus?.next_run || null)}</span>
                         </div>
+                        {schedulerStatus?.last_result && (
+                            <div className="flex justify-between items-center text-sm">
+                                <span className="text-white/40">上次运行结果</span>
+                                <span className="font-medium">
+                                    成功 {schedulerStatus.last_result.succeeded}/{schedulerStatus.last_result.total_users}
+                                    {schedulerStatus.last_result.duration !== null && ` · ${Math.round(schedulerStatus.last_result.duration)}s`}
+                                </span>
+                            </div>
+                        )}
                     </div>
 
                     <button
@@ -126,6 +124,14 @@ export function Tasks({ onNotify, activeTasks }: TasksProps) {
                         <Activity size={18} />
                         开始全局补漏扫描
                     </button>
+
+                    <button
+                        onClick={handleReconcile}
+                        className="w-full flex items-center justify-center gap-2 py-3.5 bg-white/5 hover:bg-white/10 text-white/60 transition-all rounded-2xl font-medium text-sm border border-white/10"
+                    >
+                        <CheckCircle size={18} />
+                        校对本地文件
+                    </button>
                 </div>
             </div>
 
@@ -150,7 +156,7 @@ export function Tasks({ onNotify, activeTasks }: TasksProps) {
                                 <div className="flex justify-between items-start mb-4">
                                     <div>
                                         <div className="flex items-center gap-2">
-                                            <span className="font-semibold">{task.target_id === 'global_check' ? '全局扫描任务' : `同步任务: ${task.target_id}`}</span>
+                                            <span className="font-semibold">{task.target_id === 'global_check' ? '全局扫描任务' : task.target_id === 'reconcile' ? '文件对账任务' : task.target_id === 'search_index' ? '搜索索引重建' : `同步任务: ${task.target_id}`}</span>
                                             <span className="text-[10px] text-white/20 font-mono bg-white/5 px-2 py-0.5 rounded uppercase tracking-tighter">
                                                 {task.id.split('-')[0]}
                                             </span>
@@ -14,10 +14,18 @@ export interface User {
   platform: string;
 }
 
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
 export interface GlobalSettings {
   download_video: boolean;
   download_note: boolean;
   auto_update_interval: number;
+  download_workers: number;
+  // 各平台单独的下载并发数，null 表示跟随全局
+  platform_download_workers: Record<string, number | null>;
 }
 
 export interface AuthResponse {
@@ -46,10 +54,37 @@ export interface Task {
   updated_at: number;
 }
 
+export interface SchedulerUserSummary {
+  uid: string;
+  nickname: string | null;
+  platform: string;
+  status: 'completed' | 'failed';
+  duration: number | null;
+  fetched: number;
+  downloaded: number;
+  error: string | null;
+}
+
+export interface SchedulerRun {
+  started_at: number;
+  finished_at: number | null;
+  duration: number | null;
+  status: 'running' | 'completed' | 'partial' | 'failed';
+  total_users: number;
+  succeeded: number;
+  failed: number;
+  fetched: number;
+  downloaded: number;
+  users: SchedulerUserSummary[];
+  errors: { uid: string | null; error: string }[];
+}
+
 export interface SchedulerStatus {
   last_run: number | null;
   next_run: number | null;
   is_running: boolean;
+  current_run: SchedulerRun | null;
+  last_result: SchedulerRun | null;
 }
 
 export interface VideoParseInfo {
@@ -63,6 +98,13 @@ export interface VideoParseInfo {
   platform: string;
 }
 
+export interface LogChunk {
+  logs: string[];
+  offset: number;
+  file_id: number | null;
+  reset: boolean;
+}
+
 export interface ApiResponse<T = any> {
   success?: boolean;
   started?: boolean;